@@ -1,38 +1,76 @@
 from pathlib import Path
+from legosec import log, metrics
 from legosec.sdk.sdk import SecureChannelSDK
+from legosec.sdk.streams import send_stream, recv_stream, _tls_call
 
 __all__ = [
     "connect_to_kdc",
     "start_peer_listener",
+    "start_async_peer_listener",
     "connect_to_peer",
     "send_message_to_peer",
+    "send_pooled_message_to_peer",
+    "send_stream_to_peer",
+    "receive_stream_from_peer",
     "get_identity_status",
     "list_authorized_peers",
     "add_authorize_peer",
+    "add_authorize_peers",
+    "revoke_authorized_peers",
+    "provision_shared_psks",
+    "configure_logging",
+    "get_metrics",
+    "start_metrics_server",
 ]
 
+_log = log.get_logger("messages")
 
-def connect_to_kdc(client_name="SecureClient", identity_dir="."):
+
+def connect_to_kdc(client_name="SecureClient", identity_dir=".", **options):
     """
     Initialize the SecureChannelSDK and connect to the always-on KDC.
     
+    Args:
+        client_name: Name registered with the KDC
+        identity_dir: Directory for identity files and the cached KDC key
+        options: SecureChannelSDK options, e.g. kdc_endpoints=[(host, port), ...],
+            kdc_key_fingerprint, kdc_connect_timeout
+    
     Returns:
         SecureChannelSDK instance ready for use.
     """
-    sdk = SecureChannelSDK(client_name=client_name, identity_dir=identity_dir)
+    sdk = SecureChannelSDK(client_name=client_name, identity_dir=identity_dir, **options)
     sdk.connect_to_kdc()
     return sdk
 
 
-def start_peer_listener(sdk: SecureChannelSDK, port=6000):
+def start_peer_listener(sdk: SecureChannelSDK, port=6000, **options):
     """
     Start a background listener thread to accept secure connections from peers.
     
     Args:
         sdk: Initialized SecureChannelSDK instance
         port: Port to listen on (default: 6000)
+        options: backlog, workers, max_pending, overload_policy, queue_timeout, idle_timeout
+    
+    Returns:
+        ThreadedPeerListener; stats() gives queued/active/rejected connection gauges
+    """
+    return sdk.listen_for_peers(port=port, **options)
+
+
+def start_async_peer_listener(sdk: SecureChannelSDK, port=6000):
+    """
+    Start an asyncio listener that serves every peer connection as a coroutine.
+    
+    Args:
+        sdk: Initialized SecureChannelSDK instance
+        port: Port to listen on (default: 6000)
+    
+    Returns:
+        AsyncPeerListener; call stop() on it to shut the listener down
     """
-    sdk.listen_for_peers(port=port)
+    return sdk.listen_for_peers_async(port=port)
 
 
 def connect_to_peer(sdk: SecureChannelSDK, peer_id: str, port=6000):
@@ -65,12 +103,80 @@ def send_message_to_peer(conn, message: str):
         message = message.encode()
 
     conn.send(message)
-    response = conn.recv(1024)
-    print(f"[RESPONSE] {response.decode()}")
+    response = _recv_response(conn)
+    _log.debug("Response received (%d bytes)", len(response))
     conn.close()
     return response.decode()
 
 
+def send_pooled_message_to_peer(sdk: SecureChannelSDK, peer_id: str, message: str, port=6000):
+    """
+    Send a message over a pooled connection, keeping it open for the next call.
+    
+    Unlike send_message_to_peer, the connection is not closed afterwards: it
+    goes back to sdk.connection_pool, so repeated messages to the same peer
+    skip the handshake.
+    
+    Args:
+        sdk: Initialized SecureChannelSDK instance
+        peer_id: Identifier of the target peer
+        message: Message string to send
+        port: Port where the peer is listening (default: 6000)
+    
+    Returns:
+        The peer's response (decoded)
+    """
+    response = sdk.send_pooled_message(peer_id, message, port=port)
+    _log.debug("Response received (%d bytes)", len(response), peer=peer_id)
+    return response.decode()
+
+
+def send_stream_to_peer(conn, source, progress=None):
+    """
+    Stream a file, file object, bytes or iterable of chunks to a peer.
+    
+    Data is encrypted and sent chunk by chunk, so memory stays bounded
+    regardless of the payload size. Works over both EncryptedSocket and
+    PSK-secured Connection objects.
+    
+    Args:
+        conn: EncryptedSocket or secure Connection object
+        source: Path, file object, bytes or iterable of bytes chunks
+        progress: Optional callable(bytes_sent, total_bytes, elapsed_seconds)
+    
+    Returns:
+        Transfer summary dict, including the peer's response (decoded)
+    """
+    summary = send_stream(conn, source, progress=progress)
+    response = _recv_response(conn)
+    summary["response"] = response.decode()
+    _log.debug("Response received (%d bytes)", len(response))
+    conn.close()
+    return summary
+
+
+def receive_stream_from_peer(conn, sink, progress=None):
+    """
+    Receive a stream sent with send_stream_to_peer.
+    
+    Args:
+        conn: EncryptedSocket or secure Connection object
+        sink: Path, file object with write(), or callable taking each chunk
+        progress: Optional callable(bytes_received, total_bytes, elapsed_seconds)
+    
+    Returns:
+        Transfer summary dict
+    """
+    return recv_stream(conn, sink, progress=progress)
+
+
+def _recv_response(conn):
+    """Read one response from an EncryptedSocket or PSK-secured Connection"""
+    if hasattr(conn, "recv_message"):
+        return conn.recv_message()
+    return _tls_call(conn, conn.recv, 1024)
+
+
 def get_identity_status(sdk: SecureChannelSDK):
     """
     Check the current identity status (e.g., valid, expired, not registered).
@@ -105,4 +211,92 @@ def add_authorize_peer(sdk: SecureChannelSDK, peer_id: str):
         sdk: Initialized SecureChannelSDK instance
         peer_id: Peer client ID to authorize
     """
-    sdk.identity_manager.authorize_peer(peer_id)
\ No newline at end of file
+    sdk.identity_manager.authorize_peer(peer_id)
+
+
+def add_authorize_peers(sdk: SecureChannelSDK, peer_ids):
+    """
+    Authorize many peer client IDs for this SDK instance in one transaction.
+    
+    Args:
+        sdk: Initialized SecureChannelSDK instance
+        peer_ids: Iterable of peer client IDs to authorize
+        
+    Returns:
+        Number of peers that were newly authorized
+    """
+    return sdk.identity_manager.authorize_peers(peer_ids)
+
+
+def revoke_authorized_peers(sdk: SecureChannelSDK, peer_ids):
+    """
+    Revoke authorization for many peer client IDs in one transaction.
+    
+    Args:
+        sdk: Initialized SecureChannelSDK instance
+        peer_ids: Iterable of peer client IDs to revoke
+        
+    Returns:
+        Number of peers that were removed
+    """
+    return sdk.identity_manager.revoke_peers(peer_ids)
+
+
+def provision_shared_psks(sdk: SecureChannelSDK, peer_ids, chunk_size=None):
+    """
+    Generate and store shared PSKs for many peers in one transaction.
+    
+    Args:
+        sdk: Initialized SecureChannelSDK instance
+        peer_ids: Iterable of peer client IDs
+        chunk_size: Optional number of peers written per transaction
+        
+    Returns:
+        Mapping of peer client ID to its shared PSK
+    """
+    return sdk.generate_and_distribute_shared_psks(peer_ids, chunk_size=chunk_size)
+
+
+def configure_logging(level=None, debug_subsystems=None, debug_peers=None, **sampling):
+    """
+    Adjust legosec logging; see legosec.log for the subsystems.
+    
+    Args:
+        level: Level for the whole package, e.g. "WARNING"
+        debug_subsystems: Subsystems logged at DEBUG regardless of level, e.g. ["handshake"]
+        debug_peers: Client ID prefixes whose connections are logged at DEBUG
+        sampling: sample_burst, sample_interval, sample_every for per-message events
+    """
+    log.configure(level=level, debug_subsystems=debug_subsystems, debug_peers=debug_peers, **sampling)
+
+
+def get_metrics(format="dict"):
+    """
+    Read the in-process metrics: handshake latency by mode, fallbacks, messages
+    and bytes per direction, active sessions, SQLite latency and cache hit rates.
+    
+    Args:
+        format: "dict" for a snapshot dict, "prometheus" for the Prometheus text format
+    
+    Returns:
+        Snapshot dict or Prometheus text
+    """
+    if format == "prometheus":
+        return metrics.prometheus_text()
+    if format != "dict":
+        raise ValueError(f"Unknown metrics format: {format}")
+    return metrics.snapshot()
+
+
+def start_metrics_server(port=9464, host="127.0.0.1"):
+    """
+    Serve the metrics in the Prometheus text format at http://host:port/metrics.
+    
+    Args:
+        port: Port to listen on (default: 9464, 0 picks a free port)
+        host: Interface to bind (default: localhost only)
+    
+    Returns:
+        The HTTP server; call shutdown() on it to stop serving
+    """
+    return metrics.start_http_server(port=port, host=host)
@@ -0,0 +1,104 @@
+"""Messages/sec of EncryptedSocket against the previous per-message AES-CFB path
+
+Run with ``python -m legosec.benchmarks.encrypted_socket``.
+"""
+import argparse
+import os
+import socket
+import threading
+import time
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.backends import default_backend
+from legosec.sdk.sdk import EncryptedSocket
+
+PAYLOAD_SIZES = [64, 256, 1024, 4096]
+
+
+class LegacyCFBSocket:
+    """The pre-record-layer send path: fresh cipher, urandom IV and joined bytes per message"""
+
+    def __init__(self, sock, session_key):
+        self.socket = sock
+        self.session_key = session_key
+
+    def send(self, data):
+        iv = os.urandom(16)
+        cipher = Cipher(algorithms.AES(self.session_key), modes.CFB(iv), backend=default_backend())
+        encryptor = cipher.encryptor()
+        self.socket.sendall(iv + encryptor.update(data) + encryptor.finalize())
+
+
+def _drain(sock, total_bytes):
+    received = 0
+    buffer = bytearray(256 * 1024)
+    while received < total_bytes:
+        count = sock.recv_into(buffer)
+        if not count:
+            break
+        received += count
+
+
+def _drain_records(sock, key, count):
+    receiver = EncryptedSocket(sock, key, initiator=False)
+    for _ in range(count):
+        receiver.recv_message()
+
+
+def bench_legacy(size, count):
+    key = os.urandom(32)
+    left, right = socket.socketpair()
+    payload = os.urandom(size)
+    reader = threading.Thread(target=_drain, args=(right, count * (size + 16)))
+    reader.start()
+    sender = LegacyCFBSocket(left, key)
+    start = time.perf_counter()
+    for _ in range(count):
+        sender.send(payload)
+    reader.join()
+    elapsed = time.perf_counter() - start
+    left.close()
+    right.close()
+    return count / elapsed
+
+
+def bench_records(size, count):
+    key = os.urandom(32)
+    left, right = socket.socketpair()
+    payload = os.urandom(size)
+    reader = threading.Thread(target=_drain_records, args=(right, key, count))
+    reader.start()
+    sender = EncryptedSocket(left, key, initiator=True)
+    start = time.perf_counter()
+    for _ in range(count):
+        sender.send(payload)
+    reader.join()
+    elapsed = time.perf_counter() - start
+    left.close()
+    right.close()
+    return count / elapsed
+
+
+def run(count=20000, sizes=PAYLOAD_SIZES):
+    """Return {size: {"legacy": msgs_per_sec, "records": msgs_per_sec}}"""
+    results = {}
+    for size in sizes:
+        results[size] = {
+            "legacy": bench_legacy(size, count),
+            "records": bench_records(size, count),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=20000, help="messages per payload size")
+    args = parser.parse_args()
+
+    print(f"{'payload':>8} {'legacy msg/s':>14} {'records msg/s':>14} {'speedup':>8}")
+    for size, result in run(args.count).items():
+        speedup = result["records"] / result["legacy"]
+        print(f"{size:>7}B {result['legacy']:>14,.0f} {result['records']:>14,.0f} {speedup:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""p50/p99 ECDH handshake latency with inline key generation against the key pool
+
+Run with ``python -m legosec.benchmarks.handshake``.
+"""
+import argparse
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.backends import default_backend
+from legosec.sdk.keypool import EphemeralKeyPool, generate_ephemeral_key
+
+PEM_END = b"-----END PUBLIC KEY-----\n"
+
+
+def _read_pem(sock):
+    data = b""
+    while not data.endswith(PEM_END):
+        chunk = sock.recv(4096)
+        if not chunk:
+            raise ConnectionError("Peer closed during handshake")
+        data += chunk
+    return data
+
+
+def _session_key(private_key, peer_pem):
+    peer_pubkey = serialization.load_pem_public_key(peer_pem)
+    return HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=None,
+        info=b'ecdh-session-key',
+        backend=default_backend()
+    ).derive(private_key.exchange(ec.ECDH(), peer_pubkey))
+
+
+def _respond(sock, take_key):
+    private_key, our_pem, _ = take_key()
+    peer_pem = _read_pem(sock)
+    sock.sendall(our_pem)
+    _session_key(private_key, peer_pem)
+    sock.close()
+
+
+def handshake(take_key, responder_pool):
+    """One initiator/responder exchange over a socketpair; returns the initiator's latency"""
+    left, right = socket.socketpair()
+    responder = responder_pool.submit(_respond, right, take_key)
+    start = time.perf_counter()
+    private_key, our_pem, _ = take_key()
+    left.sendall(our_pem)
+    _session_key(private_key, _read_pem(left))
+    elapsed = time.perf_counter() - start
+    responder.result()
+    left.close()
+    return elapsed
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def bench(take_key, count, concurrency, idle=0.0):
+    """Run count handshakes in bursts of concurrency connects; returns (p50, p99) in seconds
+
+    ``idle`` seconds between bursts give the key pool time to refill, as it
+    would between bursts on a real listener.
+    """
+    samples = []
+    with ThreadPoolExecutor(concurrency) as responders, ThreadPoolExecutor(concurrency) as initiators:
+        for offset in range(0, count, concurrency):
+            burst = min(concurrency, count - offset)
+            samples.extend(initiators.map(lambda _: handshake(take_key, responders), range(burst)))
+            if idle:
+                time.sleep(idle)
+    return _percentile(samples, 0.5), _percentile(samples, 0.99)
+
+
+def run(count=400, concurrency=8, depth=64, low_water=16, idle=0.0):
+    """Return {"inline": (p50, p99), "pool": (p50, p99), "pool_hit_ratio": ratio}"""
+    results = {"inline": bench(generate_ephemeral_key, count, concurrency, idle)}
+    pool = EphemeralKeyPool(depth=depth, low_water=low_water)
+    pool.wait_ready()
+    try:
+        results["pool"] = bench(pool.take, count, concurrency, idle)
+        results["pool_hit_ratio"] = pool.snapshot()["hit_ratio"]
+    finally:
+        pool.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=400, help="handshakes per mode")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent connects")
+    parser.add_argument("--depth", type=int, default=64, help="key pool depth")
+    parser.add_argument("--idle", type=float, default=0.0, help="seconds between connect bursts")
+    args = parser.parse_args()
+
+    results = run(args.count, args.concurrency, args.depth, max(1, args.depth // 4), args.idle)
+    print(f"{'mode':>8} {'p50 ms':>10} {'p99 ms':>10}")
+    for mode in ("inline", "pool"):
+        p50, p99 = results[mode]
+        print(f"{mode:>8} {p50 * 1000:>10.2f} {p99 * 1000:>10.2f}")
+    print(f"pool hit ratio: {results['pool_hit_ratio']:.0%}")
+
+
+if __name__ == "__main__":
+    main()
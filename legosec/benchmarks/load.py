@@ -0,0 +1,453 @@
+"""Multi-peer load and soak harness for listen_for_peers
+
+Starts one listen_for_peers node and ``--clients`` client SDKs sharing a
+temporary database, every client authorized on the listener and holding a
+shared PSK with it, then drives one workload:
+
+- churn: connect, send one message, close, repeat
+- chatty: one long-lived connection per client, messages back to back
+- mixed: churn where ``--psk-ratio`` of the connections take the PSK
+  fallback path instead of ECDH
+
+Clients run as threads in this process or, with ``--processes``, spread
+over local worker processes so that the listener process is measured on
+its own. Every ``--interval`` seconds a row reports handshakes and
+messages per second, message RTT percentiles, the error rate and the
+listener process's threads, open file descriptors and RSS.
+
+``--soak`` is for runs of hours: threads, file descriptors and RSS are
+compared between the end of ``--warmup`` and the end of the run, and
+growth beyond the ``--leak-*`` tolerances is flagged as a leak and makes
+the exit status 1. Run with ``python -m legosec.benchmarks.load``.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from legosec import log, metrics
+from legosec.benchmarks.suite import create_kdc_tables
+from legosec.sdk.sdk import SecureChannelSDK
+from legosec.sdk.streams import _tls_call, _tls_sendall
+from legosec.storage.database import get_database
+
+WORKLOADS = ("churn", "chatty", "mixed")
+HANDSHAKE_MODES = ("ecdh", "resume", "psk")
+
+
+def _duration(text):
+    """Seconds from "90", "90s", "15m" or "2h" """
+    units = {"s": 1, "m": 60, "h": 3600}
+    if text and text[-1] in units:
+        return float(text[:-1]) * units[text[-1]]
+    return float(text)
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Window:
+    """What the clients of one process did since the last drain()"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.handshakes = 0
+        self.messages = 0
+        self.errors = 0
+        self.handshake_seconds = []
+        self.rtts = []
+
+    def handshake(self, seconds):
+        with self._lock:
+            self.handshakes += 1
+            self.handshake_seconds.append(seconds)
+
+    def message(self, seconds):
+        with self._lock:
+            self.messages += 1
+            self.rtts.append(seconds)
+
+    def error(self):
+        with self._lock:
+            self.errors += 1
+
+    def drain(self):
+        with self._lock:
+            counts = {"handshakes": self.handshakes, "messages": self.messages, "errors": self.errors,
+                      "handshake_seconds": self.handshake_seconds, "rtts": self.rtts}
+            self._reset()
+        return counts
+
+
+def _merge(counts, more):
+    for key, value in more.items():
+        counts[key] = counts.get(key, 0 if isinstance(value, int) else []) + value
+    return counts
+
+
+def resources():
+    """Threads, open file descriptors and resident set size (MB) of this process"""
+    fds = len(os.listdir("/proc/self/fd")) if os.path.isdir("/proc/self/fd") else None
+    try:
+        with open("/proc/self/statm") as f:
+            rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # Peak rather than current RSS, in KiB on Linux and bytes on macOS
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    return {"threads": threading.active_count(), "fds": fds, "rss_mb": rss / 1e6}
+
+
+def _exchange(conn, payload):
+    if hasattr(conn, "recv_message"):
+        conn.send(payload)
+        response = conn.recv_message()
+    else:
+        _tls_sendall(conn, payload)
+        response = _tls_call(conn, conn.recv, 4096)
+    if not response:
+        raise ConnectionError("Listener closed the connection before responding")
+
+
+def _close(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+def _client_loop(sdk, config, window, stop):
+    """One simulated client: runs the workload until stop is set"""
+    rng = random.Random()
+    payload = os.urandom(config["message_size"])
+    listener_id, port = config["listener_id"], config["port"]
+    conn = None
+    while not stop.is_set():
+        try:
+            if conn is None:
+                start = time.perf_counter()
+                if config["workload"] == "mixed" and rng.random() < config["psk_ratio"]:
+                    conn = sdk._connect_with_psk(listener_id, "127.0.0.1", port)
+                else:
+                    conn = sdk.connect_to_peer(listener_id, port=port, max_attempts=1, timeout=10)
+                window.handshake(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            _exchange(conn, payload)
+            window.message(time.perf_counter() - start)
+
+            if config["workload"] != "chatty":
+                _close(conn)
+                conn = None
+            if config["think_time"]:
+                stop.wait(config["think_time"])
+        except Exception:
+            window.error()
+            if conn is not None:
+                _close(conn)
+                conn = None
+            # Do not spin on a listener that keeps failing
+            stop.wait(0.05)
+    if conn is not None:
+        _close(conn)
+
+
+def make_client(client_id, config):
+    sdk = SecureChannelSDK(
+        client_name="load-client", client_id=client_id, identity_dir=config["identity_dir"],
+        db_path=config["db_path"], session_ticket_lifetime=0 if config["no_resume"] else 3600
+    )
+    sdk.identity_manager.authorize_peer(config["listener_id"])
+    return sdk
+
+
+def _run_clients(client_ids, config, window, stop):
+    """Start the clients' threads; returns (sdks, threads)"""
+    sdks = [make_client(client_id, config) for client_id in client_ids]
+    threads = [
+        threading.Thread(target=_client_loop, args=(sdk, config, window, stop), name=f"load-{sdk.client_id}",
+                         daemon=True)
+        for sdk in sdks
+    ]
+    return sdks, threads
+
+
+def _stop_clients(sdks, threads):
+    for thread in threads:
+        thread.join(15)
+    for sdk in sdks:
+        sdk.close()
+
+
+def _client_process(client_ids, config, results, ready, start, stop):
+    """Worker process: runs its share of the clients and sends its counts to the parent"""
+    log.configure(level=config["log_level"])
+    window = Window()
+    thread_stop = threading.Event()
+    sdks, threads = _run_clients(client_ids, config, window, thread_stop)
+    ready.release()
+    start.wait()
+    for thread in threads:
+        thread.start()
+    while not stop.wait(min(0.5, config["interval"] / 4)):
+        results.put(window.drain())
+    thread_stop.set()
+    _stop_clients(sdks, threads)
+    results.put(window.drain())
+
+
+def _responder_handshakes(snapshot):
+    """Listener-side handshakes so far by mode and result"""
+    counts = {}
+    for sample in snapshot.get("legosec_handshakes_total", {"samples": []})["samples"]:
+        labels = sample["labels"]
+        if labels["side"] == "responder":
+            key = labels["mode"] if labels["result"] == "ok" else "failed"
+            counts[key] = counts.get(key, 0) + sample["value"]
+    return counts
+
+
+def _row(elapsed, seconds, counts, handshakes, usage, listener_stats):
+    attempts = counts.get("messages", 0) + counts.get("errors", 0)
+    rtts = counts.get("rtts", [])
+    return {
+        "elapsed": elapsed,
+        "handshakes_per_sec": counts.get("handshakes", 0) / seconds,
+        "messages_per_sec": counts.get("messages", 0) / seconds,
+        "rtt_p50": _percentile(rtts, 0.5) if rtts else None,
+        "rtt_p99": _percentile(rtts, 0.99) if rtts else None,
+        "handshake_p99": _percentile(counts["handshake_seconds"], 0.99) if counts.get("handshake_seconds") else None,
+        "errors": counts.get("errors", 0),
+        "error_rate": counts.get("errors", 0) / attempts if attempts else 0.0,
+        "listener_handshakes": handshakes,
+        "active": listener_stats.get("active"),
+        "parked": listener_stats.get("parked"),
+        "rejected": listener_stats.get("rejected"),
+        **usage,
+    }
+
+
+def _ms(value):
+    return f"{value * 1000:.2f}" if value is not None else "-"
+
+
+HEADER = (f"{'time s':>8} {'hs/s':>8} {'msg/s':>9} {'rtt p50':>8} {'rtt p99':>8} {'err %':>6} "
+          f"{'ecdh':>6} {'resume':>6} {'psk':>6} {'threads':>7} {'fds':>5} {'rss MB':>7} {'active':>6} {'parked':>6}")
+
+
+def _print_row(row):
+    handshakes = row["listener_handshakes"]
+    print(f"{row['elapsed']:>8.0f} {row['handshakes_per_sec']:>8.0f} {row['messages_per_sec']:>9.0f} "
+          f"{_ms(row['rtt_p50']):>8} {_ms(row['rtt_p99']):>8} {row['error_rate'] * 100:>6.2f} "
+          + " ".join(f"{handshakes.get(mode, 0):>6}" for mode in HANDSHAKE_MODES)
+          + f" {row['threads']:>7} {row['fds'] if row['fds'] is not None else '-':>5} {row['rss_mb']:>7.1f} "
+          f"{row['active'] if row['active'] is not None else '-':>6} "
+          f"{row['parked'] if row['parked'] is not None else '-':>6}", flush=True)
+
+
+def find_leaks(rows, warmup, tolerances=None, idle=None):
+    """Compare resources after warmup with the end of the run; returns {resource: (before, after)}
+
+    Each side is the median of three samples, so one noisy interval does
+    not count as growth. Samples under load are compared with each other,
+    since open sessions and the listener's workers hold threads and file
+    descriptors while clients are connected. ``idle`` is the pair of
+    samples taken before and after the run; every thread the run started
+    must be gone afterwards, reported as "idle_threads".
+    """
+    tolerances = tolerances or {"threads": 4, "fds": 16, "rss_mb": 64.0}
+    steady = [row for row in rows if row["elapsed"] >= warmup]
+    leaks = {}
+    if len(steady) >= 2:
+        for key, tolerance in tolerances.items():
+            values = [row[key] for row in steady if row[key] is not None]
+            if len(values) < 2:
+                continue
+            before = _percentile(values[:3], 0.5)
+            after = _percentile(values[-3:], 0.5)
+            if after - before > tolerance:
+                leaks[key] = (before, after)
+    if idle is not None:
+        before, after = idle[0]["threads"], idle[1]["threads"]
+        if after - before > tolerances.get("threads", 0):
+            leaks["idle_threads"] = (before, after)
+    return leaks
+
+
+def run(clients=16, workload="churn", duration=30.0, interval=5.0, processes=0, psk_ratio=0.2,
+        message_size=256, think_time=0.0, no_resume=False, workers=32, max_pending=128,
+        overload_policy="queue", soak=False, warmup=None, tolerances=None, log_level="WARNING", output=None):
+    """Run one workload; returns {"config", "rows", "idle_before", "idle_after", "leaks"}
+
+    ``output`` is called with each report row as it is taken.
+    """
+    if workload not in WORKLOADS:
+        raise ValueError(f"Unknown workload: {workload}")
+    previous_level = logging.getLogger(log.ROOT).level
+    log.configure(level=log_level)
+    tmp_dir = tempfile.mkdtemp()
+    db_path = os.path.join(tmp_dir, "kdc_database.db")
+    create_kdc_tables(db_path)
+
+    listener_sdk = SecureChannelSDK(client_name="load-listener", identity_dir=tmp_dir, db_path=db_path)
+    client_ids = [f"client_{os.urandom(4).hex()}" for _ in range(clients)]
+    listener_sdk.identity_manager.authorize_peers(client_ids)
+    listener_sdk.generate_and_distribute_shared_psks(client_ids)
+    listener = listener_sdk.listen_for_peers(
+        port=0, workers=workers, max_pending=max_pending, overload_policy=overload_policy
+    )
+    config = {
+        "workload": workload, "listener_id": listener_sdk.client_id, "port": listener.port,
+        "identity_dir": tmp_dir, "db_path": db_path, "psk_ratio": psk_ratio, "message_size": message_size,
+        "think_time": think_time, "no_resume": no_resume, "interval": interval, "log_level": log_level,
+    }
+
+    window = Window()
+    stop = threading.Event()
+    sdks, threads, children = [], [], []
+    if processes:
+        context = multiprocessing.get_context("spawn")
+        results, ready, start, child_stop = context.Queue(), context.Semaphore(0), context.Event(), context.Event()
+        for index in range(processes):
+            share = client_ids[index::processes]
+            if share:
+                child = context.Process(target=_client_process, args=(share, config, results, ready, start, child_stop))
+                child.start()
+                children.append(child)
+        for _ in children:
+            ready.acquire()
+    else:
+        sdks, threads = _run_clients(client_ids, config, window, stop)
+
+    def collect():
+        counts = window.drain()
+        if children:
+            while True:
+                try:
+                    _merge(counts, results.get_nowait())
+                except queue.Empty:
+                    break
+        return counts
+
+    rows = []
+    idle_before = resources()
+    handshakes_before = _responder_handshakes(metrics.snapshot())
+    began = last = time.monotonic()
+    if children:
+        start.set()
+    for thread in threads:
+        thread.start()
+    try:
+        while True:
+            remaining = began + duration - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(interval, remaining))
+            now = time.monotonic()
+            handshakes = _responder_handshakes(metrics.snapshot())
+            row = _row(now - began, now - last, collect(),
+                       {mode: handshakes.get(mode, 0) - handshakes_before.get(mode, 0) for mode in handshakes},
+                       resources(), listener.stats())
+            handshakes_before, last = handshakes, now
+            rows.append(row)
+            if output:
+                output(row)
+    finally:
+        stop.set()
+        if children:
+            child_stop.set()
+            # A child only exits once the parent has read what it queued
+            deadline = time.monotonic() + 30
+            while any(child.is_alive() for child in children) and time.monotonic() < deadline:
+                collect()
+                time.sleep(0.1)
+            collect()
+        _stop_clients(sdks, threads)
+
+        # Give the listener time to notice the closed sessions before the idle sample
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            stats = listener.stats()
+            if not stats.get("active") and not stats.get("parked") and not stats.get("queued"):
+                break
+            time.sleep(0.1)
+        idle_after = resources()
+        listener_sdk.close()
+        get_database(db_path, ensure_schema=False).close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        log.configure(level=previous_level)
+
+    leaks = {}
+    if soak:
+        warmup = duration / 10 if warmup is None else warmup
+        leaks = find_leaks(rows, warmup, tolerances, idle=(idle_before, idle_after))
+    return {"config": dict(config, clients=clients, processes=processes, duration=duration),
+            "rows": rows, "idle_before": idle_before, "idle_after": idle_after, "leaks": leaks}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=16, help="simulated client SDKs")
+    parser.add_argument("--workload", choices=WORKLOADS, default="churn")
+    parser.add_argument("--duration", type=_duration, default=30.0, help="run time, e.g. 90, 15m or 4h")
+    parser.add_argument("--interval", type=_duration, default=5.0, help="seconds between report rows")
+    parser.add_argument("--processes", type=int, default=0,
+                        help="spread the clients over this many worker processes (default: in-process threads)")
+    parser.add_argument("--psk-ratio", type=float, default=0.2, help="share of mixed connections made over PSK")
+    parser.add_argument("--message-size", type=int, default=256, help="payload bytes per message")
+    parser.add_argument("--think-time", type=float, default=0.0, help="seconds each client waits between messages")
+    parser.add_argument("--no-resume", action="store_true", help="full ECDH handshake on every churn connect")
+    parser.add_argument("--workers", type=int, default=32, help="listener worker threads")
+    parser.add_argument("--max-pending", type=int, default=128, help="listener queue depth")
+    parser.add_argument("--overload-policy", choices=("queue", "reject"), default="queue")
+    parser.add_argument("--soak", action="store_true", help="check threads, fds and RSS for leaks")
+    parser.add_argument("--warmup", type=_duration, help="seconds before the leak baseline (default: a tenth of the run)")
+    parser.add_argument("--leak-threads", type=int, default=4, help="tolerated thread growth")
+    parser.add_argument("--leak-fds", type=int, default=16, help="tolerated open fd growth")
+    parser.add_argument("--leak-rss-mb", type=float, default=64.0, help="tolerated RSS growth in MB")
+    parser.add_argument("--log-level", default="WARNING", help="legosec log level during the run")
+    parser.add_argument("--json", metavar="PATH", help="write the report rows and leak check as JSON")
+    args = parser.parse_args()
+
+    print(HEADER, flush=True)
+    report = run(
+        clients=args.clients, workload=args.workload, duration=args.duration, interval=args.interval,
+        processes=args.processes, psk_ratio=args.psk_ratio, message_size=args.message_size,
+        think_time=args.think_time, no_resume=args.no_resume, workers=args.workers,
+        max_pending=args.max_pending, overload_policy=args.overload_policy, soak=args.soak, warmup=args.warmup,
+        tolerances={"threads": args.leak_threads, "fds": args.leak_fds, "rss_mb": args.leak_rss_mb},
+        log_level=args.log_level, output=_print_row
+    )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    rows = report["rows"]
+    if rows:
+        handshakes = sum(row["handshakes_per_sec"] for row in rows) / len(rows)
+        messages = sum(row["messages_per_sec"] for row in rows) / len(rows)
+        errors = sum(row["errors"] for row in rows)
+        print(f"mean {handshakes:,.0f} handshakes/s, {messages:,.0f} messages/s, {errors} errors")
+    print(f"idle before: {report['idle_before']}")
+    print(f"idle after:  {report['idle_after']}")
+    if args.soak:
+        for key, (before, after) in report["leaks"].items():
+            print(f"LEAK {key}: {before} -> {after}")
+        print(f"{len(report['leaks'])} leak(s) flagged")
+        sys.exit(1 if report["leaks"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Cold SecureChannelSDK construction time, eager against lazy
+
+Every sample builds an SDK in a fresh identity directory with its own
+database, as a short-lived worker would. Run with
+``python -m legosec.benchmarks.startup``.
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+from legosec.sdk.sdk import SecureChannelSDK
+
+
+def construct(lazy):
+    """Build and close one SDK; returns (seconds to construct, threads started, log rows, database created)"""
+    tmp_dir = tempfile.mkdtemp()
+    db_path = os.path.join(tmp_dir, "kdc_database.db")
+    try:
+        threads = threading.active_count()
+        # Keep whatever the SDK logs to stdout out of the timing and the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            sdk = SecureChannelSDK(client_name="bench", identity_dir=tmp_dir, db_path=db_path, lazy=lazy)
+            elapsed = time.perf_counter() - start
+            threads = threading.active_count() - threads
+            rows = sdk._log_sink.stats["submitted"] + sdk._notification_sink.stats["submitted"]
+            sdk.close()
+        return elapsed, threads, rows, os.path.exists(db_path)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run(count=50):
+    """Return {"eager": {...}, "lazy": {...}}: p50/p99 seconds, threads, log rows, database created"""
+    results = {}
+    for mode in ("eager", "lazy"):
+        samples = [construct(mode == "lazy") for _ in range(count)]
+        seconds = [sample[0] for sample in samples]
+        results[mode] = {
+            "p50": _percentile(seconds, 0.5),
+            "p99": _percentile(seconds, 0.99),
+            "threads": max(sample[1] for sample in samples),
+            "rows": max(sample[2] for sample in samples),
+            "db": any(sample[3] for sample in samples),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=50, help="constructions per mode")
+    args = parser.parse_args()
+
+    results = run(args.count)
+    print(f"{'mode':>6} {'p50 ms':>10} {'p99 ms':>10} {'threads':>8} {'log rows':>9} {'db file':>8}")
+    for mode, result in results.items():
+        print(f"{mode:>6} {result['p50'] * 1000:>10.2f} {result['p99'] * 1000:>10.2f} "
+              f"{result['threads']:>8} {result['rows']:>9} {'yes' if result['db'] else 'no':>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,469 @@
+"""Local micro-benchmark suite for the crypto, handshake and storage paths
+
+Everything runs in-process against loopback sockets and temporary
+databases; a stub KDC stands in for the real one. Results can be saved as
+JSON and compared against a saved baseline, so a dependency or Python
+upgrade can be checked for regressions first::
+
+    python -m legosec.benchmarks.suite --save baseline.json
+    python -m legosec.benchmarks.suite --compare baseline.json
+
+``--compare`` exits with status 1 when a metric got worse than the
+baseline by more than ``--threshold``. Metrics ending in ``_per_sec`` are
+better when higher; the others are seconds and better when lower.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.backends import default_backend
+from legosec.benchmarks.encrypted_socket import bench_records
+from legosec.identity.identity import IdentityManager
+from legosec.sdk import tlspsk, wire
+from legosec.sdk.keypool import EphemeralKeyPool, generate_ephemeral_key
+from legosec.sdk.listener import ThreadedPeerListener
+from legosec.sdk.resumption import SessionTicketStore
+from legosec.sdk.sdk import SecureChannelSDK
+from legosec.sdk.sinks import ActivityLogSink
+from legosec.storage.database import get_database
+
+RECORD_SIZES = (64, 1024, 16384, 65536)
+PEER_COUNTS = (10, 1000, 100000)
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _latency(samples):
+    return {"p50": _percentile(samples, 0.5), "p99": _percentile(samples, 0.99)}
+
+
+@contextlib.contextmanager
+def _tmp_db():
+    tmp_dir = tempfile.mkdtemp()
+    db_path = os.path.join(tmp_dir, "kdc_database.db")
+    try:
+        yield tmp_dir, db_path
+    finally:
+        get_database(db_path, ensure_schema=False).close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+# Tables the SDK's sinks write to but the KDC owns
+KDC_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS client_logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        client_id TEXT, log_type TEXT, message TEXT, metadata TEXT,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS notifications (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        client_id TEXT, message TEXT, notification_type TEXT, action_url TEXT,
+        count INTEGER NOT NULL DEFAULT 1,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+]
+
+
+def create_kdc_tables(db_path):
+    """Create the KDC-owned tables in a benchmark database, as the KDC would"""
+    db = get_database(db_path)
+    for statement in KDC_TABLES:
+        db.execute(statement)
+
+
+class StubKDC:
+    """Speaks the KDC side of connect_to_kdc on a loopback port
+
+    Sends its public key, decrypts the client's parameter and answers with
+    its own, encrypted under the key the client derives from that parameter.
+    """
+
+    def __init__(self):
+        self.key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.pem = self.key.public_key().public_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+        self.server = socket.create_server(("127.0.0.1", 0))
+        self.endpoint = self.server.getsockname()
+        self.thread = threading.Thread(target=self._serve, name="stub-kdc", daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            with conn:
+                try:
+                    self._exchange(conn)
+                except (OSError, ValueError):
+                    pass
+
+    def _exchange(self, conn):
+        conn.sendall(self.pem)
+        encrypted_param = b""
+        while len(encrypted_param) < 256:
+            chunk = conn.recv(256 - len(encrypted_param))
+            if not chunk:
+                return
+            encrypted_param += chunk
+        client_param = self.key.decrypt(encrypted_param, padding.OAEP(
+            mgf=padding.MGF1(algorithm=hashes.SHA256()), algorithm=hashes.SHA256(), label=None
+        ))
+        key = HKDF(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=None,
+            info=b'secure-channel-key',
+            backend=default_backend()
+        ).derive(client_param)
+        iv = os.urandom(16)
+        encryptor = Cipher(algorithms.AES(key), modes.CFB(iv), backend=default_backend()).encryptor()
+        conn.sendall(iv + encryptor.update(os.urandom(32)) + encryptor.finalize())
+
+    def close(self):
+        # Closing alone does not wake a thread blocked in accept()
+        try:
+            self.server.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.server.close()
+        self.thread.join()
+
+
+class _PeerSDK:
+    """The SDK surface both ECDH sides use, without identity files or a KDC"""
+    _CONNECTION_HANDLERS = SecureChannelSDK._CONNECTION_HANDLERS
+    _handle_incoming_connection = SecureChannelSDK._handle_incoming_connection
+    _handle_ecdh_v2_connection = SecureChannelSDK._handle_ecdh_v2_connection
+    _ecdh_v2_respond = SecureChannelSDK._ecdh_v2_respond
+    _ecdh_initiate_v2 = SecureChannelSDK._ecdh_initiate_v2
+    _handle_secure_connection = SecureChannelSDK._handle_secure_connection
+    _serve_secure_messages = SecureChannelSDK._serve_secure_messages
+    _close_secure_session = SecureChannelSDK._close_secure_session
+    _peer_message_response = SecureChannelSDK._peer_message_response
+    _derive_symmetric_key = SecureChannelSDK._derive_symmetric_key
+    _log_activity = SecureChannelSDK._log_activity
+
+    def __init__(self, client_id, db_path=None):
+        self.client_id = client_id
+        self.session_keys = {}
+        if db_path is not None:
+            self.session_tickets = SessionTicketStore(get_database(db_path), client_id)
+        self.ecdh_key_pool = EphemeralKeyPool()
+        self.identity_manager = self
+
+    def is_peer_authorized(self, peer_id):
+        return peer_id == "bench-client"
+
+    def _handle_psk_connection(self, conn, park=None):
+        conn.close()
+
+    def _send_notification(self, *args):
+        pass
+
+    def _update_peer_status(self, ready=True):
+        pass
+
+
+def bench_records_throughput(count):
+    """EncryptedSocket messages and megabytes per second across payload sizes"""
+    results = {}
+    for size in RECORD_SIZES:
+        # Fewer of the records above 1 KiB, so the large sizes move a similar amount of data
+        rate = bench_records(size, max(100, count * 1024 // max(1024, size)))
+        results[f"records.{size}"] = {"msgs_per_sec": rate, "mb_per_sec": rate * size / 1e6}
+    return results
+
+
+def bench_ecdh_handshake(count):
+    """Initiator latency of a v2 ECDH handshake against the threaded listener"""
+    with _tmp_db() as (_, db_path):
+        listener_sdk = _PeerSDK("bench-listener", db_path)
+        client = _PeerSDK("bench-client", db_path)
+        listener = ThreadedPeerListener(listener_sdk, port=0, host="127.0.0.1", workers=4).start()
+        samples = []
+        try:
+            for _ in range(count):
+                start = time.perf_counter()
+                sock = socket.create_connection(("127.0.0.1", listener.port), timeout=10)
+                client._ecdh_initiate_v2(sock)
+                samples.append(time.perf_counter() - start)
+                sock.close()
+        finally:
+            listener.stop()
+            listener_sdk.ecdh_key_pool.close()
+            client.ecdh_key_pool.close()
+    return {"handshake.ecdh": _latency(samples)}
+
+
+def bench_psk_handshake(count):
+    """Client latency of a TLS-PSK handshake over a socketpair with shared contexts"""
+    from OpenSSL.SSL import Connection
+
+    # The PSK the two peers share, whichever side looks it up
+    psk = os.urandom(32)
+
+    def lookup_psk(peer_id):
+        return psk
+
+    def verify_peer(conn, identity):
+        conn.set_app_data(identity.decode())
+        return psk
+
+    server_side = tlspsk.PSKContexts("bench-listener", lookup_psk, verify_peer)
+    client_side = tlspsk.PSKContexts("bench-client", lookup_psk, verify_peer)
+    try:
+        server_side.server()
+        client_side.client()
+    except AttributeError as e:
+        # pyOpenSSL without the PSK callbacks
+        return {"handshake.tls_psk": {"skipped": str(e)[:80]}}
+
+    samples = []
+    with ThreadPoolExecutor(1) as responder:
+        for _ in range(count):
+            left, right = socket.socketpair()
+            server = Connection(server_side.server(), right)
+            server.set_accept_state()
+            accepted = responder.submit(server.do_handshake)
+            start = time.perf_counter()
+            client = Connection(client_side.client(), left)
+            client.set_app_data("bench-listener")
+            client.set_connect_state()
+            client.do_handshake()
+            samples.append(time.perf_counter() - start)
+            accepted.result()
+            client.close()
+            server.close()
+    return {"handshake.tls_psk": _latency(samples)}
+
+
+def bench_kdf(count):
+    """HKDF key derivation as the SDK does it, and the v2 ECDH + HKDF session key"""
+    sdk = _PeerSDK("bench-client")
+    sdk.ecdh_key_pool.close()
+    shared_secret = os.urandom(32)
+    start = time.perf_counter()
+    for _ in range(count):
+        sdk._derive_symmetric_key(shared_secret)
+    hkdf = count / (time.perf_counter() - start)
+
+    private_key, _, _ = generate_ephemeral_key()
+    _, _, peer_point = generate_ephemeral_key()
+    start = time.perf_counter()
+    for _ in range(count):
+        wire.session_key(private_key, peer_point)
+    session_key = count / (time.perf_counter() - start)
+    return {"kdf.hkdf": {"ops_per_sec": hkdf}, "kdf.ecdh_session_key": {"ops_per_sec": session_key}}
+
+
+def bench_identity_lookups(count):
+    """is_peer_authorized at several authorized set sizes; cold is the first check after a change"""
+    results = {}
+    for peers in PEER_COUNTS:
+        with _tmp_db() as (tmp_dir, db_path), contextlib.redirect_stdout(io.StringIO()):
+            manager = IdentityManager("bench-client", "bench", identity_dir=tmp_dir, db_path=db_path)
+            manager.authorize_peers([f"peer-{index}" for index in range(peers)])
+            cold = []
+            for _ in range(5):
+                manager.authz_cache.invalidate(manager.client_id)
+                start = time.perf_counter()
+                manager.is_peer_authorized("peer-0")
+                cold.append(time.perf_counter() - start)
+
+            lookups = [f"peer-{index % (peers * 2)}" for index in range(count)]
+            start = time.perf_counter()
+            for peer_id in lookups:
+                manager.is_peer_authorized(peer_id)
+            rate = count / (time.perf_counter() - start)
+            manager.authz_cache.close()
+        results[f"identity.lookup.{peers}"] = {"ops_per_sec": rate, "cold_seconds": _percentile(cold, 0.5)}
+    return results
+
+
+def bench_activity_log(count):
+    """_log_activity submit rate, and rows per second until they are all in SQLite"""
+    with _tmp_db() as (_, db_path):
+        sdk = _PeerSDK("bench-client")
+        sdk.ecdh_key_pool.close()
+        create_kdc_tables(db_path)
+        sdk._log_sink = ActivityLogSink(db_path, max_queue=count)
+        start = time.perf_counter()
+        for index in range(count):
+            sdk._log_activity('CONN', 'Benchmark row', {"index": index})
+        submitted = time.perf_counter() - start
+        sdk._log_sink.flush(timeout=60)
+        written = time.perf_counter() - start
+        sdk._log_sink.close()
+    return {"activity_log": {"submit_per_sec": count / submitted, "written_per_sec": count / written}}
+
+
+def bench_kdc_connect(count):
+    """connect_to_kdc latency against the stub KDC, first registration excluded"""
+    kdc = StubKDC()
+    tmp_dir = tempfile.mkdtemp()
+    db_path = os.path.join(tmp_dir, "kdc_database.db")
+    samples = []
+    try:
+        create_kdc_tables(db_path)
+        # Keep whatever the SDK logs to stdout out of the timing and the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            sdk = SecureChannelSDK(client_name="bench", identity_dir=tmp_dir, db_path=db_path,
+                                   kdc_endpoints=[kdc.endpoint])
+            try:
+                sdk.connect_to_kdc()
+                for _ in range(count):
+                    start = time.perf_counter()
+                    sdk.connect_to_kdc()
+                    samples.append(time.perf_counter() - start)
+            finally:
+                sdk.close()
+    finally:
+        kdc.close()
+        get_database(db_path, ensure_schema=False).close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return {"kdc.connect": _latency(samples)}
+
+
+# name -> (benchmark, count for a full run); --quick divides the counts by 10
+BENCHMARKS = {
+    "records": (bench_records_throughput, 5000),
+    "handshake.ecdh": (bench_ecdh_handshake, 300),
+    "handshake.tls_psk": (bench_psk_handshake, 300),
+    "kdf": (bench_kdf, 5000),
+    "identity": (bench_identity_lookups, 100000),
+    "activity_log": (bench_activity_log, 50000),
+    "kdc.connect": (bench_kdc_connect, 50),
+}
+
+
+def _environment():
+    import cryptography
+    import OpenSSL
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cryptography": cryptography.__version__,
+        "pyopenssl": OpenSSL.__version__,
+    }
+
+
+def _selects(prefix, name):
+    """True if prefix names name or a group it belongs to, e.g. "records" for "records.1024" """
+    return name == prefix or name.startswith(prefix + ".")
+
+
+def run(only=None, quick=False):
+    """Run the benchmarks named in ``only``, or in the groups named there (all by default)
+
+    Returns {"environment": {...}, "created": iso timestamp, "results": {name: {metric: value}}}.
+    """
+    results = {}
+    for name, (benchmark, count) in BENCHMARKS.items():
+        if only and not any(_selects(prefix, name) or _selects(name, prefix) for prefix in only):
+            continue
+        results.update(benchmark(max(1, count // 10) if quick else count))
+    if only:
+        results = {name: value for name, value in results.items() if any(_selects(p, name) for p in only)}
+    return {"environment": _environment(), "created": datetime.now().isoformat(), "quick": quick,
+            "results": results}
+
+
+def _higher_is_better(metric):
+    return metric.endswith("_per_sec")
+
+
+def compare(baseline, current, threshold=0.15):
+    """Compare two run() results metric by metric
+
+    Returns (name, metric, baseline value, current value, relative change,
+    regressed) tuples for the metrics both runs have. The change is signed
+    so that positive is always an improvement.
+    """
+    rows = []
+    for name, metrics in current["results"].items():
+        base_metrics = baseline["results"].get(name, {})
+        for metric, value in metrics.items():
+            base = base_metrics.get(metric)
+            if not isinstance(value, (int, float)) or not isinstance(base, (int, float)) or not base:
+                continue
+            change = (value - base) / base
+            if not _higher_is_better(metric):
+                change = -change
+            rows.append((name, metric, base, value, change, change < -threshold))
+    return rows
+
+
+def _format(metric, value):
+    if _higher_is_better(metric):
+        return f"{value:,.0f}" if value >= 100 else f"{value:.2f}"
+    return f"{value * 1000:.3f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", nargs="+", metavar="NAME",
+                        help=f"benchmarks or groups to run, e.g. records.1024; groups: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--quick", action="store_true", help="a tenth of the iterations, for a smoke run")
+    parser.add_argument("--save", metavar="PATH", help="write the results as JSON")
+    parser.add_argument("--compare", metavar="PATH", help="compare against a saved JSON baseline")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="relative change that counts as a regression (default: 0.15)")
+    args = parser.parse_args()
+
+    current = run(args.only, args.quick)
+    if not current["results"]:
+        parser.error(f"no benchmark matches {' '.join(args.only)}")
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+
+    if not args.compare:
+        print(f"{'benchmark':<26} {'metric':<16} {'value':>16}")
+        for name, metrics in current["results"].items():
+            for metric, value in metrics.items():
+                shown = _format(metric, value) if isinstance(value, (int, float)) else value
+                print(f"{name:<26} {metric:<16} {shown:>16}")
+        return
+
+    with open(args.compare) as f:
+        baseline = json.load(f)
+    if baseline.get("environment") != current["environment"]:
+        print(f"baseline environment: {baseline.get('environment')}")
+        print(f"current environment:  {current['environment']}")
+    rows = compare(baseline, current, args.threshold)
+    print(f"{'benchmark':<26} {'metric':<16} {'baseline':>14} {'current':>14} {'change':>8}")
+    for name, metric, base, value, change, regressed in rows:
+        print(f"{name:<26} {metric:<16} {_format(metric, base):>14} {_format(metric, value):>14} "
+              f"{change:>+7.1%}{'  REGRESSION' if regressed else ''}")
+    regressions = sum(row[5] for row in rows)
+    print(f"{regressions} regression(s) beyond {args.threshold:.0%}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import os
+import sqlite3
+import threading
+import time
+from legosec.storage.database import get_database
+from legosec import log, metrics
+
+_log = log.get_logger("identity")
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+class AuthorizationCache:
+    """In-memory sets of authorized peers, one per client
+
+    Lookups are plain set membership tests. Writes made through
+    IdentityManager invalidate the affected client immediately; writes from
+    other connections or processes are picked up by comparing
+    ``PRAGMA data_version`` and the per-client counters kept in
+    ``peer_authorization_versions``, at most once per ``revalidate_interval``.
+    """
+
+    def __init__(self, db_path, revalidate_interval=1.0):
+        self.db_path = db_path
+        self.revalidate_interval = revalidate_interval
+        self._peers = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+        self._conn = None
+        self._data_version = None
+        self._next_check = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.revalidations = 0
+
+    def _connection(self):
+        # Dedicated connection so data_version reflects commits from every other connection
+        if self._conn is None:
+            # The tables may not exist yet when the SDK was built lazily
+            get_database(self.db_path).ensure_schema()
+            self._conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+            self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        return self._conn
+
+    def contains(self, client_id, peer_id):
+        """Return True if peer_id is authorized for client_id"""
+        if time.monotonic() >= self._next_check:
+            self._revalidate()
+
+        peers = self._peers.get(client_id)
+        if peers is None:
+            self.misses += 1
+            peers = self._load(client_id)
+        else:
+            self.hits += 1
+        return peer_id in peers
+
+    def invalidate(self, client_id=None):
+        """Drop cached peers for one client, or for all clients"""
+        with self._lock:
+            if client_id is None:
+                self._peers.clear()
+                self._versions.clear()
+            else:
+                self._peers.pop(client_id, None)
+                self._versions.pop(client_id, None)
+            self.invalidations += 1
+
+    def _load(self, client_id):
+        with self._lock:
+            conn = self._connection()
+            # One read snapshot so the version matches the peers it describes
+            conn.execute("BEGIN")
+            try:
+                row = conn.execute(
+                    "SELECT version FROM peer_authorization_versions WHERE client_id = ?", (client_id,)
+                ).fetchone()
+                peers = frozenset(
+                    r[0] for r in conn.execute(
+                        "SELECT peer_id FROM peer_authorizations WHERE client_id = ?", (client_id,)
+                    )
+                )
+            finally:
+                conn.execute("COMMIT")
+            self._peers[client_id] = peers
+            self._versions[client_id] = row[0] if row else 0
+            return peers
+
+    def _revalidate(self):
+        with self._lock:
+            if time.monotonic() < self._next_check:
+                return
+            self._next_check = time.monotonic() + self.revalidate_interval
+            try:
+                conn = self._connection()
+                data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+                if data_version == self._data_version or not self._versions:
+                    self._data_version = data_version
+                    return
+                self._data_version = data_version
+                self.revalidations += 1
+
+                current = dict(conn.execute(
+                    "SELECT client_id, version FROM peer_authorization_versions"
+                ).fetchall())
+                for client_id, version in list(self._versions.items()):
+                    if current.get(client_id, 0) != version:
+                        self._peers.pop(client_id, None)
+                        self._versions.pop(client_id, None)
+                        self.invalidations += 1
+            except sqlite3.Error as e:
+                _log.error("Authorization cache revalidation failed: %.50s", e)
+                self._peers.clear()
+                self._versions.clear()
+
+    def stats(self):
+        """Return hit/miss counters for the cache"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "revalidations": self.revalidations,
+            "cached_clients": len(self._peers),
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._peers.clear()
+            self._versions.clear()
+
+
+def get_authorization_cache(db_path):
+    """Return the process-wide AuthorizationCache for a database path"""
+    key = os.path.abspath(db_path)
+    cache = _registry.get(key)
+    if cache is None:
+        with _registry_lock:
+            cache = _registry.get(key)
+            if cache is None:
+                cache = AuthorizationCache(db_path)
+                _registry[key] = cache
+    return cache
+
+
+def _collect_metrics():
+    """Authorization cache effectiveness summed over every cache in the process"""
+    caches = list(_registry.values())
+    help = "Authorization checks answered from the cache (hit) or the database (miss)"
+    yield ("legosec_authorization_cache_lookups_total", "counter", help,
+           {"result": "hit"}, sum(cache.hits for cache in caches))
+    yield ("legosec_authorization_cache_lookups_total", "counter", help,
+           {"result": "miss"}, sum(cache.misses for cache in caches))
+    yield ("legosec_authorization_cache_invalidations_total", "counter", "Cached peer sets dropped",
+           {}, sum(cache.invalidations for cache in caches))
+    yield ("legosec_authorization_cache_clients", "gauge", "Clients with a cached peer set",
+           {}, sum(len(cache._peers) for cache in caches))
+
+
+metrics.REGISTRY.register_collector(_collect_metrics)
@@ -6,29 +6,44 @@ from pathlib import Path
 from datetime import datetime, timedelta
 from cryptography.hazmat.primitives import serialization, hashes
 from cryptography.hazmat.primitives.asymmetric import padding
+from legosec.storage.database import get_database
+from legosec.identity.cache import get_authorization_cache
+from legosec.identity.manifest import get_identity_manifest
+from legosec import log
+
+_log = log.get_logger("identity")
 
 # Register SQLite3 datetime handlers (Python 3.12+ compatibility)
 sqlite3.register_adapter(datetime, lambda dt: dt.isoformat())
 sqlite3.register_converter("TIMESTAMP", lambda s: datetime.fromisoformat(s.decode()))
 
 class IdentityManager:
-    def __init__(self, client_id, client_name, identity_dir=".", db_path="kdc_database.db"):
-        """Initialize IdentityManager with secure logging"""
+    def __init__(self, client_id, client_name, identity_dir=".", db_path="kdc_database.db",
+                 validate=True, ensure_schema=True):
+        """Initialize IdentityManager with secure logging
+
+        validate=False skips reading the identity file here, for callers that
+        already checked it; ensure_schema=False leaves the schema to the first
+        database connection.
+        """
         self.db_path = db_path
+        self.db = get_database(db_path, ensure_schema=ensure_schema)
+        self.authz_cache = get_authorization_cache(db_path)
         self.client_id = client_id
         self.client_name = client_name
         self.identity_dir = Path(identity_dir)
         self.identity_path = self.identity_dir / f".{self.client_id}_identity.json"
+        self.manifest = get_identity_manifest(self.identity_dir)
 
-        print(f"[INFO][IdentityManager] Initializing for client {client_id}")
+        _log.info("Initializing for client %s", client_id)
         
-        if self.identity_path.exists():
+        if validate and self.identity_path.exists():
             if not self._is_identity_valid():
-                print(f"[WARN][IdentityManager] Invalid identity detected - removing file")
+                _log.warning("Invalid identity detected - removing file")
                 try:
-                    self.identity_path.unlink()
+                    self.remove_identity_file()
                 except Exception as e:
-                    print(f"[ERROR][IdentityManager] Failed to remove invalid identity: {str(e)}")
+                    _log.error("Failed to remove invalid identity: %s", e)
 
     def _is_identity_valid(self):
         """Securely checks if the identity file is valid"""
@@ -40,47 +55,40 @@ class IdentityManager:
             valid = datetime.now() < expires_at
             
             if valid:
-                print(f"[DEBUG][IdentityManager] Valid identity found (expires: {expires_at})")
+                _log.debug("Valid identity found (expires: %s)", expires_at)
             else:
-                print(f"[DEBUG][IdentityManager] Expired identity (was valid until {expires_at})")
+                _log.debug("Expired identity (was valid until %s)", expires_at)
             
             return valid
             
         except Exception as e:
-            print(f"[ERROR][IdentityManager] Identity validation error: {str(e)}")
+            _log.error("Identity validation error: %s", e)
             return False
     
     def _init_database(self):
         """Initialize database tables with secure logging"""
-        print(f"[DEBUG][IdentityManager] Initializing database schema")
+        _log.debug("Initializing database schema")
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS clients (
-                        client_id TEXT PRIMARY KEY,
-                        client_name TEXT NOT NULL, 
-                        secret_id BLOB NOT NULL,
-                        authorized_peers TEXT,
-                        expires_at TIMESTAMP NOT NULL,
-                        public_key BLOB,
-                        last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                conn.commit()
+            self.db.ensure_schema()
         except sqlite3.Error as e:
-            print(f"[ERROR][IdentityManager] Database initialization failed: {str(e)}")
+            _log.error("Database initialization failed: %s", e)
             raise
 
+    def remove_identity_file(self):
+        """Delete the identity file and drop it from the identity manifest"""
+        dir_mtime = self.manifest.dir_mtime()
+        self.identity_path.unlink()
+        self.manifest.discard(self.client_id, dir_mtime)
+
     def is_registered(self):
         """Check registration status without sensitive info"""
         exists = self.identity_path.exists()
-        print(f"[DEBUG][IdentityManager] Registration check: {'Found' if exists else 'Not found'}")
+        _log.debug("Registration check: %s", 'Found' if exists else 'Not found')
         return exists
 
     def load_identity(self):
         """Securely load identity data"""
-        print(f"[DEBUG][IdentityManager] Loading identity file")
+        _log.debug("Loading identity file")
         
         if not self.is_registered():
             return None
@@ -90,33 +98,33 @@ class IdentityManager:
                 data = json.load(f)
                 
             if not all(key in data for key in ['client_id', 'client_name', 'encrypted_secret', 'expires_at']):
-                print("[WARN][IdentityManager] Identity file missing required fields")
+                _log.warning("Identity file missing required fields")
                 return None
                 
             return data
             
         except Exception as e:
-            print(f"[ERROR][IdentityManager] Failed to load identity: {str(e)}")
+            _log.error("Failed to load identity: %s", e)
             return None
 
     def is_expired(self, identity_data):
         """Check expiration status securely"""
         if not identity_data or 'expires_at' not in identity_data:
-            print("[WARN][IdentityManager] Invalid identity data format")
+            _log.warning("Invalid identity data format")
             return True
             
         try:
             expires_at = datetime.fromisoformat(identity_data['expires_at'])
             expired = datetime.now() > expires_at
-            print(f"[DEBUG][IdentityManager] Identity {'expired' if expired else 'valid'}")
+            _log.debug("Identity %s", 'expired' if expired else 'valid')
             return expired
         except Exception as e:
-            print(f"[ERROR][IdentityManager] Expiration check failed: {str(e)}")
+            _log.error("Expiration check failed: %s", e)
             return True
 
     def store_identity(self, encrypted_secret, expires_at):
         """Securely store identity information"""
-        print(f"[DEBUG][IdentityManager] Storing new identity")
+        _log.debug("Storing new identity")
         
         data = {
             'client_id': self.client_id,
@@ -128,6 +136,7 @@ class IdentityManager:
         
         try:
             self.identity_path.parent.mkdir(parents=True, exist_ok=True)
+            dir_mtime = self.manifest.dir_mtime()
             
             with open(self.identity_path, 'w') as f:
                 json.dump(data, f, indent=2)
@@ -135,23 +144,25 @@ class IdentityManager:
             # Verify the file was created
             if not self.identity_path.exists():
                 raise IOError("Identity file not created")
+
+            self.manifest.record(self.client_id, self.client_name, expires_at, self.identity_path, dir_mtime)
                 
-            print("[INFO][IdentityManager] Identity stored successfully")
+            _log.info("Identity stored successfully")
             return True
             
         except Exception as e:
-            print(f"[ERROR][IdentityManager] Failed to store identity: {str(e)}")
+            _log.error("Failed to store identity: %s", e)
             return False
 
     def register_on_kdc(self, kdc_public_key):
         """Secure client registration with KDC"""
-        print(f"[INFO][IdentityManager] Registering client {self.client_id[:6]}...")
+        _log.info("Registering client %.6s...", self.client_id)
         
         
         try:
             # Generate and protect client secret
             secret = os.urandom(32)
-            print(f"[DEBUG][IdentityManager] Generated client secret (length: {len(secret)})")
+            _log.debug("Generated client secret (length: %d)", len(secret))
             
             expires_at = datetime.now() + timedelta(days=7)
             
@@ -164,126 +175,115 @@ class IdentityManager:
                     label=None
                 )
             )
-            print(f"[DEBUG][IdentityManager] Secret encrypted (length: {len(encrypted_secret)})")
-
-            # Database operations
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    INSERT OR REPLACE INTO clients 
-                    (client_id, client_name, secret_id, authorized_peers, expires_at)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (
-                    self.client_id,
-                    self.client_name,
-                    encrypted_secret,
-                    json.dumps([]),  # Start with empty peer list
-                    expires_at.isoformat()
-                ))
-                conn.commit()
+            _log.debug("Secret encrypted (length: %d)", len(encrypted_secret))
+
+            # Database operations; peers live in peer_authorizations, which the
+            # client_authorized_peers view exposes in the legacy JSON form
+            self.db.execute("""
+                INSERT OR REPLACE INTO clients 
+                (client_id, client_name, secret_id, authorized_peers, expires_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, (
+                self.client_id,
+                self.client_name,
+                encrypted_secret,
+                json.dumps([]),
+                expires_at.isoformat()
+            ))
 
             if self.store_identity(encrypted_secret, expires_at):
-                print(f"[INFO][IdentityManager] Registration successful for {self.client_id[:6]}...")
+                _log.info("Registration successful for %.6s...", self.client_id)
                 return True
                 
             return False
             
         except Exception as e:
-            print(f"[ERROR][IdentityManager] Registration failed: {str(e)}")
+            _log.error("Registration failed: %s", e)
             return False
 
     def authenticate_with_kdc(self, encrypted_secret):
         """Secure authentication with KDC"""
-        print(f"[DEBUG][IdentityManager] Authenticating client {self.client_id[:6]}...")
+        _log.debug("Authenticating client %.6s...", self.client_id)
         
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    SELECT secret_id, expires_at FROM clients 
-                    WHERE client_id = ?
-                """, (self.client_id,))
-                result = cursor.fetchone()
+            result = self.db.fetchone("""
+                SELECT secret_id, expires_at FROM clients 
+                WHERE client_id = ?
+            """, (self.client_id,))
 
-                if not result:
-                    print("[WARN][IdentityManager] Client not found in database")
-                    return False
+            if not result:
+                _log.warning("Client not found in database")
+                return False
 
-                stored_secret, expires_at = result
-                
-                # Handle expiration
-                if isinstance(expires_at, str):
-                    expires_at = datetime.fromisoformat(expires_at)
-                
-                if datetime.now() > expires_at:
-                    print("[WARN][IdentityManager] Expired credentials")
-                    return False
-
-                # Secure comparison
-                is_valid = encrypted_secret == stored_secret
-                print(f"[DEBUG][IdentityManager] Authentication {'success' if is_valid else 'failure'}")
-                return is_valid
+            stored_secret, expires_at = result
+            
+            # Handle expiration
+            if isinstance(expires_at, str):
+                expires_at = datetime.fromisoformat(expires_at)
+            
+            if datetime.now() > expires_at:
+                _log.warning("Expired credentials")
+                return False
+
+            # Secure comparison
+            is_valid = encrypted_secret == stored_secret
+            _log.debug("Authentication %s", 'success' if is_valid else 'failure')
+            return is_valid
                 
         except Exception as e:
-            print(f"[ERROR][IdentityManager] Authentication error: {str(e)}")
+            _log.error("Authentication error: %s", e)
             return False
 
     def get_authorized_peers(self):
         """Get authorized peers list securely"""
-        print(f"[DEBUG][IdentityManager] Retrieving authorized peers")
+        _log.debug("Retrieving authorized peers")
         
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    SELECT authorized_peers FROM clients 
-                    WHERE client_id = ?
-                """, (self.client_id,))
-                result = cursor.fetchone()
-                
-                if result and result[0]:
-                    try:
-                        return json.loads(result[0])
-                    except json.JSONDecodeError:
-                        print("[WARN][IdentityManager] Invalid peer list format")
-                        return []
-                return []
+            rows = self.db.fetchall("""
+                SELECT peer_id FROM peer_authorizations
+                WHERE client_id = ?
+                ORDER BY rowid
+            """, (self.client_id,))
+            return [row[0] for row in rows]
                 
         except Exception as e:
-            print(f"[ERROR][IdentityManager] Failed to get peers: {str(e)}")
+            _log.error("Failed to get peers: %s", e)
             return []
 
     def update_authorized_peers(self, peer_list):
-        """Update peer list securely"""
+        """Replace the authorized peer set in one transaction"""
         if not isinstance(peer_list, list):
             raise ValueError("Peer list must be an array")
             
-        print(f"[DEBUG][IdentityManager] Updating {len(peer_list)} authorized peers")
+        _log.debug("Updating %d authorized peers", len(peer_list))
         
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
+            with self.db.transaction() as conn:
+                conn.execute("DELETE FROM peer_authorizations WHERE client_id = ?", (self.client_id,))
+                conn.executemany("""
+                    INSERT OR IGNORE INTO peer_authorizations (client_id, peer_id)
+                    VALUES (?, ?)
+                """, [(self.client_id, peer_id) for peer_id in peer_list])
+                conn.execute("""
                     UPDATE clients
-                    SET authorized_peers = ?,
-                        last_updated = ?
+                    SET last_updated = ?
                     WHERE client_id = ?
-                """, (
-                    json.dumps(peer_list),
-                    datetime.now().isoformat(),
-                    self.client_id
-                ))
-                conn.commit()
+                """, (datetime.now().isoformat(), self.client_id))
+            self.authz_cache.invalidate(self.client_id)
             return True
             
         except Exception as e:
-            print(f"[ERROR][IdentityManager] Failed to update peers: {str(e)}")
+            _log.error("Failed to update peers: %s", e)
             raise
 
     def is_peer_authorized(self, peer_id):
         """Check peer authorization securely"""
-        print(f"[DEBUG][IdentityManager] Checking authorization for peer {peer_id[:6]}...")
-        return peer_id in self.get_authorized_peers()
+        _log.debug("Checking authorization for peer %.6s...", peer_id, peer=peer_id)
+        return self.authz_cache.contains(self.client_id, peer_id)
+
+    def authorization_cache_stats(self):
+        """Return hit/miss counters of the in-memory authorization cache"""
+        return self.authz_cache.stats()
 
     def check_identity_expiration(self, days_before=5):
         """Check identity expiration securely"""
@@ -312,40 +312,61 @@ class IdentityManager:
 
     def _renew_identity(self):
         """Securely renew identity"""
-        print(f"[INFO][IdentityManager] Renewing identity for {self.client_id[:6]}...")
+        _log.info("Renewing identity for %.6s...", self.client_id)
         
         try:
             identity = self.load_identity()
             
             if self.is_expired(identity):
-                print("[INFO][IdentityManager] Generating new client identity")
+                _log.info("Generating new client identity")
                 new_id = f"client_{os.urandom(4).hex()}"
                                
                 return IdentityManager(
                     client_id=new_id,
-                    client_name=f"Client-{new_id[-4:]}"
+                    client_name=f"Client-{new_id[-4:]}",
+                    db_path=self.db_path
                 ).register_on_kdc(self.kdc_pub_key)
             
 
             return self.register_on_kdc(self.kdc_pub_key)
             
         except Exception as e:
-            print(f"[ERROR][IdentityManager] Renewal failed: {str(e)}")
+            _log.error("Renewal failed: %s", e)
             return False
 
 
     def authorize_peer(self, peer_id):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT authorized_peers FROM clients WHERE client_id=?", (self.client_id,))
-        current = cursor.fetchone()
-        
-        if current:
-            peers = json.loads(current[0] or "[]")
-            if peer_id not in peers:
-                peers.append(peer_id)
-                cursor.execute(
-                    "UPDATE clients SET authorized_peers=? WHERE client_id=?",
-                    (json.dumps(peers), self.client_id)
-                )
-                conn.commit()
+        """Authorize a single peer"""
+        return self.authorize_peers([peer_id])
+
+    def authorize_peers(self, peer_ids):
+        """Authorize many peers in one transaction; returns the number newly added"""
+        rows = [(self.client_id, peer_id) for peer_id in peer_ids]
+        _log.debug("Authorizing %d peers", len(rows))
+        with self.db.transaction() as conn:
+            added = conn.executemany("""
+                INSERT OR IGNORE INTO peer_authorizations (client_id, peer_id)
+                VALUES (?, ?)
+            """, rows).rowcount
+        added = max(added, 0)
+        if added:
+            self.authz_cache.invalidate(self.client_id)
+        return added
+
+    def revoke_peer(self, peer_id):
+        """Revoke a single peer's authorization"""
+        return self.revoke_peers([peer_id])
+
+    def revoke_peers(self, peer_ids):
+        """Revoke many peers in one transaction; returns the number removed"""
+        rows = [(self.client_id, peer_id) for peer_id in peer_ids]
+        _log.debug("Revoking %d peers", len(rows))
+        with self.db.transaction() as conn:
+            removed = conn.executemany("""
+                DELETE FROM peer_authorizations
+                WHERE client_id = ? AND peer_id = ?
+            """, rows).rowcount
+        removed = max(removed, 0)
+        if removed:
+            self.authz_cache.invalidate(self.client_id)
+        return removed
@@ -0,0 +1,176 @@
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from legosec import log
+
+_log = log.get_logger("identity")
+
+IDENTITY_GLOB = ".client_*_identity.json"
+# Kept in a subdirectory so rewriting it does not change identity_dir's mtime
+MANIFEST_DIR = ".identity_manifest"
+MANIFEST_FILE = "manifest.json"
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+class IdentityManifest:
+    """Index of the identity files in an identity_dir
+
+    Maps client_id to client_name, expiry and file name, so finding an
+    identity by name or the first valid one reads a single small file
+    instead of every identity. ``record`` and ``discard`` keep it current and
+    rewrite it atomically. It also stores identity_dir's mtime as of its last
+    update; when the directory has changed since, the identity file names are
+    listed and only files added behind its back are read. A missing or
+    unreadable manifest is rebuilt from all identity files.
+    """
+
+    def __init__(self, identity_dir):
+        self.identity_dir = Path(identity_dir)
+        self.path = self.identity_dir / MANIFEST_DIR / MANIFEST_FILE
+        self._lock = threading.Lock()
+        self._entries = None
+        self._dir_mtime = None
+        self.stats = {"lookups": 0, "rebuilds": 0, "refreshes": 0, "parsed": 0, "writes": 0}
+
+    def _current_mtime(self):
+        try:
+            return os.stat(self.identity_dir).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def dir_mtime(self):
+        """identity_dir's mtime; taken before writing or removing an identity file for record/discard"""
+        return self._current_mtime()
+
+    def _entries_locked(self, mtime=None, skip=None):
+        mtime = self._current_mtime() if mtime is None else mtime
+        if self._entries is None or self._dir_mtime != mtime:
+            # Another process may have brought the file up to date already
+            self._load_locked()
+        if self._entries is None:
+            self.stats["rebuilds"] += 1
+            self._entries = {}
+            self._refresh_locked(skip)
+        elif self._dir_mtime != mtime:
+            self._refresh_locked(skip)
+        return self._entries
+
+    def _load_locked(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            self._entries = data["identities"]
+            self._dir_mtime = data["dir_mtime"]
+        except (OSError, ValueError, KeyError, TypeError):
+            self._entries = None
+
+    def _refresh_locked(self, skip=None):
+        """Bring the entries in line with the identity files now in the directory
+
+        The directory mtime also moves for unrelated files (the database and
+        its WAL often live next to the identities), so the file names are
+        compared first and only identity files the manifest does not know yet
+        are opened. ``skip`` is a file the caller is about to record itself.
+        """
+        self.stats["refreshes"] += 1
+        names = {file.name for file in self.identity_dir.glob(IDENTITY_GLOB)}
+        for client_id, entry in list(self._entries.items()):
+            if entry["file"] not in names:
+                del self._entries[client_id]
+        known = {entry["file"] for entry in self._entries.values()} | {skip}
+        for name in sorted(names - known):
+            try:
+                with open(self.identity_dir / name) as f:
+                    data = json.load(f)
+                datetime.fromisoformat(data["expires_at"])
+                self._entries[data["client_id"]] = {
+                    "client_name": data.get("client_name"),
+                    "expires_at": data["expires_at"],
+                    "file": name,
+                }
+                self.stats["parsed"] += 1
+            except Exception as e:
+                _log.warning("Skipping unreadable identity file %s: %.50s", name, e)
+        self._write_locked()
+
+    def _write_locked(self):
+        if not self.identity_dir.exists():
+            return
+        # Creating the subdirectory changes identity_dir's mtime, so it goes first. The
+        # identity files are already written, so the mtime taken next covers them
+        self.path.parent.mkdir(exist_ok=True)
+        self._dir_mtime = self._current_mtime()
+        tmp_path = self.path.with_name(f"{MANIFEST_FILE}.{os.getpid()}.tmp")
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump({"dir_mtime": self._dir_mtime, "identities": self._entries}, f)
+            os.replace(tmp_path, self.path)
+            self.stats["writes"] += 1
+        except OSError as e:
+            _log.warning("Failed to write identity manifest: %.50s", e)
+
+    def record(self, client_id, client_name, expires_at, path, dir_mtime=None):
+        """Add or update an identity after its file has been written
+
+        ``dir_mtime`` is the directory mtime from before the write; when the
+        manifest matched it, the new file alone does not force a rebuild.
+        """
+        with self._lock:
+            entries = self._entries_locked(dir_mtime, skip=Path(path).name)
+            entries[client_id] = {
+                "client_name": client_name,
+                "expires_at": expires_at.isoformat() if isinstance(expires_at, datetime) else expires_at,
+                "file": Path(path).name,
+            }
+            self._write_locked()
+
+    def discard(self, client_id, dir_mtime=None):
+        """Drop an identity after its file has been removed; dir_mtime as for record"""
+        with self._lock:
+            entries = self._entries_locked(dir_mtime)
+            entries.pop(client_id, None)
+            self._write_locked()
+
+    def get(self, client_id):
+        """Return the entry for client_id, or None"""
+        with self._lock:
+            self.stats["lookups"] += 1
+            entry = self._entries_locked().get(client_id)
+            return dict(entry) if entry else None
+
+    def find_valid(self, client_name=None):
+        """Return the client_id of an unexpired identity, optionally with the given name
+
+        With a name, the identity that expires last wins; without one, the
+        first valid identity in the manifest.
+        """
+        now = datetime.now()
+        with self._lock:
+            self.stats["lookups"] += 1
+            best = None
+            for client_id, entry in self._entries_locked().items():
+                expires_at = datetime.fromisoformat(entry["expires_at"])
+                if expires_at <= now:
+                    continue
+                if client_name is None:
+                    return client_id
+                if entry["client_name"] == client_name and (best is None or expires_at > best[1]):
+                    best = (client_id, expires_at)
+            return best[0] if best else None
+
+
+def get_identity_manifest(identity_dir):
+    """Return the process-wide IdentityManifest for an identity directory"""
+    key = os.path.abspath(identity_dir)
+    manifest = _registry.get(key)
+    if manifest is None:
+        with _registry_lock:
+            manifest = _registry.get(key)
+            if manifest is None:
+                manifest = IdentityManifest(identity_dir)
+                _registry[key] = manifest
+    return manifest
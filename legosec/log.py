@@ -0,0 +1,211 @@
+"""Leveled, sampled logging for the legosec package
+
+Every subsystem logs through a child of the ``legosec`` logger
+(``legosec.handshake``, ``legosec.messages``, ...), so the usual logging
+configuration applies. Messages take %-style arguments and are only
+formatted when a handler receives them; a disabled level costs one
+``isEnabledFor`` check. Importing the package only adds a NullHandler, so
+records propagate to whatever the application configured; ``configure``
+switches to printing ``[LEVEL] message`` lines on stdout instead.
+
+Operators can turn on DEBUG for single subsystems or peers without raising
+the level everywhere else, with ``configure`` or the ``LEGOSEC_LOG_LEVEL``
+and ``LEGOSEC_DEBUG`` environment variables, e.g.
+``LEGOSEC_DEBUG=handshake,peer:a1b2c3``. Peers match by client id prefix.
+
+Per-message and per-connection events go through a shared Sampler: the
+first ``burst`` events of a kind in every ``interval`` seconds pass, after
+that one in ``every``. Events from a debug peer always pass. The SDK's
+activity log uses the same sampler for the rows it persists.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+
+ROOT = "legosec"
+DEBUG = logging.DEBUG
+INFO = logging.INFO
+WARNING = logging.WARNING
+ERROR = logging.ERROR
+
+_debug_peers = frozenset()
+
+
+class _StdoutHandler(logging.StreamHandler):
+    """StreamHandler that looks sys.stdout up per record, so redirected stdout is honoured"""
+
+    def __init__(self):
+        super().__init__(sys.stdout)
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+class Sampler:
+    """Per-key rate limit: ``burst`` events per ``interval`` seconds, then one in ``every``"""
+
+    def __init__(self, burst=20, interval=1.0, every=100):
+        self.burst = burst
+        self.interval = interval
+        self.every = max(1, int(every))
+        self._lock = threading.Lock()
+        self._windows = {}
+        self.stats = {"passed": 0, "suppressed": 0}
+
+    def allow(self, key):
+        """Count one event of kind key and return True if it should be logged"""
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                window = self._windows[key] = [now, 0]
+            window[1] += 1
+            over = window[1] - self.burst
+            if over <= 0 or over % self.every == 0:
+                self.stats["passed"] += 1
+                return True
+            self.stats["suppressed"] += 1
+            return False
+
+    def reset(self):
+        with self._lock:
+            self._windows.clear()
+            self.stats = {"passed": 0, "suppressed": 0}
+
+
+sampler = Sampler()
+
+
+def is_debug_peer(peer_id):
+    """True if DEBUG was turned on for this peer"""
+    return bool(peer_id) and any(peer_id.startswith(prefix) for prefix in _debug_peers)
+
+
+def sample(key, peer_id=None):
+    """True if this occurrence of a sampled event should be logged or persisted"""
+    if _debug_peers and is_debug_peer(peer_id):
+        return True
+    return sampler.allow(key)
+
+
+class Logger:
+    """Logger for one subsystem; ``peer`` lets a debug peer's records through at any level"""
+
+    def __init__(self, subsystem):
+        self.subsystem = subsystem
+        self.logger = logging.getLogger(f"{ROOT}.{subsystem}")
+
+    def enabled(self, level, peer=None):
+        """True if a record at level would be emitted; check it before costly arguments"""
+        if self.logger.isEnabledFor(level):
+            return True
+        return bool(_debug_peers) and is_debug_peer(peer)
+
+    def log(self, level, msg, *args, peer=None):
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, msg, *args, stacklevel=3)
+        elif _debug_peers and is_debug_peer(peer):
+            # The logger's level would drop the record, so hand it to the handlers directly
+            self.logger.handle(self.logger.makeRecord(self.logger.name, level, "(unknown file)", 0, msg, args, None))
+
+    def debug(self, msg, *args, peer=None):
+        self.log(DEBUG, msg, *args, peer=peer)
+
+    def info(self, msg, *args, peer=None):
+        self.log(INFO, msg, *args, peer=peer)
+
+    def warning(self, msg, *args, peer=None):
+        self.log(WARNING, msg, *args, peer=peer)
+
+    def error(self, msg, *args, peer=None):
+        self.log(ERROR, msg, *args, peer=peer)
+
+    def sampled(self, key, level, msg, *args, peer=None):
+        """Log a per-message or per-connection event, subject to the sampler"""
+        if self.enabled(level, peer) and sample(f"{self.subsystem}.{key}", peer):
+            self.log(level, msg, *args, peer=peer)
+
+
+_loggers = {}
+
+
+def get_logger(subsystem):
+    """Return the Logger for a subsystem, e.g. "handshake" or "messages" """
+    logger = _loggers.get(subsystem)
+    if logger is None:
+        logger = _loggers.setdefault(subsystem, Logger(subsystem))
+    return logger
+
+
+def configure(level=None, debug_subsystems=None, debug_peers=None, sample_burst=None,
+              sample_interval=None, sample_every=None):
+    """Adjust legosec logging at runtime and print its records on stdout
+
+    The stdout handler is only added if the application has not given the
+    ``legosec`` logger a handler of its own.
+
+    Args:
+        level: Level for the whole package, e.g. "WARNING" or logging.INFO
+        debug_subsystems: Subsystems to log at DEBUG regardless of level
+        debug_peers: Client id prefixes whose records are logged at DEBUG
+        sample_burst, sample_interval, sample_every: Sampler settings
+    """
+    _install_stdout_handler()
+    _apply(level, debug_subsystems, debug_peers, sample_burst, sample_interval, sample_every)
+
+
+def _apply(level=None, debug_subsystems=None, debug_peers=None, sample_burst=None,
+           sample_interval=None, sample_every=None):
+    global _debug_peers
+    if level is not None:
+        logging.getLogger(ROOT).setLevel(level.upper() if isinstance(level, str) else level)
+    if debug_subsystems is not None:
+        for subsystem in debug_subsystems:
+            logging.getLogger(f"{ROOT}.{subsystem}").setLevel(DEBUG)
+    if debug_peers is not None:
+        _debug_peers = frozenset(prefix for prefix in debug_peers if prefix)
+    if sample_burst is not None:
+        sampler.burst = sample_burst
+    if sample_interval is not None:
+        sampler.interval = sample_interval
+    if sample_every is not None:
+        sampler.every = max(1, int(sample_every))
+
+
+def _install_stdout_handler():
+    """Print legosec records on stdout unless the application already gave the package a handler"""
+    root = logging.getLogger(ROOT)
+    if any(not isinstance(handler, logging.NullHandler) for handler in root.handlers):
+        return
+    handler = _StdoutHandler()
+    handler.setFormatter(logging.Formatter("[%(levelname)s] %(message)s"))
+    root.addHandler(handler)
+    root.propagate = False
+
+
+def _configure_from_env():
+    # Handlers are the application's business until it calls configure; the environment only sets levels
+    root = logging.getLogger(ROOT)
+    root.addHandler(logging.NullHandler())
+    level = os.environ.get("LEGOSEC_LOG_LEVEL")
+    if level:
+        try:
+            _apply(level=level)
+        except ValueError:
+            root.setLevel(INFO)
+
+    entries = [entry.strip() for entry in os.environ.get("LEGOSEC_DEBUG", "").split(",") if entry.strip()]
+    _apply(
+        debug_subsystems=[entry for entry in entries if not entry.startswith("peer:")],
+        debug_peers=[entry[len("peer:"):] for entry in entries if entry.startswith("peer:")]
+    )
+
+
+_configure_from_env()
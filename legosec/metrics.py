@@ -0,0 +1,331 @@
+"""In-process metrics for the legosec package
+
+Counters, gauges and fixed-bucket latency histograms live in a Registry.
+Recording takes a lock and an addition, plus a bisect for histograms, so
+the metrics stay on in production. Stats the package already keeps, such
+as the authorization cache counters, are turned into samples by
+collectors only when the registry is read.
+
+Read the metrics with ``snapshot()`` (a dict) or ``prometheus_text()``
+(the Prometheus text format), or serve the text from a local port with
+``start_http_server()``.
+"""
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Seconds; handshakes run from well under a millisecond (resumption) to seconds (PSK waits)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0)
+
+
+class _Value:
+    """One labelled counter or gauge"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class _Buckets:
+    """One labelled histogram; counts are per bucket and made cumulative when read"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        """Context manager that observes the seconds spent in its block"""
+        return _Timer(self)
+
+    def cumulative(self):
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        running = 0
+        buckets = {}
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            running += bucket_count
+            buckets[bound] = running
+        return buckets, total, count
+
+
+class _Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Metric:
+    """A named metric family; ``labels()`` returns the child for one label set"""
+
+    def __init__(self, kind, name, help, labelnames=(), buckets=None):
+        self.kind = kind
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) if buckets else None
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self._child(())
+
+    def _child(self, key):
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = _Buckets(self.buckets) if self.kind == "histogram" else _Value()
+                    self._children[key] = child
+        return child
+
+    def labels(self, **labels):
+        return self._child(tuple(str(labels[name]) for name in self.labelnames))
+
+    # Shortcuts for metrics without labels
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def dec(self, amount=1):
+        self._default.dec(amount)
+
+    def set(self, value):
+        self._default.set(value)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+    def samples(self):
+        """Yield (labels dict, child) for every label set seen so far"""
+        for key, child in list(self._children.items()):
+            yield dict(zip(self.labelnames, key)), child
+
+
+class Registry:
+    """Metric families by name, plus collectors read at snapshot time
+
+    A collector is a callable returning (name, kind, help, labels, value)
+    tuples for counters and gauges.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _get(self, kind, name, help, labelnames, buckets=None):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = Metric(kind, name, help, labelnames, buckets)
+            elif metric.kind != kind or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} is already registered with another type or labels")
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._get("counter", name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=()):
+        return self._get("gauge", name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._get("histogram", name, help, labelnames, buckets)
+
+    def register_collector(self, collector):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def snapshot(self):
+        """Return {name: {"type", "help", "samples"}}
+
+        Counter and gauge samples are {"labels", "value"}; histogram samples
+        are {"labels", "count", "sum", "buckets"} with cumulative bucket
+        counts keyed by upper bound.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        result = {}
+        for metric in metrics:
+            samples = []
+            for labels, child in metric.samples():
+                if metric.kind == "histogram":
+                    buckets, total, count = child.cumulative()
+                    samples.append({"labels": labels, "count": count, "sum": total, "buckets": buckets})
+                else:
+                    samples.append({"labels": labels, "value": child.value})
+            result[metric.name] = {"type": metric.kind, "help": metric.help, "samples": samples}
+        for collector in collectors:
+            for name, kind, help, labels, value in collector():
+                family = result.setdefault(name, {"type": kind, "help": help, "samples": []})
+                family["samples"].append({"labels": dict(labels), "value": value})
+        return result
+
+    def prometheus_text(self):
+        """Render the snapshot in the Prometheus text exposition format"""
+        lines = []
+        for name, family in sorted(self.snapshot().items()):
+            lines.append(f"# HELP {name} {_escape_help(family['help'])}")
+            lines.append(f"# TYPE {name} {family['type']}")
+            for sample in family["samples"]:
+                labels = sample["labels"]
+                if family["type"] != "histogram":
+                    lines.append(f"{name}{_labels(labels)} {_number(sample['value'])}")
+                    continue
+                for bound, count in sample["buckets"].items():
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{name}_bucket{_labels(dict(labels, le=le))} {count}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(sample['sum'])}")
+                lines.append(f"{name}_count{_labels(labels)} {sample['count']}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape_help(text):
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label(value)}"' for key, value in labels.items()) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+REGISTRY = Registry()
+
+HANDSHAKE_SECONDS = REGISTRY.histogram(
+    "legosec_handshake_seconds", "Peer handshake latency by mode and side", ("mode", "side")
+)
+HANDSHAKES = REGISTRY.counter(
+    "legosec_handshakes_total", "Peer handshakes by mode, side and result", ("mode", "side", "result")
+)
+HANDSHAKE_FALLBACKS = REGISTRY.counter(
+    "legosec_handshake_fallbacks_total", "Outbound ECDH handshakes that fell back to PSK"
+)
+KDC_CONNECT_SECONDS = REGISTRY.histogram("legosec_kdc_connect_seconds", "connect_to_kdc latency")
+KDC_CONNECTS = REGISTRY.counter("legosec_kdc_connects_total", "connect_to_kdc calls by result", ("result",))
+MESSAGES = REGISTRY.counter("legosec_messages_total", "Messages by direction", ("direction",))
+MESSAGE_BYTES = REGISTRY.counter("legosec_message_bytes_total", "Plaintext message bytes by direction", ("direction",))
+ACTIVE_SESSIONS = REGISTRY.gauge("legosec_active_sessions", "Authenticated listener sessions currently open")
+DB_SECONDS = REGISTRY.histogram(
+    "legosec_db_operation_seconds", "SQLite operation latency by operation", ("op",), buckets=DB_BUCKETS
+)
+
+_messages_sent = MESSAGES.labels(direction="sent")
+_messages_received = MESSAGES.labels(direction="received")
+_bytes_sent = MESSAGE_BYTES.labels(direction="sent")
+_bytes_received = MESSAGE_BYTES.labels(direction="received")
+
+
+def message_sent(size):
+    _messages_sent.inc()
+    _bytes_sent.inc(size)
+
+
+def message_received(size):
+    _messages_received.inc()
+    _bytes_received.inc(size)
+
+
+class HandshakeTimer:
+    """Times one handshake; ``done()`` records the latency, ``failed()`` a failure
+
+    Whichever is called first counts, so a failed() in an error path that
+    also covers the session after a successful handshake is harmless.
+    """
+
+    def __init__(self, mode, side):
+        self.mode = mode
+        self.side = side
+        self.start = time.perf_counter()
+        self.finished = False
+
+    def done(self):
+        if not self.finished:
+            self.finished = True
+            HANDSHAKE_SECONDS.labels(mode=self.mode, side=self.side).observe(time.perf_counter() - self.start)
+            HANDSHAKES.labels(mode=self.mode, side=self.side, result="ok").inc()
+
+    def failed(self):
+        if not self.finished:
+            self.finished = True
+            HANDSHAKES.labels(mode=self.mode, side=self.side, result="failed").inc()
+
+
+def snapshot(registry=None):
+    """Return the metrics of a registry, by default the package one, as a dict"""
+    return (registry or REGISTRY).snapshot()
+
+
+def prometheus_text(registry=None):
+    """Return the metrics of a registry in the Prometheus text format"""
+    return (registry or REGISTRY).prometheus_text()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.registry.prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port=9464, host="127.0.0.1", registry=None):
+    """Serve /metrics in the Prometheus text format from a daemon thread
+
+    Binds to localhost by default. Returns the server; call its shutdown()
+    to stop it. Port 0 picks a free port, see server.server_address.
+    """
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry or REGISTRY})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="legosec-metrics", daemon=True).start()
+    return server
@@ -0,0 +1,412 @@
+import asyncio
+import os
+import threading
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from OpenSSL.SSL import Connection, WantReadError, ZeroReturnError
+from legosec import log, metrics
+from legosec.sdk.records import RecordLayer
+from legosec.sdk import wire
+from legosec.sdk.resumption import RESUME_HELLO_SIZE, RESPONDER
+from legosec.sdk.streams import StreamReceiver, is_stream_start, FRAME_LENGTH, MAX_FRAME_SIZE
+
+# Both listeners dispatch on the fixed-size header (see wire.DISPATCH): v2
+# handshakes, resume hellos and v1 PEM public keys are recognised by their
+# first bytes, anything else is treated as a TLS-PSK ClientHello
+PEM_END = b"-----END PUBLIC KEY-----\n"
+BIO_READ_SIZE = 64 * 1024
+
+_listener_log = log.get_logger("listener")
+_handshake_log = log.get_logger("handshake")
+_message_log = log.get_logger("messages")
+
+
+@asynccontextmanager
+async def _open_sink_async(loop, executor, sdk, peer_id):
+    """Resolve and open a stream sink in the executor so file I/O stays off the event loop"""
+    sink = await loop.run_in_executor(executor, sdk._stream_sink, peer_id)
+    if isinstance(sink, (str, Path)):
+        f = await loop.run_in_executor(executor, open, sink, "wb")
+        try:
+            yield f
+        finally:
+            await loop.run_in_executor(executor, f.close)
+    else:
+        yield sink
+
+
+class _AsyncTLSConnection:
+    """Server-side TLS-PSK connection driven through memory BIOs on asyncio streams"""
+
+    def __init__(self, context, reader, writer, initial=b""):
+        self.conn = Connection(context, None)
+        self.conn.set_accept_state()
+        self.reader = reader
+        self.writer = writer
+        self._plain = bytearray()
+        if initial:
+            self.conn.bio_write(initial)
+
+    async def _flush(self):
+        while True:
+            try:
+                data = self.conn.bio_read(BIO_READ_SIZE)
+            except WantReadError:
+                break
+            if not data:
+                break
+            self.writer.write(data)
+        await self.writer.drain()
+
+    async def _feed(self):
+        data = await self.reader.read(BIO_READ_SIZE)
+        if not data:
+            return False
+        self.conn.bio_write(data)
+        return True
+
+    async def handshake(self, loop, executor):
+        """Run the handshake; OpenSSL work (and the PSK callback) runs in the executor"""
+        while True:
+            try:
+                await loop.run_in_executor(executor, self.conn.do_handshake)
+                await self._flush()
+                return
+            except WantReadError:
+                await self._flush()
+                if not await self._feed():
+                    raise ConnectionError("Connection closed during handshake")
+
+    async def recv(self, bufsize):
+        """Return up to bufsize bytes of application data; b'' once the peer closed"""
+        if self._plain:
+            data = bytes(self._plain[:bufsize])
+            del self._plain[:bufsize]
+            return data
+        while True:
+            try:
+                return self.conn.recv(bufsize)
+            except WantReadError:
+                await self._flush()
+                if not await self._feed():
+                    return b""
+            except ZeroReturnError:
+                return b""
+
+    async def readexactly(self, size):
+        while len(self._plain) < size:
+            try:
+                chunk = self.conn.recv(BIO_READ_SIZE)
+            except WantReadError:
+                await self._flush()
+                if not await self._feed():
+                    raise ConnectionError("Connection closed during stream")
+                continue
+            except ZeroReturnError:
+                raise ConnectionError("Connection closed during stream")
+            self._plain += chunk
+        data = bytes(self._plain[:size])
+        del self._plain[:size]
+        return data
+
+    async def send(self, data):
+        view = memoryview(data)
+        while view:
+            sent = self.conn.send(view)
+            view = view[sent:]
+        await self._flush()
+
+    def get_app_data(self):
+        return self.conn.get_app_data()
+
+
+class AsyncPeerListener:
+    """Peer listener running every connection as a coroutine on one event loop
+
+    Speaks exactly the same wire protocol as SecureChannelSDK.listen_for_peers.
+    Key generation, ECDH, the TLS handshake, authorization lookups and
+    stream sink writes run in a thread pool so slow crypto or disk I/O never
+    stalls other connections. An executor created here is shut down by stop().
+    """
+
+    def __init__(self, sdk, executor=None, handshake_timeout=10):
+        self.sdk = sdk
+        self._owns_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(
+            max_workers=min(32, (os.cpu_count() or 1) + 4),
+            thread_name_prefix="legosec-handshake"
+        )
+        self.handshake_timeout = handshake_timeout
+        self.active_connections = 0
+        self.server = None
+        self._loop = None
+        self._thread = None
+
+    async def start(self, port=6000, host='0.0.0.0'):
+        """Bind the listening socket and start accepting connections"""
+        self._loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_server(self._handle_connection, host, port, reuse_address=True)
+        await self._loop.run_in_executor(self.executor, self.sdk._update_peer_status, True)
+        _listener_log.info("Async listener ready on port %s", port)
+        self.sdk._log_activity('CONN', f'Async listener ready on port {port}')
+        self.sdk._send_notification('SYSTEM', f'Listener ready on port {port}')
+        return self.server
+
+    async def serve(self, port=6000, host='0.0.0.0'):
+        """Start the listener and serve until cancelled"""
+        if self.server is None:
+            await self.start(port, host)
+        async with self.server:
+            await self.server.serve_forever()
+
+    def start_in_thread(self, port=6000, host='0.0.0.0'):
+        """Run the listener on a dedicated event loop thread; returns once it is accepting"""
+        ready = threading.Event()
+        errors = []
+
+        def run():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            try:
+                loop.run_until_complete(self.start(port, host))
+            except Exception as e:
+                errors.append(e)
+                ready.set()
+                loop.close()
+                return
+            ready.set()
+            try:
+                loop.run_forever()
+            finally:
+                loop.close()
+
+        self._thread = threading.Thread(target=run, name="legosec-async-listener", daemon=True)
+        self._thread.start()
+        ready.wait()
+        if errors:
+            raise errors[0]
+        return self
+
+    def stats(self):
+        """Return live connection gauges"""
+        return {"active": self.active_connections}
+
+    def stop(self):
+        """Stop accepting connections and shut the event loop thread down"""
+        if self._loop is None or self.server is None:
+            self._shutdown_executor()
+            return
+
+        async def shutdown():
+            self.server.close()
+            await self.server.wait_closed()
+
+        if self._thread is not None:
+            asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result(timeout=5)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+        else:
+            self.server.close()
+        self.server = None
+        self.sdk._update_peer_status(False)
+        self._shutdown_executor()
+
+    def _shutdown_executor(self):
+        if self._owns_executor:
+            self.executor.shutdown(wait=False)
+
+    async def _handle_connection(self, reader, writer):
+        sdk = self.sdk
+        self.active_connections += 1
+        handshake = None
+        try:
+            peer = writer.get_extra_info("peername")
+            address = peer[0] if peer else 'unknown'
+            _listener_log.sampled('accept', log.DEBUG, "New connection from %s", address)
+            sdk._log_activity('CONN', f'New connection from {address}', sample='connection')
+            sdk._send_notification('NEW_PEER', f'New connection from {address}')
+            try:
+                first = await asyncio.wait_for(reader.readexactly(wire.HEADER_SIZE), self.handshake_timeout)
+            except asyncio.IncompleteReadError:
+                _listener_log.debug("Empty initial message - closing connection")
+                sdk._log_activity('ERR', 'Empty initial message - closing connection')
+                return
+
+            label, handler, mode = self._CONNECTION_HANDLERS[wire.connection_type(first)]
+            _listener_log.debug("Detected %s", label)
+            sdk._log_activity('CONN', f'Detected {label}', sample='connection')
+            handshake = metrics.HandshakeTimer(mode, "responder")
+            await getattr(self, handler)(reader, writer, first, handshake)
+        except Exception as e:
+            _listener_log.error("Connection handling failed: %.50s", e)
+            sdk._log_activity('ERR', f'Connection handling failed: {str(e)[:50]}')
+        finally:
+            self.active_connections -= 1
+            if handshake is not None:
+                # No-op once the handler has recorded a completed handshake
+                handshake.failed()
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    # Connection type from the fixed-size header -> (log label, handler, handshake metrics mode)
+    _CONNECTION_HANDLERS = {
+        wire.ECDH_V2: ("ECDH v2 connection", "_handle_ecdh_v2", "ecdh"),
+        wire.ECDH_V1: ("ECDH connection", "_handle_ecdh", "ecdh"),
+        wire.RESUME: ("session resumption", "_handle_resume", "resume"),
+        wire.PSK: ("PSK connection", "_handle_psk", "psk"),
+    }
+
+    async def _handle_ecdh_v2(self, reader, writer, first, handshake):
+        sdk = self.sdk
+        loop = asyncio.get_running_loop()
+        prefix = first + await asyncio.wait_for(
+            reader.readexactly(wire.HELLO_PREFIX_SIZE - len(first)), self.handshake_timeout
+        )
+        body = await asyncio.wait_for(reader.readexactly(wire.hello_body_size(prefix)), self.handshake_timeout)
+        client_id = await asyncio.wait_for(reader.readexactly(body[-1]), self.handshake_timeout)
+        reply, peer_id, session_key = await loop.run_in_executor(
+            self.executor, sdk._ecdh_v2_respond, prefix, body, client_id
+        )
+        writer.write(reply)
+        await writer.drain()
+        if session_key is None:
+            return
+
+        handshake.done()
+        _handshake_log.debug("Peer authenticated", peer=peer_id)
+        sdk._log_activity('AUTH', f'Peer {peer_id[:6]}... authenticated')
+        sdk._send_notification('NEW_PEER', f'Peer {peer_id[:6]}... authenticated')
+        await loop.run_in_executor(self.executor, sdk.session_tickets.issue, peer_id, session_key, RESPONDER)
+        await self._serve_records(reader, writer, session_key, peer_id)
+
+    async def _handle_ecdh(self, reader, writer, first, handshake):
+        sdk = self.sdk
+        loop = asyncio.get_running_loop()
+        peer_pubkey_data = first + await asyncio.wait_for(reader.readuntil(PEM_END), self.handshake_timeout)
+        our_pubkey_data, session_key = await loop.run_in_executor(
+            self.executor, sdk._ecdh_respond, peer_pubkey_data
+        )
+        writer.write(our_pubkey_data)
+        await writer.drain()
+
+        _handshake_log.debug("Requesting peer identity")
+        writer.write(b"IDENTIFY")
+        await writer.drain()
+        peer_id = (await asyncio.wait_for(reader.read(1024), 2)).decode().strip()
+        if not peer_id:
+            raise ValueError("Empty peer ID received")
+        authorized = await loop.run_in_executor(self.executor, sdk.identity_manager.is_peer_authorized, peer_id)
+        if not authorized:
+            _handshake_log.warning("Unauthorized peer", peer=peer_id)
+            sdk._log_activity('AUTH', f'Unauthorized peer: {peer_id[:6]}...')
+            raise ValueError("Peer authentication failed")
+
+        handshake.done()
+        _handshake_log.debug("Peer authenticated", peer=peer_id)
+        sdk._log_activity('AUTH', f'Peer {peer_id[:6]}... authenticated')
+        sdk._send_notification('NEW_PEER', f'Peer {peer_id[:6]}... authenticated')
+        sdk.session_keys[peer_id] = session_key
+        await loop.run_in_executor(self.executor, sdk.session_tickets.issue, peer_id, session_key, RESPONDER)
+        await self._serve_records(reader, writer, session_key, peer_id)
+
+    async def _handle_resume(self, reader, writer, first, handshake):
+        sdk = self.sdk
+        hello = first + await asyncio.wait_for(
+            reader.readexactly(RESUME_HELLO_SIZE - len(first)), self.handshake_timeout
+        )
+        reply, peer_id, session_key = await asyncio.get_running_loop().run_in_executor(
+            self.executor, sdk._accept_resume_hello, hello
+        )
+        writer.write(reply)
+        await writer.drain()
+        if session_key is not None:
+            handshake.done()
+            await self._serve_records(reader, writer, session_key, peer_id)
+
+    async def _serve_records(self, reader, writer, session_key, peer_id):
+        sdk = self.sdk
+        loop = asyncio.get_running_loop()
+        records = RecordLayer(session_key, initiator=False)
+
+        async def recv_record():
+            try:
+                header = await reader.readexactly(RecordLayer.HEADER_SIZE)
+            except asyncio.IncompleteReadError as e:
+                if e.partial:
+                    raise ConnectionError("Connection closed mid-record")
+                return None
+            body = await reader.readexactly(RecordLayer.body_length(header))
+            message = records.open(header, body)
+            metrics.message_received(len(message))
+            return message
+
+        async def send_record(data):
+            writer.writelines(records.seal(data))
+            await writer.drain()
+            metrics.message_sent(len(data))
+
+        metrics.ACTIVE_SESSIONS.inc()
+        try:
+            while True:
+                data = await recv_record()
+                if data is None:
+                    _message_log.debug("Connection closed by peer", peer=peer_id)
+                    sdk._log_activity('CONN', 'Connection closed by peer', sample='connection', peer=peer_id)
+                    return
+                if is_stream_start(data):
+                    async with _open_sink_async(loop, self.executor, sdk, peer_id) as sink:
+                        receiver = StreamReceiver(sink)
+                        summary = await loop.run_in_executor(self.executor, receiver.feed, data)
+                        while summary is None:
+                            frame = await recv_record()
+                            if frame is None:
+                                raise ConnectionError("Connection closed during stream")
+                            summary = await loop.run_in_executor(self.executor, receiver.feed, memoryview(frame))
+                    await send_record(sdk._stream_response(summary, peer_id))
+                    continue
+                await send_record(sdk._peer_message_response(data, peer_id))
+        finally:
+            metrics.ACTIVE_SESSIONS.dec()
+
+    async def _handle_psk(self, reader, writer, first, handshake):
+        sdk = self.sdk
+        loop = asyncio.get_running_loop()
+        tls = _AsyncTLSConnection(self.sdk.psk_contexts.server(), reader, writer, first)
+        await asyncio.wait_for(tls.handshake(loop, self.executor), self.handshake_timeout)
+        handshake.done()
+        # Set by _verify_peer during the handshake
+        peer_id = tls.get_app_data()
+        _handshake_log.debug("PSK handshake complete", peer=peer_id)
+        sdk._log_activity('PSK', 'PSK handshake complete', sample='connection', peer=peer_id)
+
+        metrics.ACTIVE_SESSIONS.inc()
+        try:
+            while True:
+                data = await tls.recv(1024)
+                if not data:
+                    _message_log.debug("Peer closed connection", peer=peer_id)
+                    sdk._log_activity('CONN', 'Peer closed connection', sample='connection', peer=peer_id)
+                    return
+                metrics.message_received(len(data))
+                if is_stream_start(data):
+                    tls._plain[:0] = data
+                    async with _open_sink_async(loop, self.executor, sdk, peer_id) as sink:
+                        receiver = StreamReceiver(sink)
+                        summary = None
+                        while summary is None:
+                            (length,) = FRAME_LENGTH.unpack(await tls.readexactly(FRAME_LENGTH.size))
+                            if length < 1 or length > MAX_FRAME_SIZE:
+                                raise ValueError(f"Invalid stream frame length: {length}")
+                            frame = memoryview(await tls.readexactly(length))
+                            summary = await loop.run_in_executor(self.executor, receiver.feed, frame)
+                    await tls.send(sdk._stream_response(summary, peer_id))
+                    continue
+                response = sdk._peer_message_response(data, peer_id)
+                await tls.send(response)
+                metrics.message_sent(len(response))
+        finally:
+            metrics.ACTIVE_SESSIONS.dec()
@@ -0,0 +1,205 @@
+import hashlib
+import os
+import socket
+import threading
+import time
+from cryptography.hazmat.primitives import serialization
+from legosec import log
+
+_log = log.get_logger("kdc")
+
+DEFAULT_ENDPOINTS = [("127.0.0.1", 5000)]
+
+
+class KDCKeyMismatch(ValueError):
+    """The KDC presented a public key other than the pinned or cached one"""
+
+
+def fingerprint(pem):
+    """SHA-256 hex fingerprint of a PEM public key, ignoring surrounding whitespace"""
+    return hashlib.sha256(pem.strip()).hexdigest()
+
+
+class KDCKeyCache:
+    """The KDC public key, kept on disk and pinned by fingerprint
+
+    The KDC still sends its key on every connection, but a key whose
+    fingerprint matches the cached one is not parsed again. With an explicit
+    ``pinned`` fingerprint any other key is refused; without one the first
+    key seen is trusted and cached. A different key later on is refused
+    too: rotating the KDC key takes rotate() with the new key, or a pin
+    naming it. The cached key also lets identity renewals run before, or
+    without, a KDC connection in this process.
+    """
+
+    def __init__(self, path, pinned=None):
+        self.path = str(path)
+        self.pinned = pinned.lower() if pinned else None
+        self._lock = threading.Lock()
+        self._pem = None
+        self._key = None
+        self._fingerprint = None
+        self._loaded = False
+        self.stats = {"hits": 0, "parsed": 0, "rotations": 0}
+
+    def _load_locked(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with open(self.path, "rb") as f:
+                pem = f.read()
+        except FileNotFoundError:
+            return
+        if self.pinned and fingerprint(pem) != self.pinned:
+            _log.warning("Ignoring cached KDC key that does not match the pinned fingerprint")
+            return
+        self._pem = pem
+        self._fingerprint = fingerprint(pem)
+
+    def key(self):
+        """Return the cached KDC public key, or None before the first contact"""
+        with self._lock:
+            self._load_locked()
+            if self._key is None and self._pem is not None:
+                self._key = serialization.load_pem_public_key(self._pem)
+                self.stats["parsed"] += 1
+            return self._key
+
+    def accept(self, pem):
+        """Check the key a KDC sent and return it parsed; raises KDCKeyMismatch for an unexpected key"""
+        received = fingerprint(pem)
+        with self._lock:
+            self._load_locked()
+            if received == self._fingerprint and self._key is not None:
+                self.stats["hits"] += 1
+                return self._key
+            if self.pinned and received != self.pinned:
+                raise KDCKeyMismatch("KDC public key does not match the pinned fingerprint")
+            if not self.pinned and self._fingerprint is not None and received != self._fingerprint:
+                _log.error("KDC public key changed; refusing it until rotate() is called with the new key")
+                raise KDCKeyMismatch("KDC public key does not match the cached key")
+            return self._store_locked(pem, received)
+
+    def rotate(self, pem):
+        """Replace the trusted KDC key with a new one obtained out of band
+
+        A pinned fingerprint still applies: the new key must match it.
+        """
+        received = fingerprint(pem)
+        with self._lock:
+            self._load_locked()
+            if self.pinned and received != self.pinned:
+                raise KDCKeyMismatch("KDC public key does not match the pinned fingerprint")
+            return self._store_locked(pem, received)
+
+    def _store_locked(self, pem, received):
+        key = serialization.load_pem_public_key(pem)
+        self.stats["parsed"] += 1
+        if received != self._fingerprint:
+            if self._fingerprint is not None:
+                _log.warning("KDC public key rotated")
+                self.stats["rotations"] += 1
+            self._write(pem)
+        self._pem, self._key, self._fingerprint = pem, key, received
+        return key
+
+    def _write(self, pem):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(pem)
+        os.replace(tmp_path, self.path)
+
+
+class KDCClient:
+    """KDC exchanges over a list of endpoints with health-based failover
+
+    Endpoints are tried with a short connect timeout, the last one that
+    worked first. An endpoint that fails is skipped for ``down_time``
+    seconds, doubling with each further failure up to ``max_down_time``;
+    when every endpoint is marked down they are all tried anyway, soonest
+    recovery first. The client lives as long as the SDK, so endpoint health
+    and the parsed KDC key carry over from one renewal to the next.
+    """
+
+    def __init__(self, endpoints, key_cache, connect_timeout=3.0, timeout=10.0, down_time=5.0, max_down_time=120.0):
+        self.endpoints = [tuple(endpoint) for endpoint in (endpoints or DEFAULT_ENDPOINTS)]
+        if not self.endpoints:
+            raise ValueError("At least one KDC endpoint is required")
+        self.key_cache = key_cache
+        self.connect_timeout = connect_timeout
+        self.timeout = timeout
+        self.down_time = down_time
+        self.max_down_time = max_down_time
+        self._lock = threading.Lock()
+        self._preferred = self.endpoints[0]
+        self._health = {endpoint: {"failures": 0, "down_until": 0.0, "latency": None} for endpoint in self.endpoints}
+        self.stats = {"exchanges": 0, "failovers": 0}
+
+    def candidates(self):
+        """Endpoints in the order the next exchange tries them"""
+        now = time.monotonic()
+        with self._lock:
+            up = [e for e in self.endpoints if self._health[e]["down_until"] <= now]
+            down = sorted((e for e in self.endpoints if e not in up), key=lambda e: self._health[e]["down_until"])
+            if self._preferred in up:
+                up.remove(self._preferred)
+                up.insert(0, self._preferred)
+        return up + down
+
+    def exchange(self, handler):
+        """Run handler(sock, kdc_public_key) against the first KDC that completes it
+
+        Returns the handler's result. Raises ConnectionError when every
+        endpoint failed, chained to the last failure.
+        """
+        last_error = None
+        for attempt, endpoint in enumerate(self.candidates()):
+            if attempt:
+                self.stats["failovers"] += 1
+                _log.warning("Failing over to KDC %s:%s", endpoint[0], endpoint[1])
+            start = time.monotonic()
+            try:
+                with socket.create_connection(endpoint, timeout=self.connect_timeout) as sock:
+                    sock.settimeout(self.timeout)
+                    pem = sock.recv(4096)
+                    if not pem:
+                        raise ConnectionError("Empty public key received from KDC")
+                    result = handler(sock, self.key_cache.accept(pem))
+            except (OSError, ValueError) as e:
+                _log.error("KDC %s:%s failed: %.50s", endpoint[0], endpoint[1], e)
+                self._mark_failed(endpoint)
+                last_error = e
+                continue
+            self._mark_healthy(endpoint, time.monotonic() - start)
+            self.stats["exchanges"] += 1
+            return result
+        raise ConnectionError("No KDC endpoint completed the exchange") from last_error
+
+    def _mark_failed(self, endpoint):
+        with self._lock:
+            health = self._health[endpoint]
+            health["failures"] += 1
+            down_for = min(self.max_down_time, self.down_time * 2 ** (health["failures"] - 1))
+            health["down_until"] = time.monotonic() + down_for
+
+    def _mark_healthy(self, endpoint, latency):
+        with self._lock:
+            health = self._health[endpoint]
+            health["failures"] = 0
+            health["down_until"] = 0.0
+            health["latency"] = latency
+            self._preferred = endpoint
+
+    def health(self):
+        """Return {"host:port": {"failures", "down", "latency"}} for every endpoint"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                f"{host}:{port}": {
+                    "failures": health["failures"],
+                    "down": health["down_until"] > now,
+                    "latency": health["latency"],
+                }
+                for (host, port), health in self._health.items()
+            }
@@ -0,0 +1,133 @@
+import threading
+import time
+from collections import deque
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+
+def generate_ephemeral_key(curve=ec.SECP384R1):
+    """Return (private key, PEM public key, compressed public point) for one ECDH handshake
+
+    The PEM form is what v1 peers exchange, the compressed point what v2 peers do.
+    """
+    private_key = ec.generate_private_key(curve())
+    public_key = private_key.public_key()
+    public_pem = public_key.public_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    public_point = public_key.public_bytes(
+        encoding=serialization.Encoding.X962,
+        format=serialization.PublicFormat.CompressedPoint
+    )
+    return private_key, public_pem, public_point
+
+
+class EphemeralKeyPool:
+    """Ready-made ephemeral ECDH key pairs so handshakes do not generate keys inline
+
+    A worker thread keeps up to ``depth`` key pairs ready, each with its PEM
+    public key and compressed point already serialized, and refills once the pool drops to
+    ``low_water``. ``take()`` removes a key pair from the pool, so a key is
+    handed out at most once. When the pool is empty the key is generated
+    inline and counted as a miss.
+
+    The worker only starts on the first ``take()`` (or ``start()``), so an
+    SDK that never runs an ECDH handshake generates no keys.
+    """
+
+    def __init__(self, depth=8, low_water=2, curve=ec.SECP384R1, name="legosec-ecdh-keypool"):
+        if depth < 0 or low_water < 0 or (depth and low_water >= depth):
+            raise ValueError("depth must be non-negative and low_water below depth")
+
+        self.depth = depth
+        self.low_water = low_water
+        self.curve = curve
+        self.name = name
+        self._keys = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = None
+        self.stats = {"hits": 0, "misses": 0, "generated": 0, "refills": 0}
+
+    def start(self):
+        """Start the refill worker ahead of the first handshake"""
+        with self._cond:
+            self._start_locked()
+        return self
+
+    def _start_locked(self):
+        if self._thread is None and self.depth and not self._closed:
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def take(self):
+        """Return (private key, PEM public key, compressed point); never handed out again"""
+        with self._cond:
+            self._start_locked()
+            if self._keys:
+                key = self._keys.popleft()
+                self.stats["hits"] += 1
+            else:
+                key = None
+                self.stats["misses"] += 1
+            if len(self._keys) <= self.low_water:
+                self._cond.notify_all()
+        if key is None:
+            key = generate_ephemeral_key(self.curve)
+        return key
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed and len(self._keys) > self.low_water:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                missing = self.depth - len(self._keys)
+                self.stats["refills"] += 1
+
+            # Generate outside the lock so take() is never blocked behind key generation
+            for _ in range(missing):
+                key = generate_ephemeral_key(self.curve)
+                with self._cond:
+                    if self._closed:
+                        return
+                    self.stats["generated"] += 1
+                    if len(self._keys) >= self.depth:
+                        break
+                    self._keys.append(key)
+                    self._cond.notify_all()
+
+    def wait_ready(self, timeout=None):
+        """Start the worker and block until the pool is full; returns False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._start_locked()
+            while len(self._keys) < self.depth and not self._closed:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return len(self._keys) >= self.depth
+
+    def snapshot(self):
+        """Return hit/miss counters and the number of key pairs ready"""
+        with self._cond:
+            takes = self.stats["hits"] + self.stats["misses"]
+            return dict(
+                self.stats,
+                hit_ratio=self.stats["hits"] / takes if takes else 0.0,
+                ready=len(self._keys),
+                depth=self.depth,
+                low_water=self.low_water
+            )
+
+    def close(self, timeout=1.0):
+        """Stop the refill worker and drop the unused key pairs"""
+        with self._cond:
+            self._closed = True
+            self._keys.clear()
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
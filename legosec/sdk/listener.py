@@ -0,0 +1,371 @@
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+from legosec import log
+
+_log = log.get_logger("listener")
+
+
+class ConnectionWorkerPool:
+    """Fixed set of worker threads serving accepted connections from a bounded queue
+
+    At most ``workers`` connections are handled at once and at most
+    ``max_pending`` wait for a worker. When the queue is full the overload
+    policy decides: "queue" waits up to ``queue_timeout`` for room, "reject"
+    closes the new connection straight away. Connections that waited longer
+    than ``queue_timeout`` are rejected instead of served late.
+
+    Sessions parked by an IdleConnectionParker come back through
+    ``resume()``; they were admitted already, so they are never rejected.
+    If the pool shuts down first, their ``close`` teardown runs instead.
+    """
+
+    OVERLOAD_POLICIES = ("queue", "reject")
+
+    def __init__(self, handler, workers=32, max_pending=128, overload_policy="queue",
+                 queue_timeout=5.0, name="legosec-peer-worker"):
+        if overload_policy not in self.OVERLOAD_POLICIES:
+            raise ValueError(f"Unknown overload policy: {overload_policy}")
+        if workers < 1 or max_pending < 0:
+            raise ValueError("workers must be positive and max_pending non-negative")
+
+        self.handler = handler
+        self.workers = workers
+        self.max_pending = max_pending
+        self.overload_policy = overload_policy
+        self.queue_timeout = queue_timeout
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._idle = 0
+        self._closed = False
+        self.stats = {"queued": 0, "active": 0, "accepted": 0, "completed": 0,
+                      "rejected": 0, "expired": 0, "resumed": 0}
+
+        self._threads = [
+            threading.Thread(target=self._run, name=f"{name}-{index}", daemon=True)
+            for index in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, conn, addr=None):
+        """Hand a connection to the pool; returns False if it was rejected and closed"""
+        with self._cond:
+            if not self._closed and not self._has_room():
+                if self.overload_policy == "queue":
+                    deadline = None if self.queue_timeout is None else time.monotonic() + self.queue_timeout
+                    while not self._has_room() and not self._closed:
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+
+            if self._closed or not self._has_room():
+                self.stats["rejected"] += 1
+                accepted = False
+            else:
+                self._queue.append((conn, None, time.monotonic(), None))
+                self.stats["accepted"] += 1
+                self.stats["queued"] = len(self._queue)
+                self._cond.notify_all()
+                accepted = True
+
+        if not accepted:
+            _close_quietly(conn)
+        return accepted
+
+    def resume(self, conn, callback, close=None):
+        """Queue callback() for a parked session that has data again; False if shut down"""
+        with self._cond:
+            if self._closed:
+                resumed = False
+            else:
+                self._queue.append((conn, callback, None, close))
+                self.stats["resumed"] += 1
+                self.stats["queued"] = len(self._queue)
+                self._cond.notify_all()
+                resumed = True
+        if not resumed:
+            _close_session(conn, close)
+        return resumed
+
+    def _has_room(self):
+        # An idle worker takes the connection at once, so it never counts against max_pending
+        return len(self._queue) < self.max_pending + self._idle
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._idle += 1
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                self._idle -= 1
+                if not self._queue:
+                    return
+                conn, callback, enqueued_at, _ = self._queue.popleft()
+                self.stats["queued"] = len(self._queue)
+                # Room freed up for a producer waiting under the "queue" policy
+                self._cond.notify_all()
+
+                if (enqueued_at is not None and self.queue_timeout is not None
+                        and time.monotonic() - enqueued_at > self.queue_timeout):
+                    self.stats["expired"] += 1
+                    self.stats["rejected"] += 1
+                    expired = True
+                else:
+                    self.stats["active"] += 1
+                    expired = False
+
+            if expired:
+                _close_quietly(conn)
+                continue
+
+            try:
+                if callback is None:
+                    self.handler(conn)
+                else:
+                    callback()
+            except Exception as e:
+                _log.error("Connection handler failed: %.50s", e)
+                _close_quietly(conn)
+            finally:
+                with self._cond:
+                    self.stats["active"] -= 1
+                    self.stats["completed"] += 1
+
+    def snapshot(self):
+        """Return a consistent copy of the pool gauges and counters"""
+        with self._cond:
+            return dict(self.stats, workers=self.workers, max_pending=self.max_pending)
+
+    def shutdown(self, timeout=5.0):
+        """Reject queued connections and stop the workers once they finish"""
+        with self._cond:
+            self._closed = True
+            pending, self._queue = list(self._queue), deque()
+            self.stats["rejected"] += len(pending)
+            self.stats["queued"] = 0
+            self._cond.notify_all()
+        for conn, _, _, close in pending:
+            _close_session(conn, close)
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0, deadline - time.monotonic()))
+
+
+class IdleConnectionParker:
+    """Watches idle sessions on one selector thread so they do not hold a worker
+
+    A session handler that has answered every message it has calls
+    ``park(conn, callback, close)`` and returns. Once the connection is
+    readable again (new data or the peer closing), callback() is queued on
+    the worker pool. Sessions parked longer than ``idle_timeout`` seconds,
+    or still parked at shutdown, are ended with close(), the session's own
+    teardown, or by closing conn when there is none.
+    """
+
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, pool, idle_timeout=300.0, name="legosec-idle-parker"):
+        self.pool = pool
+        self.idle_timeout = idle_timeout
+        self._selector = selectors.DefaultSelector()
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ)
+        self._incoming = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self.stats = {"parked": 0, "idle_closed": 0}
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def park(self, conn, callback, close=None):
+        """Hand an idle session to the parker; callback() runs on a worker when it is readable"""
+        with self._lock:
+            if not self._closed:
+                self._incoming.append((conn, callback, time.monotonic(), close))
+                parked = True
+            else:
+                parked = False
+        if not parked:
+            _close_session(conn, close)
+            return
+        try:
+            self._wakeup_w.send(b"\0")
+        except OSError:
+            pass
+
+    def _run(self):
+        while True:
+            events = self._selector.select(self.POLL_INTERVAL)
+            with self._lock:
+                incoming, self._incoming = self._incoming, []
+                closed = self._closed
+            if closed:
+                break
+
+            for conn, callback, parked_at, close in incoming:
+                try:
+                    self._selector.register(conn.fileno(), selectors.EVENT_READ,
+                                            (conn, callback, parked_at, close))
+                except (OSError, ValueError):
+                    _close_session(conn, close)
+            for key, _ in events:
+                if key.fileobj is self._wakeup_r:
+                    try:
+                        self._wakeup_r.recv(4096)
+                    except OSError:
+                        pass
+                    continue
+                self._selector.unregister(key.fileobj)
+                conn, callback, _, close = key.data
+                self.pool.resume(conn, callback, close)
+
+            if self.idle_timeout is not None:
+                now = time.monotonic()
+                for key in list(self._selector.get_map().values()):
+                    if key.data is not None and now - key.data[2] > self.idle_timeout:
+                        self._selector.unregister(key.fileobj)
+                        self.stats["idle_closed"] += 1
+                        _close_session(key.data[0], key.data[3])
+            self.stats["parked"] = len(self._selector.get_map()) - 1
+
+        for key in list(self._selector.get_map().values()):
+            if key.data is not None:
+                _close_session(key.data[0], key.data[3])
+        for conn, _, _, close in incoming:
+            _close_session(conn, close)
+        self._selector.close()
+        self._wakeup_r.close()
+        self._wakeup_w.close()
+
+    def snapshot(self):
+        return dict(self.stats)
+
+    def close(self, timeout=5.0):
+        """Close every parked session and stop the selector thread"""
+        with self._lock:
+            self._closed = True
+        try:
+            self._wakeup_w.send(b"\0")
+        except OSError:
+            pass
+        self._thread.join(timeout)
+
+
+class ThreadedPeerListener:
+    """Blocking accept loop feeding a ConnectionWorkerPool
+
+    Accept errors such as running out of file descriptors are logged and
+    retried with backoff instead of ending the loop. Between messages,
+    sessions are parked on an IdleConnectionParker rather than holding a
+    worker, so ``workers`` bounds concurrent requests, not open connections
+    (pooled clients keep theirs open for up to a minute).
+    """
+
+    ACCEPT_POLL_INTERVAL = 0.5
+    MAX_ACCEPT_BACKOFF = 1.0
+
+    def __init__(self, sdk, port=6000, host='0.0.0.0', backlog=128, workers=32, max_pending=128,
+                 overload_policy="queue", queue_timeout=5.0, idle_timeout=300.0):
+        self.sdk = sdk
+        self.port = port
+        self.host = host
+        self.backlog = backlog
+        self.pool = ConnectionWorkerPool(
+            self._handle, workers=workers, max_pending=max_pending,
+            overload_policy=overload_policy, queue_timeout=queue_timeout
+        )
+        self.parker = IdleConnectionParker(self.pool, idle_timeout=idle_timeout)
+        self.accept_errors = 0
+        self._socket = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Bind and listen, run the accept loop on a daemon thread and mark the SDK ready"""
+        s = socket.socket()
+        try:
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            s.bind((self.host, self.port))
+            s.listen(self.backlog)
+            s.settimeout(self.ACCEPT_POLL_INTERVAL)
+        except Exception:
+            s.close()
+            self.parker.close(timeout=0)
+            self.pool.shutdown(timeout=0)
+            raise
+        self._socket = s
+        self.port = s.getsockname()[1]
+        self._thread = threading.Thread(target=self._accept_loop, name="legosec-listener", daemon=True)
+        self._thread.start()
+        self.sdk._update_peer_status(True)
+        return self
+
+    def _handle(self, conn):
+        self.sdk._handle_incoming_connection(conn, park=self.parker.park)
+
+    def _accept_loop(self):
+        sdk = self.sdk
+        backoff = 0.01
+        while not self._stopped.is_set():
+            try:
+                conn, addr = self._socket.accept()
+            except socket.timeout:
+                continue
+            except OSError as e:
+                if self._stopped.is_set():
+                    break
+                self.accept_errors += 1
+                _log.error("Listener accept error: %.50s", e)
+                sdk._log_activity('ERR', f'Listener accept error: {str(e)[:50]}')
+                self._stopped.wait(backoff)
+                backoff = min(backoff * 2, self.MAX_ACCEPT_BACKOFF)
+                continue
+            backoff = 0.01
+            conn.settimeout(None)
+            _log.sampled('accept', log.DEBUG, "New connection from %s", addr[0])
+            sdk._log_activity('CONN', f'New connection from {addr[0]}', sample='connection')
+            sdk._send_notification('NEW_PEER', f'New connection from {addr[0]}')
+            if not self.pool.submit(conn, addr):
+                _log.sampled('rejected', log.WARNING, "Listener overloaded, rejected connection from %s", addr[0])
+                sdk._log_activity('ERR', f'Listener overloaded, rejected connection from {addr[0]}', sample='rejected')
+
+    def stats(self):
+        """Return live gauges: queued, active, parked and rejected connections plus counters"""
+        return dict(self.pool.snapshot(), **self.parker.snapshot(),
+                    accept_errors=self.accept_errors, backlog=self.backlog)
+
+    def stop(self, timeout=5.0):
+        """Stop accepting, mark the SDK not ready, reject queued connections and wait for active handlers"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self._socket is not None:
+            self._socket.close()
+            self.sdk._update_peer_status(False)
+        self.parker.close(timeout)
+        self.pool.shutdown(timeout)
+
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+def _close_session(conn, close=None):
+    """End a parked session through its own teardown, or just close it"""
+    if close is None:
+        _close_quietly(conn)
+        return
+    try:
+        close()
+    except Exception as e:
+        _log.error("Session teardown failed: %.50s", e)
+        _close_quietly(conn)
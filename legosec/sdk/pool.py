@@ -0,0 +1,174 @@
+import select
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class _PooledConnection:
+    __slots__ = ("conn", "key", "created_at", "last_used")
+
+    def __init__(self, conn, key):
+        self.conn = conn
+        self.key = key
+        self.created_at = self.last_used = time.monotonic()
+
+
+class PeerConnectionPool:
+    """Keeps authenticated peer connections open for reuse, keyed by (peer_id, host, port)
+
+    ``connect(peer_id, host, port)`` opens a new connection on a miss. Idle
+    connections are dropped after ``max_idle_time`` seconds and every
+    connection after ``max_lifetime`` seconds; a connection is also checked
+    for a peer-side close before it is handed out again. At most
+    ``max_idle_per_peer`` idle connections are kept per key.
+    """
+
+    def __init__(self, connect, max_idle_per_peer=4, max_idle_time=60.0, max_lifetime=600.0):
+        self._connect = connect
+        self.max_idle_per_peer = max_idle_per_peer
+        self.max_idle_time = max_idle_time
+        self.max_lifetime = max_lifetime
+        self._idle = {}
+        self._leased = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "unhealthy": 0, "discarded": 0}
+
+    def acquire(self, peer_id, host='127.0.0.1', port=6000):
+        """Return a live connection to the peer, reusing an idle one when possible"""
+        key = (peer_id, host, port)
+        stale = []
+        entry = None
+        with self._lock:
+            idle = self._idle.get(key)
+            while idle:
+                candidate = idle.pop()
+                if self._expired(candidate):
+                    self.stats["expired"] += 1
+                    stale.append(candidate.conn)
+                elif not _is_healthy(candidate.conn):
+                    self.stats["unhealthy"] += 1
+                    stale.append(candidate.conn)
+                else:
+                    entry = candidate
+                    break
+            if entry is not None:
+                self.stats["hits"] += 1
+                self._leased[id(entry.conn)] = entry
+            else:
+                self.stats["misses"] += 1
+        for conn in stale:
+            _close_quietly(conn)
+
+        if entry is None:
+            entry = _PooledConnection(self._connect(peer_id, host, port), key)
+            with self._lock:
+                self._leased[id(entry.conn)] = entry
+        return entry.conn
+
+    def release(self, conn):
+        """Return a leased connection; it is closed instead if the pool cannot keep it"""
+        with self._lock:
+            entry = self._leased.pop(id(conn), None)
+            keep = entry is not None and not self._closed and not self._expired(entry)
+            if keep:
+                idle = self._idle.setdefault(entry.key, deque())
+                keep = len(idle) < self.max_idle_per_peer
+                if keep:
+                    entry.last_used = time.monotonic()
+                    idle.append(entry)
+        if not keep:
+            _close_quietly(conn)
+
+    def discard(self, conn):
+        """Close a leased connection that failed instead of returning it to the pool"""
+        with self._lock:
+            self._leased.pop(id(conn), None)
+            self.stats["discarded"] += 1
+        _close_quietly(conn)
+
+    @contextmanager
+    def connection(self, peer_id, host='127.0.0.1', port=6000):
+        """Lease a connection for a block; it is discarded if the block raises"""
+        conn = self.acquire(peer_id, host, port)
+        try:
+            yield conn
+        except BaseException:
+            self.discard(conn)
+            raise
+        self.release(conn)
+
+    def _expired(self, entry):
+        now = time.monotonic()
+        return (now - entry.created_at > self.max_lifetime
+                or now - entry.last_used > self.max_idle_time)
+
+    def prune(self):
+        """Close idle connections past their idle time or lifetime"""
+        stale = []
+        with self._lock:
+            for key, idle in list(self._idle.items()):
+                keep = deque()
+                for entry in idle:
+                    if self._expired(entry):
+                        self.stats["expired"] += 1
+                        stale.append(entry.conn)
+                    else:
+                        keep.append(entry)
+                if keep:
+                    self._idle[key] = keep
+                else:
+                    del self._idle[key]
+        for conn in stale:
+            _close_quietly(conn)
+        return len(stale)
+
+    def snapshot(self):
+        """Return hit/miss counters and the number of idle and leased connections"""
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return dict(
+                self.stats,
+                hit_ratio=self.stats["hits"] / lookups if lookups else 0.0,
+                idle=sum(len(idle) for idle in self._idle.values()),
+                leased=len(self._leased)
+            )
+
+    def close(self):
+        """Close every idle connection; leased ones are closed when released"""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, {}
+        for entries in idle.values():
+            for entry in entries:
+                _close_quietly(entry.conn)
+
+
+def _is_healthy(conn):
+    """An idle connection must have nothing to read: data or EOF means it is unusable"""
+    try:
+        if getattr(conn, "has_buffered_data", lambda: False)():
+            return False
+        if hasattr(conn, "pending") and conn.pending():
+            return False
+        fd = conn.fileno()
+        if fd < 0:
+            return False
+        if not hasattr(select, "poll"):
+            # Windows: select() limits the number of sockets, not their values
+            readable, _, errored = select.select([fd], [], [fd], 0)
+            return not readable and not errored
+        # poll(), since select() refuses descriptors at or above FD_SETSIZE (1024)
+        poller = select.poll()
+        poller.register(fd, select.POLLIN | select.POLLPRI)
+        return not poller.poll(0)
+    except (OSError, ValueError):
+        return False
+
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
@@ -0,0 +1,172 @@
+import os
+import sqlite3
+import threading
+import time
+from legosec import log, metrics
+
+_log = log.get_logger("psk")
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def _pair(a, b):
+    # A shared PSK is symmetric, so both directions use one entry
+    return (a, b) if a <= b else (b, a)
+
+
+class SharedPSKCache:
+    """In-memory shared PSKs per peer pair, backed by the psk_exchange table
+
+    ``store`` and ``store_many`` write both directions in one transaction,
+    update the cache and wake every waiter for the pairs. ``get`` never
+    blocks: it answers from memory and falls back to a single primary key
+    read, so it is safe on the TLS callback path. ``wait`` blocks on a condition variable; PSKs
+    stored by other processes are seen by re-reading the table on a backoff
+    schedule. Cached entries are dropped when ``PRAGMA data_version`` shows
+    another connection wrote to the database, checked at most once per
+    ``revalidate_interval``.
+    """
+
+    def __init__(self, db, revalidate_interval=1.0):
+        self.db = db
+        self.revalidate_interval = revalidate_interval
+        self._psks = {}
+        self._cond = threading.Condition()
+        self._conn = None
+        self._data_version = None
+        self._next_check = 0.0
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "waits": 0, "wakeups": 0, "revalidations": 0}
+
+    def _connection(self):
+        # Dedicated connection so data_version reflects commits from every other connection
+        if self._conn is None:
+            self.db.ensure_schema()
+            self._conn = sqlite3.connect(self.db.db_path, isolation_level=None, check_same_thread=False)
+            self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        return self._conn
+
+    def store(self, client_id, peer_id, psk):
+        """Replace the PSK shared by client_id and peer_id in both directions"""
+        self.store_many(client_id, {peer_id: psk})
+
+    def store_many(self, client_id, psks, chunk_size=None):
+        """Upsert {peer_id: psk} in both directions with executemany
+
+        Everything goes in one transaction, or one per ``chunk_size`` peers so
+        that provisioning a whole fleet does not hold the write lock throughout.
+        """
+        items = list(psks.items())
+        chunk_size = chunk_size or len(items) or 1
+        for start in range(0, len(items), chunk_size):
+            chunk = items[start:start + chunk_size]
+            rows = []
+            for peer_id, psk in chunk:
+                rows.append((client_id, peer_id, psk))
+                rows.append((peer_id, client_id, psk))
+            with self.db.transaction() as conn:
+                conn.executemany("""
+                    INSERT OR REPLACE INTO psk_exchange
+                    (from_id, to_id, shared_psk)
+                    VALUES (?, ?, ?)
+                """, rows)
+            with self._cond:
+                for peer_id, psk in chunk:
+                    self._psks[_pair(client_id, peer_id)] = psk
+                self.stats["stores"] += len(chunk)
+                self._cond.notify_all()
+
+    def get(self, client_id, peer_id):
+        """Return the shared PSK or None without waiting"""
+        self._revalidate()
+        key = _pair(client_id, peer_id)
+        psk = self._psks.get(key)
+        if psk is not None:
+            self.stats["hits"] += 1
+            return psk
+        self.stats["misses"] += 1
+        row = self.db.fetchone("""
+            SELECT shared_psk FROM psk_exchange
+            WHERE (from_id = ? AND to_id = ?)
+            OR (from_id = ? AND to_id = ?)
+        """, (peer_id, client_id, client_id, peer_id))
+        if row is None:
+            return None
+        with self._cond:
+            # A concurrent store wins over what we read
+            return self._psks.setdefault(key, row[0])
+
+    def wait(self, client_id, peer_id, backoff):
+        """Block until the pair has a PSK; returns None once backoff's deadline passes"""
+        key = _pair(client_id, peer_id)
+        self.stats["waits"] += 1
+        while True:
+            psk = self.get(client_id, peer_id)
+            if psk is not None:
+                return psk
+            delay = backoff.next_delay()
+            if delay is None:
+                return None
+            with self._cond:
+                if key not in self._psks and self._cond.wait(delay):
+                    self.stats["wakeups"] += 1
+
+    def invalidate(self, client_id=None, peer_id=None):
+        """Drop the cached PSK for one pair, or all of them"""
+        with self._cond:
+            if client_id is None:
+                self._psks.clear()
+            else:
+                self._psks.pop(_pair(client_id, peer_id), None)
+
+    def _revalidate(self):
+        if time.monotonic() < self._next_check:
+            return
+        with self._cond:
+            if time.monotonic() < self._next_check:
+                return
+            self._next_check = time.monotonic() + self.revalidate_interval
+            try:
+                data_version = self._connection().execute("PRAGMA data_version").fetchone()[0]
+            except sqlite3.Error as e:
+                _log.error("PSK cache revalidation failed: %.50s", e)
+                self._psks.clear()
+                return
+            if data_version != self._data_version:
+                self._data_version = data_version
+                if self._psks:
+                    self.stats["revalidations"] += 1
+                    self._psks.clear()
+
+    def close(self):
+        with self._cond:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._psks.clear()
+
+
+def get_psk_cache(db):
+    """Return the process-wide SharedPSKCache for a Database"""
+    key = os.path.abspath(db.db_path)
+    cache = _registry.get(key)
+    if cache is None:
+        with _registry_lock:
+            cache = _registry.get(key)
+            if cache is None:
+                cache = SharedPSKCache(db)
+                _registry[key] = cache
+    return cache
+
+
+def _collect_metrics():
+    """Shared PSK lookups summed over every cache in the process"""
+    caches = list(_registry.values())
+    help = "Shared PSK lookups answered from memory (hit) or the database (miss)"
+    yield ("legosec_psk_cache_lookups_total", "counter", help,
+           {"result": "hit"}, sum(cache.stats["hits"] for cache in caches))
+    yield ("legosec_psk_cache_lookups_total", "counter", help,
+           {"result": "miss"}, sum(cache.stats["misses"] for cache in caches))
+
+
+metrics.REGISTRY.register_collector(_collect_metrics)
@@ -0,0 +1,108 @@
+import os
+import random
+import threading
+import time
+from datetime import datetime
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+class Backoff:
+    """Capped exponential backoff with jitter and an overall deadline
+
+    Delays grow from ``initial`` by ``multiplier`` up to ``maximum``; each one
+    is drawn from the upper half of its step (equal jitter) so retries from
+    many clients spread out without ever collapsing to zero. No delay runs
+    past ``deadline`` (a time.monotonic() value).
+    """
+
+    def __init__(self, initial=0.05, maximum=2.0, multiplier=2.0, deadline=None):
+        self.initial = initial
+        self.maximum = maximum
+        self.multiplier = multiplier
+        self.deadline = deadline
+        self.attempts = 0
+
+    def remaining(self):
+        """Seconds left before the deadline; None without one"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def next_delay(self):
+        """Return the next delay, or None once the deadline has passed"""
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            return None
+        step = min(self.maximum, self.initial * self.multiplier ** self.attempts)
+        self.attempts += 1
+        delay = step / 2 + random.uniform(0, step / 2)
+        return delay if remaining is None else min(delay, remaining)
+
+    def sleep(self):
+        """Sleep for the next delay; returns False instead once the deadline has passed"""
+        delay = self.next_delay()
+        if delay is None:
+            return False
+        time.sleep(delay)
+        return True
+
+
+class PeerReadiness:
+    """Listener readiness per client, kept in the peer_status table
+
+    ``announce`` writes the row and wakes waiters in this process at once.
+    Listeners in other processes are seen by re-reading the row (a primary
+    key lookup) on a backoff schedule, so waiting never opens connections
+    to the peer.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._cond = threading.Condition()
+        self._generation = 0
+        self.stats = {"announcements": 0, "checks": 0, "wakeups": 0}
+
+    def announce(self, client_id, ready=True):
+        self.db.execute("""
+            INSERT OR REPLACE INTO peer_status
+            (client_id, is_ready, last_update)
+            VALUES (?, ?, ?)
+        """, (client_id, ready, datetime.now().isoformat()))
+        with self._cond:
+            self._generation += 1
+            self.stats["announcements"] += 1
+            self._cond.notify_all()
+
+    def is_ready(self, client_id):
+        self.stats["checks"] += 1
+        row = self.db.fetchone("SELECT is_ready FROM peer_status WHERE client_id = ?", (client_id,))
+        return bool(row and row[0])
+
+    def wait(self, client_id, backoff):
+        """Block until client_id is ready; returns False when backoff's deadline passes"""
+        while True:
+            with self._cond:
+                generation = self._generation
+            if self.is_ready(client_id):
+                return True
+            delay = backoff.next_delay()
+            if delay is None:
+                return False
+            with self._cond:
+                if self._generation == generation and self._cond.wait(delay):
+                    self.stats["wakeups"] += 1
+
+
+def get_peer_readiness(db):
+    """Return the process-wide PeerReadiness for a Database"""
+    key = os.path.abspath(db.db_path)
+    readiness = _registry.get(key)
+    if readiness is None:
+        with _registry_lock:
+            readiness = _registry.get(key)
+            if readiness is None:
+                readiness = PeerReadiness(db)
+                _registry[key] = readiness
+    return readiness
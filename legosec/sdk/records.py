@@ -0,0 +1,76 @@
+import struct
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.backends import default_backend
+
+# Record: 4-byte big-endian body length | 12-byte nonce | AES-GCM ciphertext + tag
+HEADER = struct.Struct("!I")
+NONCE_SIZE = 12
+TAG_SIZE = 16
+MAX_RECORD_SIZE = 16 * 1024 * 1024
+
+
+def derive_direction_keys(session_key):
+    """Split a session key into (initiator->responder, responder->initiator) keys"""
+    material = HKDF(
+        algorithm=hashes.SHA256(),
+        length=64,
+        salt=None,
+        info=b'legosec-record-keys',
+        backend=default_backend()
+    ).derive(session_key)
+    return material[:32], material[32:]
+
+
+class RecordLayer:
+    """Length-prefixed AES-GCM records with per-direction counter nonces
+
+    The layer does no I/O: ``seal`` produces the parts of one record and
+    ``open`` authenticates and decrypts one record whose header and body were
+    read by the caller. Each direction has its own key and nonce counter, and
+    the header is bound to the ciphertext as associated data, so dropped,
+    replayed, reordered or truncated records fail authentication.
+    """
+
+    HEADER_SIZE = HEADER.size
+
+    def __init__(self, session_key, initiator=True):
+        outbound, inbound = derive_direction_keys(session_key)
+        if not initiator:
+            outbound, inbound = inbound, outbound
+        self._send_aead = AESGCM(outbound)
+        self._recv_aead = AESGCM(inbound)
+        self._send_seq = 0
+        self._recv_seq = 0
+
+    def seal(self, data):
+        """Encrypt one message; returns (header, nonce, ciphertext)"""
+        if len(data) > MAX_RECORD_SIZE:
+            raise ValueError(f"Message too large for one record: {len(data)} bytes")
+        nonce = self._send_seq.to_bytes(NONCE_SIZE, "big")
+        self._send_seq += 1
+        header = HEADER.pack(NONCE_SIZE + len(data) + TAG_SIZE)
+        return header, nonce, self._send_aead.encrypt(nonce, data, header)
+
+    @staticmethod
+    def body_length(header):
+        """Return the body length announced by a record header"""
+        (length,) = HEADER.unpack(header)
+        if length < NONCE_SIZE + TAG_SIZE or length > MAX_RECORD_SIZE + NONCE_SIZE + TAG_SIZE:
+            raise ValueError(f"Invalid record length: {length}")
+        return length
+
+    def open(self, header, body):
+        """Authenticate and decrypt one record body (nonce + ciphertext)"""
+        body = memoryview(body)
+        nonce = body[:NONCE_SIZE]
+        if int.from_bytes(nonce, "big") != self._recv_seq:
+            raise ValueError("Unexpected record sequence number")
+        try:
+            plaintext = self._recv_aead.decrypt(nonce, body[NONCE_SIZE:], bytes(header))
+        except InvalidTag:
+            raise ValueError("Record authentication failed")
+        self._recv_seq += 1
+        return plaintext
@@ -0,0 +1,254 @@
+import hmac
+import hashlib
+import os
+import threading
+from datetime import datetime, timedelta
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.backends import default_backend
+from legosec import log
+
+_log = log.get_logger("handshake")
+
+# Resume hello: magic | ticket id | client nonce | HMAC proof of the resumption secret
+# Reply:        accept flag | server nonce | HMAC proof, or a single reject byte
+RESUME_MAGIC = b"LSRESUME"
+TICKET_SIZE = 16
+RESUME_NONCE_SIZE = 16
+PROOF_SIZE = 32
+RESUME_HELLO_SIZE = len(RESUME_MAGIC) + TICKET_SIZE + RESUME_NONCE_SIZE + PROOF_SIZE
+RESUME_ACCEPT = b"\x01"
+RESUME_REJECT = b"\x00"
+RESUME_REPLY_SIZE = 1 + RESUME_NONCE_SIZE + PROOF_SIZE
+
+INITIATOR = "initiator"
+RESPONDER = "responder"
+
+
+def derive_resumption_ticket(session_key):
+    """Derive (ticket id, resumption secret) from a full-handshake session key
+
+    Both sides compute the same ticket, so issuing it costs no extra messages.
+    """
+    material = HKDF(
+        algorithm=hashes.SHA256(),
+        length=TICKET_SIZE + 32,
+        salt=None,
+        info=b'legosec-resumption-ticket',
+        backend=default_backend()
+    ).derive(session_key)
+    return material[:TICKET_SIZE], material[TICKET_SIZE:]
+
+
+def resumed_session_key(secret, client_nonce, server_nonce):
+    """Fresh session key for a resumed connection, unique per nonce pair"""
+    return HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=client_nonce + server_nonce,
+        info=b'legosec-resumed-session-key',
+        backend=default_backend()
+    ).derive(secret)
+
+
+def _proof(secret, label, *parts):
+    return hmac.new(secret, label + b"".join(parts), hashlib.sha256).digest()
+
+
+def client_hello(ticket_id, secret):
+    """Build the resume hello; returns (message, client nonce)"""
+    client_nonce = os.urandom(RESUME_NONCE_SIZE)
+    proof = _proof(secret, b"resume-hello", ticket_id, client_nonce)
+    return RESUME_MAGIC + ticket_id + client_nonce + proof, client_nonce
+
+
+def accept_hello(hello, lookup):
+    """Check a resume hello on the listener side
+
+    ``lookup(ticket_id)`` returns (peer_id, secret) for a valid responder
+    ticket or None. Returns (reply, peer_id, session_key); peer_id and
+    session_key are None when the hello is rejected.
+    """
+    if len(hello) != RESUME_HELLO_SIZE or not hello.startswith(RESUME_MAGIC):
+        return RESUME_REJECT, None, None
+    offset = len(RESUME_MAGIC)
+    ticket_id = hello[offset:offset + TICKET_SIZE]
+    client_nonce = hello[offset + TICKET_SIZE:offset + TICKET_SIZE + RESUME_NONCE_SIZE]
+    proof = hello[offset + TICKET_SIZE + RESUME_NONCE_SIZE:]
+
+    ticket = lookup(ticket_id)
+    if ticket is None:
+        return RESUME_REJECT, None, None
+    peer_id, secret = ticket
+    if not hmac.compare_digest(proof, _proof(secret, b"resume-hello", ticket_id, client_nonce)):
+        return RESUME_REJECT, None, None
+
+    server_nonce = os.urandom(RESUME_NONCE_SIZE)
+    reply = RESUME_ACCEPT + server_nonce + _proof(secret, b"resume-accept", ticket_id, client_nonce, server_nonce)
+    return reply, peer_id, resumed_session_key(secret, client_nonce, server_nonce)
+
+
+def verify_reply(reply, ticket_id, secret, client_nonce):
+    """Check the listener's reply; returns the resumed session key or None if rejected"""
+    if len(reply) != RESUME_REPLY_SIZE or reply[:1] != RESUME_ACCEPT:
+        return None
+    server_nonce = reply[1:1 + RESUME_NONCE_SIZE]
+    expected = _proof(secret, b"resume-accept", ticket_id, client_nonce, server_nonce)
+    if not hmac.compare_digest(reply[1 + RESUME_NONCE_SIZE:], expected):
+        return None
+    return resumed_session_key(secret, client_nonce, server_nonce)
+
+
+def recv_exact(sock, size):
+    """Read exactly size bytes from a blocking socket; fewer only if the peer closed"""
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return bytes(data)
+
+
+class SessionTicketStore:
+    """Resumption tickets for one client, kept in memory and in the ecdh_sessions table
+
+    Tickets are issued after every full ECDH handshake and expire after
+    ``lifetime`` seconds. The store also times full and resumed handshakes
+    so the time saved by resumption can be reported.
+    """
+
+    def __init__(self, db, owner_id, lifetime=3600):
+        self.db = db
+        self.owner_id = owner_id
+        self.lifetime = lifetime
+        self._tickets = {}
+        self._peer_tickets = {}
+        self._lock = threading.Lock()
+        self.stats = {"issued": 0, "full_handshakes": 0, "resumed": 0, "rejected": 0,
+                      "full_handshake_seconds": 0.0, "resumed_seconds": 0.0}
+
+    def issue(self, peer_id, session_key, role):
+        """Store the ticket derived from a full-handshake session key"""
+        ticket_id, secret = derive_resumption_ticket(session_key)
+        expires_at = datetime.now() + timedelta(seconds=self.lifetime)
+        with self._lock:
+            self._tickets[(role, ticket_id)] = (peer_id, secret, expires_at)
+            if role == INITIATOR:
+                self._peer_tickets[peer_id] = ticket_id
+            self.stats["issued"] += 1
+        try:
+            with self.db.transaction() as conn:
+                conn.execute("DELETE FROM ecdh_sessions WHERE owner_id = ? AND expires_at < ?",
+                             (self.owner_id, datetime.now().isoformat()))
+                if role == INITIATOR:
+                    # One ticket per peer is enough on the connecting side
+                    conn.execute("DELETE FROM ecdh_sessions WHERE owner_id = ? AND peer_id = ? AND role = ?",
+                                 (self.owner_id, peer_id, INITIATOR))
+                conn.execute("""
+                    INSERT OR REPLACE INTO ecdh_sessions
+                    (owner_id, session_id, peer_id, role, resumption_secret, created_at, expires_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, (self.owner_id, ticket_id.hex(), peer_id, role, secret,
+                      datetime.now().isoformat(), expires_at.isoformat()))
+        except Exception as e:
+            _log.error("Failed to store session ticket: %.50s", e)
+        return ticket_id
+
+    def _load(self, role, ticket_id=None, peer_id=None):
+        if ticket_id is not None:
+            row = self.db.fetchone("""
+                SELECT session_id, peer_id, resumption_secret, expires_at FROM ecdh_sessions
+                WHERE owner_id = ? AND session_id = ? AND role = ?
+            """, (self.owner_id, ticket_id.hex(), role))
+        else:
+            row = self.db.fetchone("""
+                SELECT session_id, peer_id, resumption_secret, expires_at FROM ecdh_sessions
+                WHERE owner_id = ? AND peer_id = ? AND role = ?
+                ORDER BY expires_at DESC LIMIT 1
+            """, (self.owner_id, peer_id, role))
+        if row is None or row[2] is None:
+            return None
+        ticket_id = bytes.fromhex(row[0])
+        entry = (row[1], bytes(row[2]), datetime.fromisoformat(row[3]))
+        with self._lock:
+            self._tickets[(role, ticket_id)] = entry
+            if role == INITIATOR:
+                self._peer_tickets[row[1]] = ticket_id
+        return ticket_id, entry
+
+    def ticket_for_peer(self, peer_id):
+        """Connecting side: return (ticket id, secret) for a peer, or None"""
+        with self._lock:
+            ticket_id = self._peer_tickets.get(peer_id)
+            entry = self._tickets.get((INITIATOR, ticket_id))
+        if entry is None:
+            loaded = self._load(INITIATOR, peer_id=peer_id)
+            if loaded is None:
+                return None
+            ticket_id, entry = loaded
+        if entry[2] <= datetime.now():
+            self.forget(ticket_id, INITIATOR)
+            return None
+        return ticket_id, entry[1]
+
+    def lookup(self, ticket_id):
+        """Listening side: return (peer_id, secret) for a valid ticket, or None"""
+        with self._lock:
+            entry = self._tickets.get((RESPONDER, ticket_id))
+        if entry is None:
+            loaded = self._load(RESPONDER, ticket_id=ticket_id)
+            if loaded is None:
+                return None
+            entry = loaded[1]
+        if entry[2] <= datetime.now():
+            self.forget(ticket_id, RESPONDER)
+            return None
+        return entry[0], entry[1]
+
+    def forget(self, ticket_id, role):
+        """Drop a ticket that expired or was rejected by the peer"""
+        with self._lock:
+            entry = self._tickets.pop((role, ticket_id), None)
+            if entry is not None and self._peer_tickets.get(entry[0]) == ticket_id:
+                del self._peer_tickets[entry[0]]
+        try:
+            self.db.execute("DELETE FROM ecdh_sessions WHERE owner_id = ? AND session_id = ? AND role = ?",
+                            (self.owner_id, ticket_id.hex(), role))
+        except Exception as e:
+            _log.error("Failed to remove session ticket: %.50s", e)
+
+    def record_full_handshake(self, seconds):
+        with self._lock:
+            self.stats["full_handshakes"] += 1
+            self.stats["full_handshake_seconds"] += seconds
+
+    def record_resumption(self, ticket_id, role, seconds=None):
+        with self._lock:
+            self.stats["resumed"] += 1
+            if seconds is not None:
+                self.stats["resumed_seconds"] += seconds
+        try:
+            self.db.execute("""
+                UPDATE ecdh_sessions SET resumed_count = resumed_count + 1
+                WHERE owner_id = ? AND session_id = ? AND role = ?
+            """, (self.owner_id, ticket_id.hex(), role))
+        except Exception as e:
+            _log.error("Failed to update session ticket: %.50s", e)
+
+    def record_rejection(self):
+        with self._lock:
+            self.stats["rejected"] += 1
+
+    def snapshot(self):
+        """Return resumption counters, the resumption rate and the handshake time saved"""
+        with self._lock:
+            stats = dict(self.stats)
+        attempts = stats["full_handshakes"] + stats["resumed"]
+        full_avg = stats["full_handshake_seconds"] / stats["full_handshakes"] if stats["full_handshakes"] else 0.0
+        resumed_avg = stats["resumed_seconds"] / stats["resumed"] if stats["resumed"] else 0.0
+        stats["resumption_rate"] = stats["resumed"] / attempts if attempts else 0.0
+        stats["avg_full_handshake_seconds"] = full_avg
+        stats["avg_resumed_seconds"] = resumed_avg
+        stats["seconds_saved"] = max(0.0, (full_avg - resumed_avg) * stats["resumed"]) if full_avg else 0.0
+        return stats
@@ -1,5 +1,6 @@
 import os
 import json
+import selectors
 import sqlite3
 import socket
 import threading
@@ -12,33 +13,82 @@ from cryptography.hazmat.primitives.asymmetric import rsa, padding, ec
 from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.backends import default_backend
-from OpenSSL.SSL import Context, Connection, TLSv1_2_METHOD
+from OpenSSL.SSL import Connection
 import requests
 from openssl_psk import patch_context
+from legosec import log, metrics
 from legosec.identity.identity import IdentityManager
+from legosec.identity.manifest import get_identity_manifest
+from legosec.sdk.sinks import ActivityLogSink, NotificationSink
+from legosec.sdk.records import RecordLayer
+from legosec.sdk.aio import AsyncPeerListener, PEM_END
+from legosec.sdk.listener import ThreadedPeerListener
+from legosec.sdk.pool import PeerConnectionPool
+from legosec.sdk.keypool import EphemeralKeyPool, generate_ephemeral_key
+from legosec.sdk.readiness import Backoff, get_peer_readiness
+from legosec.sdk.pskcache import get_psk_cache
+from legosec.sdk import tlspsk
+from legosec.sdk.kdc import KDCClient, KDCKeyCache
+from legosec.sdk import resumption, wire
+from legosec.sdk.resumption import SessionTicketStore, RESUME_MAGIC, INITIATOR, RESPONDER
+from legosec.sdk.streams import send_stream, recv_stream, is_stream_start, DEFAULT_CHUNK_SIZE, _tls_call, _tls_sendall
 
 patch_context()
 
-# Global database lock for thread-safe operations
-db_lock = threading.Lock()
+_log = log.get_logger("sdk")
+_kdc_log = log.get_logger("kdc")
+_identity_log = log.get_logger("identity")
+_handshake_log = log.get_logger("handshake")
+_listener_log = log.get_logger("listener")
+_message_log = log.get_logger("messages")
+_psk_log = log.get_logger("psk")
 
 class SecureChannelSDK:
-    def __init__(self, client_name="SecureClient", client_id=None, identity_dir="."):
-        print("[DEBUG] Initializing SecureChannelSDK instance")
+    def __init__(self, client_name="SecureClient", client_id=None, identity_dir=".",
+                 db_path="kdc_database.db", log_flush_interval=0.5, log_batch_size=256, log_queue_size=10000,
+                 log_overflow_policy="drop_oldest", pool_max_idle_per_peer=4, pool_max_idle_time=60.0,
+                 pool_max_lifetime=600.0, session_ticket_lifetime=3600, ecdh_key_pool_depth=8,
+                 ecdh_key_pool_low_water=2, wire_protocol=wire.VERSION, psk_cipher_list=tlspsk.DEFAULT_CIPHERS,
+                 psk_context_options=tlspsk.DEFAULT_OPTIONS, kdc_endpoints=None, kdc_key_fingerprint=None,
+                 kdc_connect_timeout=3.0, lazy=False):
+        _log.debug("Initializing SecureChannelSDK instance")
 
         self.identity_dir = Path(identity_dir)
         self.identity_dir.mkdir(parents=True, exist_ok=True)
 
         self.client_name = client_name
-        self.kdc_host = "127.0.0.1"
-        self.kdc_port = 5000
+
+        # KDC endpoints in order of preference; the key it serves is cached under identity_dir
+        self.kdc_client = KDCClient(
+            kdc_endpoints,
+            KDCKeyCache(self.identity_dir / "kdc_public_key.pem", pinned=kdc_key_fingerprint),
+            connect_timeout=kdc_connect_timeout
+        )
+        self.kdc_host, self.kdc_port = self.kdc_client.endpoints[0]
         self._background_thread = None
         self.session_keys = {}
         self._background_check_interval = 60
         self.psk = None
-        self.kdc_pub_key = None
-        self.ecdh_private_key = None
         self.dashboard_base_url = "http://localhost:8000"
+        self._stream_handler = None
+        self._listeners = []
+
+        # Handshake version we open with; peers that turn out to be v1-only are
+        # remembered per (host, port) so later connects skip the v2 attempt
+        self.wire_protocol = wire_protocol
+        self._peer_wire_versions = {}
+
+        # Authenticated outbound connections kept open for reuse
+        self.connection_pool = PeerConnectionPool(
+            self.connect_to_peer,
+            max_idle_per_peer=pool_max_idle_per_peer,
+            max_idle_time=pool_max_idle_time,
+            max_lifetime=pool_max_lifetime
+        )
+
+        # Ephemeral ECDH key pairs generated ahead of the handshakes that use them; the
+        # refill worker starts with the first handshake
+        self.ecdh_key_pool = EphemeralKeyPool(depth=ecdh_key_pool_depth, low_water=ecdh_key_pool_low_water)
 
         # First: load or generate client_id — avoid logging before identity manager is ready
         self.client_id = client_id or self._load_existing_identity_id(log=False)
@@ -46,188 +96,208 @@ class SecureChannelSDK:
         # Set identity path now that client_id is known
         self.identity_path = self.identity_dir / f".{self.client_id}_identity.json"
 
-        # Now it's safe to initialize the IdentityManager
+        # Now it's safe to initialize the IdentityManager; the identity file is checked below
         self.identity_manager = IdentityManager(
             client_id=self.client_id,
             client_name=self.client_name,
-            identity_dir=str(self.identity_dir)
+            identity_dir=str(self.identity_dir),
+            db_path=db_path,
+            validate=False,
+            ensure_schema=not lazy
+        )
+        self.db = self.identity_manager.db
+        self.peer_readiness = get_peer_readiness(self.db)
+        self.psk_cache = get_psk_cache(self.db)
+
+        # One TLS-PSK context per side, built on first use and shared by every connection
+        self.psk_contexts = tlspsk.PSKContexts(
+            self.client_id,
+            lambda peer_id: self.psk_cache.get(self.client_id, peer_id),
+            self._verify_peer,
+            ciphers=psk_cipher_list,
+            options=psk_context_options
+        )
+        self.session_tickets = SessionTicketStore(self.db, self.client_id, lifetime=session_ticket_lifetime)
+
+        # Activity logs are written in batches by a background thread
+        self._log_sink = ActivityLogSink(
+            self.identity_manager.db_path,
+            flush_interval=log_flush_interval,
+            batch_size=log_batch_size,
+            max_queue=log_queue_size,
+            overflow_policy=log_overflow_policy
+        )
+        self._notification_sink = NotificationSink(
+            self.identity_manager.db_path,
+            flush_interval=log_flush_interval
         )
 
-        # Now it's safe to log
-        self._log_activity('SYSTEM', 'SDK initialization started')
-
-        # Handle expired identity case
-        if self.identity_path.exists():
+        # Lazy construction writes nothing: the schema is ensured by the first database
+        # connection and the sink threads start with the first log row
+        self.lazy = lazy
+        if not lazy:
+            self._log_activity('SYSTEM', 'SDK initialization started')
+
+        # An identity found by the directory scan is already known to be valid. A client_id
+        # passed in is checked here, or when lazy by the expiry check of connect_to_kdc
+        if client_id is not None and not lazy:
+            self._remove_expired_identity()
+
+        _log.debug("Client initialized with ID: %.6s...", self.client_id)
+        if not lazy:
+            self._log_activity('SYSTEM', f'Client initialized with ID: {self.client_id[:6]}...')
+            self._init_database_tables()
+
+    def _remove_expired_identity(self):
+        """Delete this client's identity file if it is expired or unreadable"""
+        if not self.identity_path.exists():
+            return
+        try:
             with open(self.identity_path) as f:
                 identity = json.load(f)
             expires_at = datetime.fromisoformat(identity.get("expires_at", "1970-01-01T00:00:00"))
-            if datetime.now() > expires_at:
-                print("[WARNING] Identity expired - deleting identity file")
-                self._log_activity('AUTH', 'Expired identity detected and removed')
-                self._send_notification('SYSTEM', 'Identity expired - file removed')
-                self.identity_path.unlink()
-
-        print(f"[DEBUG] Client initialized with ID: {self.client_id[:6]}...")
-        self._log_activity('SYSTEM', f'Client initialized with ID: {self.client_id[:6]}...')
-
-        # Initialize DB tables
-        self._init_database_tables()
-
+        except Exception as e:
+            _log.warning("Failed to parse identity file: %.50s", e)
+            expires_at = None
+        if expires_at is None or datetime.now() > expires_at:
+            _log.warning("Identity expired - deleting identity file")
+            self._log_activity('AUTH', 'Expired identity detected and removed')
+            self._send_notification('SYSTEM', 'Identity expired - file removed')
+            self.identity_manager.remove_identity_file()
 
     def _load_existing_identity_id(self, log=True):
-        """Return the client_id from a valid existing identity file, if found."""
-        for file in self.identity_dir.glob(".client_*_identity.json"):
-            try:
-                with open(file) as f:
-                    data = json.load(f)
-                expires_at = datetime.fromisoformat(data.get("expires_at", "1970-01-01T00:00:00"))
-                if datetime.now() < expires_at:
-                    client_id = data["client_id"]
-                    print(f"[DEBUG] Found valid identity file")
-                    if log and hasattr(self, "identity_manager"):
-                        self._log_activity('AUTH', 'Valid existing identity found')
-
-                    return client_id
-            except Exception as e:
-                print(f"[WARNING] Failed to parse identity file: {str(e)[:50]}")
-                if log and hasattr(self, "identity_manager"):
-                    self._log_activity('ERR', f'Failed to parse identity file: {str(e)[:50]}')
-        
+        """Return the client_id of a valid existing identity, preferring one named client_name
+
+        Looked up in the identity manifest, so the identity files themselves are
+        only scanned when the manifest is missing or out of date.
+        """
+        manifest = get_identity_manifest(self.identity_dir)
+        client_id = manifest.find_valid(self.client_name) or manifest.find_valid()
+        if client_id:
+            _log.debug("Found valid identity file")
+            if log and hasattr(self, "identity_manager"):
+                self._log_activity('AUTH', 'Valid existing identity found')
+            return client_id
+
         # If no valid identity was found, generate new ID
         new_id = f"client_{os.urandom(4).hex()}"
-        print(f"[DEBUG] Generating new client ID")
+        _log.debug("Generating new client ID")
         self._log_activity('REG', f'Generating new client ID: {new_id[:6]}...')
         return new_id
 
     def _init_database_tables(self):
         """Initialize all required database tables"""
-        print(f"[DEBUG] Initializing database tables")
+        _log.debug("Initializing database tables")
         self._log_activity('SYSTEM', 'Initializing database tables')
         try:
-            with sqlite3.connect(self.identity_manager.db_path) as conn:
-                cursor = conn.cursor()
-                
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS peer_status (
-                        client_id TEXT PRIMARY KEY,
-                        is_ready BOOLEAN,
-                        last_update TIMESTAMP
-                    )
-                """)
-                
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS psk_exchange (
-                        from_id TEXT,
-                        to_id TEXT,
-                        shared_psk BLOB,
-                        PRIMARY KEY (from_id, to_id)
-                    )
-                """)
-                
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS ecdh_sessions (
-                        session_id TEXT PRIMARY KEY,
-                        peer_id TEXT NOT NULL,
-                        public_key BLOB,
-                        created_at TIMESTAMP
-                    )
-                """)
-                conn.commit()
-            print(f"[DEBUG] Database tables initialized successfully")
+            # Schema is created once per process and versioned with PRAGMA user_version
+            self.db.ensure_schema()
+            _log.debug("Database tables initialized successfully")
             self._log_activity('SYSTEM', 'Database tables initialized successfully')
         except sqlite3.Error as e:
-            print(f"[ERROR] Failed to initialize database tables: {str(e)[:50]}")
+            _log.error("Failed to initialize database tables: %.50s", e)
             self._log_activity('ERR', f'Failed to initialize database tables: {str(e)[:50]}')
             raise
 
+    @property
+    def kdc_pub_key(self):
+        """The KDC public key from the last exchange or the on-disk cache; None before first contact"""
+        return self.kdc_client.key_cache.key()
+
+    def rotate_kdc_key(self, pem):
+        """Trust a new KDC public key (PEM) obtained out of band, replacing the cached one
+
+        Without this, a KDC presenting a key other than the cached or pinned
+        one is refused with KDCKeyMismatch.
+        """
+        self.kdc_client.key_cache.rotate(pem)
+        self._log_activity('SYSTEM', 'KDC public key rotated')
+
+    def kdc_stats(self):
+        """Return KDC endpoint health and public key cache counters"""
+        return {"endpoints": self.kdc_client.health(), "key_cache": dict(self.kdc_client.key_cache.stats),
+                **self.kdc_client.stats}
+
     def connect_to_kdc(self):
         """Establish secure connection with KDC and register/authenticate"""
-        print(f"[DEBUG] Connecting to KDC")
+        _kdc_log.debug("Connecting to KDC")
         self._log_activity('AUTH', 'Initiating connection to KDC')
+        start = time.perf_counter()
         self._send_notification('SYSTEM', 'Connecting to KDC')
 
-        try:
-            with socket.socket() as s:
-                s.settimeout(10)
-                print(f"[DEBUG] Attempting to connect to KDC")
-                s.connect((self.kdc_host, self.kdc_port))
-
-                # Receive KDC's public key
-                print(f"[DEBUG] Receiving KDC public key")
-                pub_key_data = s.recv(4096)
-                if not pub_key_data:
-                    self._log_activity('ERR', 'Empty public key received from KDC')
-                    self._send_notification('SYSTEM', 'Empty public key received from KDC')
-                    raise ValueError("Empty public key received from KDC")
-
-                kdc_pub_key = serialization.load_pem_public_key(pub_key_data)
-                self.kdc_pub_key = kdc_pub_key
-                print(f"[DEBUG] KDC public key loaded successfully")
-                self._log_activity('AUTH', 'KDC public key loaded successfully')
-                self._send_notification('SYSTEM', 'KDC public key received')
-
-                # Generate and send our parameter
-                our_param = os.urandom(32)
-                print(f"[DEBUG] Generated client parameter")
-
-                encrypted_param = kdc_pub_key.encrypt(
-                    our_param,
-                    padding.OAEP(
-                        mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                        algorithm=hashes.SHA256(),
-                        label=None
-                    )
+        def exchange(s, kdc_pub_key):
+            _kdc_log.debug("KDC public key loaded successfully")
+            self._log_activity('AUTH', 'KDC public key loaded successfully')
+            self._send_notification('SYSTEM', 'KDC public key received')
+
+            # Generate and send our parameter
+            our_param = os.urandom(32)
+            _kdc_log.debug("Generated client parameter")
+
+            encrypted_param = kdc_pub_key.encrypt(
+                our_param,
+                padding.OAEP(
+                    mgf=padding.MGF1(algorithm=hashes.SHA256()),
+                    algorithm=hashes.SHA256(),
+                    label=None
                 )
+            )
+
+            if len(encrypted_param) != 256:
+                self._log_activity('ERR', f'Invalid ciphertext length: {len(encrypted_param)} bytes')
+                raise ValueError(f"Invalid ciphertext length: {len(encrypted_param)} bytes")
+            _kdc_log.debug("Ciphertext length valid")
+
+            _kdc_log.debug("Sending encrypted parameter to KDC")
+            s.sendall(encrypted_param)
+            self._log_activity('AUTH', 'Encrypted parameter sent to KDC')
+            self._send_notification('SYSTEM', 'Encrypted parameter sent to KDC')
+
+            # Receive KDC's parameter
+            _kdc_log.debug("Waiting for KDC parameter")
+            kdc_param_enc = s.recv(4096)
+            if not kdc_param_enc:
+                self._log_activity('ERR', 'Empty parameter received from KDC')
+                self._send_notification('SYSTEM', 'Empty parameter received from KDC')
+                raise ValueError("Empty parameter received from KDC")
+            return our_param, kdc_param_enc
 
-                if len(encrypted_param) != 256:
-                    self._log_activity('ERR', f'Invalid ciphertext length: {len(encrypted_param)} bytes')
-                    raise ValueError(f"Invalid ciphertext length: {len(encrypted_param)} bytes")
-                print(f"[DEBUG] Ciphertext length valid")
-
-                print(f"[DEBUG] Sending encrypted parameter to KDC")
-                s.sendall(encrypted_param)
-                self._log_activity('AUTH', 'Encrypted parameter sent to KDC')
-                self._send_notification('SYSTEM', 'Encrypted parameter sent to KDC')
-
-                # Receive KDC's parameter
-                print(f"[DEBUG] Waiting for KDC parameter")
-                kdc_param_enc = s.recv(4096)
-                if not kdc_param_enc:
-                    self._log_activity('ERR', 'Empty parameter received from KDC')
-                    self._send_notification('SYSTEM', 'Empty parameter received from KDC')
-                    raise ValueError("Empty parameter received from KDC")
-
-                # Derive symmetric key
-                print(f"[DEBUG] Deriving symmetric key")
-                symmetric_key = self._derive_symmetric_key(our_param)
-                kdc_param = self._decrypt_with_key(symmetric_key, kdc_param_enc)
-                print(f"[DEBUG] KDC parameter decrypted successfully")
-                self._log_activity('AUTH', 'KDC parameter decrypted successfully')
-                self._send_notification('SYSTEM', 'KDC parameter decrypted')
-
-                # Calculate PSK
-                self.psk = self._generate_psk(our_param, kdc_param)
-                print(f"[DEBUG] PSK established")
-                self._log_activity('PSK', 'PSK established with KDC')
-                self._send_notification('PSK_UPDATE', 'PSK established with KDC')
-
-                # Handle identity renewal
-                if not self.handle_identity_renewal(auto_renew=True):
-                    self._log_activity('ERR', 'Identity renewal failed')
-                    raise Exception("Identity renewal failed")
+        try:
+            # Tries each configured KDC in turn; a down endpoint is skipped for a while
+            _kdc_log.debug("Attempting to connect to KDC")
+            our_param, kdc_param_enc = self.kdc_client.exchange(exchange)
+
+            # Derive symmetric key
+            _kdc_log.debug("Deriving symmetric key")
+            symmetric_key = self._derive_symmetric_key(our_param)
+            kdc_param = self._decrypt_with_key(symmetric_key, kdc_param_enc)
+            _kdc_log.debug("KDC parameter decrypted successfully")
+            self._log_activity('AUTH', 'KDC parameter decrypted successfully')
+            self._send_notification('SYSTEM', 'KDC parameter decrypted')
+
+            # Calculate PSK
+            self.psk = self._generate_psk(our_param, kdc_param)
+            _kdc_log.debug("PSK established")
+            self._log_activity('PSK', 'PSK established with KDC')
+            self._send_notification('PSK_UPDATE', 'PSK established with KDC')
+
+            # Handle identity renewal
+            if not self.handle_identity_renewal(auto_renew=True):
+                self._log_activity('ERR', 'Identity renewal failed')
+                raise Exception("Identity renewal failed")
 
             # Registration/Authentication
             if not self.identity_manager.is_registered():
-                print(f"[DEBUG] Client not registered, initiating registration")
+                _kdc_log.debug("Client not registered, initiating registration")
                 self._log_activity('REG', 'Client not registered, initiating registration')
                 if not self.identity_manager.register_on_kdc(self.kdc_pub_key):
                     self._log_activity('ERR', 'Registration failed')
                     raise Exception("Registration failed")
             else:
-                print(f"[DEBUG] Checking authentication status")
+                _kdc_log.debug("Checking authentication status")
                 identity = self.identity_manager.load_identity()
                 if self.identity_manager.is_expired(identity):
-                    print(f"[DEBUG] Identity expired, renewing")
+                    _kdc_log.debug("Identity expired, renewing")
                     self._log_activity('AUTH', 'Identity expired, renewing')
                     if not self.identity_manager.register_on_kdc(self.kdc_pub_key):
                         self._log_activity('ERR', 'Renewal failed')
@@ -236,13 +306,16 @@ class SecureChannelSDK:
             # Start background thread after successful setup
             self._start_background_checker()
 
-            print(f"[INFO] Secure connection established with KDC")
+            metrics.KDC_CONNECT_SECONDS.observe(time.perf_counter() - start)
+            metrics.KDC_CONNECTS.labels(result="ok").inc()
+            _kdc_log.info("Secure connection established with KDC")
             self._log_activity('AUTH', 'Secure connection established with KDC')
             self._send_notification('SYSTEM', 'Secure connection established with KDC')
             return True
 
         except Exception as e:
-            print(f"[ERROR] Failed to connect to KDC: {str(e)[:50]}")
+            metrics.KDC_CONNECTS.labels(result="failed").inc()
+            _kdc_log.error("Failed to connect to KDC: %.50s", e)
             self._log_activity('ERR', f'Failed to connect to KDC: {str(e)[:50]}')
             self._send_notification('SYSTEM', f'Failed to connect to KDC: {str(e)[:50]}')
             raise
@@ -250,18 +323,17 @@ class SecureChannelSDK:
     def _start_background_checker(self):
         """Start background thread to check expiration periodically"""
         if self._background_thread is not None and self._background_thread.is_alive():
-            print(f"[DEBUG] Background checker already running")
+            _identity_log.debug("Background checker already running")
             return
 
         def checker():
-            print(f"[DEBUG] Background checker started")
+            _identity_log.debug("Background checker started")
             self._log_activity('SYSTEM', 'Background checker started')
             while True:
                 try:
-                    self._init_database_tables()
                     self.handle_identity_renewal(auto_renew=False)
                 except Exception as e:
-                    print(f"[ERROR] Background check failed: {str(e)[:50]}")
+                    _identity_log.error("Background check failed: %.50s", e)
                     self._log_activity('ERR', f'Background check failed: {str(e)[:50]}')
                 time.sleep(self._background_check_interval)
 
@@ -270,17 +342,17 @@ class SecureChannelSDK:
             daemon=True
         )
         self._background_thread.start()
-        print(f"[DEBUG] Background checker thread started")
+        _identity_log.debug("Background checker thread started")
         self._log_activity('SYSTEM', 'Background checker thread started')
 
     def handle_identity_renewal(self, auto_renew=True):
         """Check and securely handle identity expiration or renewal"""
-        print(f"[DEBUG] Checking identity status")
+        _identity_log.debug("Checking identity status")
         self._log_activity('AUTH', 'Checking identity status')
         status = self.identity_manager.check_identity_expiration()
 
         if status == "not_registered":
-            print(f"[INFO] Not registered - proceeding with registration")
+            _identity_log.info("Not registered - proceeding with registration")
             self._log_activity('REG', 'Not registered - proceeding with registration')
             self._send_notification('SYSTEM', 'Not registered - proceeding with registration')
             success = self.identity_manager.register_on_kdc(self.kdc_pub_key)
@@ -288,12 +360,12 @@ class SecureChannelSDK:
                 try:
                     self._start_background_checker()
                 except Exception as e:
-                    print(f"[ERROR] Failed to start background checker: {str(e)[:50]}")
+                    _identity_log.error("Failed to start background checker: %.50s", e)
                     self._log_activity('ERR', f'Failed to start background checker: {str(e)[:50]}')
             return success
 
         elif status == "expired":
-            print(f"[WARNING] Identity expired - generating new identity")
+            _identity_log.warning("Identity expired - generating new identity")
             self._log_activity('AUTH', 'Identity expired - generating new identity')
             self._send_notification('EXPIRATION', 'Identity expired - generating new identity')
             success = self.identity_manager.register_on_kdc(self.kdc_pub_key)
@@ -301,24 +373,24 @@ class SecureChannelSDK:
                 try:
                     self._start_background_checker()
                 except Exception as e:
-                    print(f"[ERROR] Failed to start background checker: {str(e)[:50]}")
+                    _identity_log.error("Failed to start background checker: %.50s", e)
                     self._log_activity('ERR', f'Failed to start background checker: {str(e)[:50]}')
             return success
 
         elif status.startswith("expiring_soon"):
             if auto_renew:
-                print(f"[INFO] Identity expiring soon - auto-renewing")
+                _identity_log.info("Identity expiring soon - auto-renewing")
                 self._log_activity('AUTH', 'Identity expiring soon - auto-renewing')
                 success = self.identity_manager.register_on_kdc(self.kdc_pub_key)
                 if success:
                     try:
                         self._start_background_checker()
                     except Exception as e:
-                        print(f"[ERROR] Failed to start background checker: {str(e)[:50]}")
+                        _identity_log.error("Failed to start background checker: %.50s", e)
                         self._log_activity('ERR', f'Failed to start background checker: {str(e)[:50]}')
                 return success
             else:
-                print(f"\n[WARNING] Your identity will expire soon ({status.split('(')[1]})")
+                _identity_log.warning("Your identity will expire soon (%s)", status.split('(')[1])
                 self._log_activity('AUTH', f'Identity will expire soon ({status.split("(")[1]})')
                 self._send_notification('EXPIRATION', f'Identity will expire soon ({status.split("(")[1]})')
                 choice = input("Would you like to renew now? (y/n): ").lower()
@@ -326,281 +398,479 @@ class SecureChannelSDK:
                     return self.identity_manager.register_on_kdc(self.kdc_pub_key)
                 return False
 
-        print(f"[DEBUG] Identity is valid")
+        _identity_log.debug("Identity is valid")
         self._log_activity('AUTH', 'Identity is valid')
         return True
 
     def wait_for_peer_ready(self, peer_id, port=6000, timeout=60):
-        """Wait for peer to open socket (polling)"""
-        print(f"[DEBUG] Waiting for peer {peer_id[:6]}... to be ready (timeout={timeout}s)")
+        """Wait until the peer's listener has announced itself in peer_status
+
+        No connections are opened: a listener started in this process wakes
+        the wait at once, one in another process is seen by re-reading its
+        peer_status row with capped exponential backoff. ``port`` is kept for
+        callers of the old probing version and is not used.
+        """
+        if self.peer_readiness.is_ready(peer_id):
+            return
+
+        _handshake_log.debug("Waiting for peer %.6s... to be ready (timeout=%ss)", peer_id, timeout, peer=peer_id)
         self._log_activity('CONN', f'Waiting for peer {peer_id[:6]}... to be ready')
         self._send_notification('SYSTEM', f'Waiting for peer {peer_id[:6]}... to be ready')
 
-        deadline = time.time() + timeout
-        while time.time() < deadline:
-            try:
-                with socket.create_connection(('127.0.0.1', port), timeout=2):
-                    print(f"[DEBUG] Peer is ready")
-                    self._log_activity('CONN', f'Peer {peer_id[:6]}... is ready')
-                    self._send_notification('NEW_PEER', f'Peer {peer_id[:6]}... is ready')
-                    return
-            except (ConnectionRefusedError, socket.timeout):
-                time.sleep(1)
+        backoff = Backoff(initial=0.02, maximum=1.0, deadline=time.monotonic() + timeout)
+        if self.peer_readiness.wait(peer_id, backoff):
+            _handshake_log.debug("Peer is ready", peer=peer_id)
+            self._log_activity('CONN', f'Peer {peer_id[:6]}... is ready')
+            self._send_notification('NEW_PEER', f'Peer {peer_id[:6]}... is ready')
+            return
 
-        self._log_activity('ERR', f'Peer {peer_id[:6]}... not ready after {timeout}s')
-        self._send_notification('SYSTEM', f'Peer {peer_id[:6]}... not ready after {timeout}s')
-        raise TimeoutError(f"Peer not ready on port {port} after {timeout} seconds")
+        self._log_activity('ERR', f'Peer {peer_id[:6]}... not ready after {timeout:.0f}s')
+        self._send_notification('SYSTEM', f'Peer {peer_id[:6]}... not ready after {timeout:.0f}s')
+        raise TimeoutError(f"Peer not ready on port {port} after {timeout:.0f} seconds")
 
-    def connect_to_peer(self, peer_id, host='127.0.0.1', port=6000, max_attempts=3):
-        """Connect to peer using ECDH with PSK fallback"""
-        print(f"[DEBUG] Attempting to connect to peer {peer_id[:6]}...")
+    def connect_to_peer(self, peer_id, host='127.0.0.1', port=6000, max_attempts=3, timeout=60):
+        """Connect to peer using ECDH with PSK fallback
+
+        Failed attempts are retried with capped exponential backoff and
+        jitter; ``timeout`` bounds the whole call, waiting for the peer
+        included.
+        """
+        _handshake_log.debug("Attempting to connect to peer %.6s...", peer_id, peer=peer_id)
         self._log_activity('CONN', f'Attempting to connect to peer {peer_id[:6]}...')
         self._send_notification('SYSTEM', f'Attempting to connect to peer {peer_id[:6]}...')
         
+        backoff = Backoff(initial=0.1, maximum=2.0, deadline=time.monotonic() + timeout)
         for attempt in range(max_attempts):
             try:
-                print(f"[DEBUG] Attempt {attempt + 1}/{max_attempts}")
-                self.wait_for_peer_ready(peer_id, port=port, timeout=60)
-                print(f"[DEBUG] Peer is ready, initiating connection")
+                _handshake_log.debug("Attempt %s/%s", attempt + 1, max_attempts, peer=peer_id)
+                self.wait_for_peer_ready(peer_id, port=port, timeout=backoff.remaining())
+                _handshake_log.debug("Peer is ready, initiating connection", peer=peer_id)
                 self._log_activity('CONN', f'Peer {peer_id[:6]}... is ready, initiating connection')
                 self._send_notification('SYSTEM', f'Peer {peer_id[:6]}... is ready, initiating connection')
                     
+                resumed = self._resume_session(peer_id, host, port)
+                if resumed is not None:
+                    return resumed
+
+                sock = None
                 try:
-                    print(f"[DEBUG] Attempting ECDH connection")
+                    _handshake_log.debug("Attempting ECDH connection", peer=peer_id)
+                    handshake = metrics.HandshakeTimer("ecdh", "initiator")
+                    handshake_start = time.perf_counter()
                     sock = socket.socket()
                     sock.settimeout(10)
                     sock.connect((host, port))
                     
-                    # ECDH key generation
-                    print(f"[DEBUG] Generating ECDH key pair")
-                    self.ecdh_private_key = ec.generate_private_key(ec.SECP384R1())
-                    our_pubkey = self.ecdh_private_key.public_key()
-
-                    # Send public key
-                    print(f"[DEBUG] Sending our public key")
-                    sock.sendall(our_pubkey.public_bytes(
-                        encoding=serialization.Encoding.PEM,
-                        format=serialization.PublicFormat.SubjectPublicKeyInfo
-                    ))
-
-                    # Receive peer's public key
-                    print(f"[DEBUG] Waiting for peer's public key")
-                    peer_pubkey_data = sock.recv(4096)
-                    if not peer_pubkey_data:
-                        self._log_activity('ERR', 'Empty public key received from peer')
-                        self._send_notification('SYSTEM', 'Empty public key received from peer')
-                        raise ValueError("Empty public key received from peer")
-                    
-                    peer_pubkey = serialization.load_pem_public_key(
-                        peer_pubkey_data,
-                        backend=default_backend()
-                    )
-                    print(f"[DEBUG] Peer public key loaded successfully")
-                    self._log_activity('CONN', 'Peer public key loaded successfully')
-                    self._send_notification('SYSTEM', 'Peer public key loaded successfully')
-
-                    # Perform key exchange
-                    print(f"[DEBUG] Performing ECDH key exchange")
-                    shared_secret = self.ecdh_private_key.exchange(ec.ECDH(), peer_pubkey)
-
-                    print(f"[DEBUG] Deriving session key")
-                    session_key = HKDF(
-                        algorithm=hashes.SHA256(),
-                        length=32,
-                        salt=None,
-                        info=b'ecdh-session-key',
-                        backend=default_backend()
-                    ).derive(shared_secret)
-
-                    # Identity exchange
-                    print(f"[DEBUG] Initiating identity verification")
-                    identify_prompt = sock.recv(1024)
-                    if identify_prompt != b"IDENTIFY":
-                        self._log_activity('ERR', 'Peer did not request identity as expected')
-                        raise ValueError("Peer did not request identity as expected")
-
-                    print(f"[DEBUG] Sending our identity")
-                    sock.sendall(self.client_id.encode())
-
-                    print(f"[DEBUG] Connection established successfully")
+                    version = self._peer_wire_versions.get((host, port), self.wire_protocol)
+                    if version >= wire.VERSION:
+                        try:
+                            session_key = self._ecdh_initiate_v2(sock)
+                        except wire.ProtocolMismatch:
+                            sock.close()
+                            _handshake_log.debug("Peer does not speak wire protocol v2, retrying with v1", peer=peer_id)
+                            self._log_activity('CONN', f'Peer {peer_id[:6]}... is v1-only, retrying with v1 handshake')
+                            self._peer_wire_versions[(host, port)] = 1
+                            sock = socket.create_connection((host, port), timeout=10)
+                            session_key = self._ecdh_initiate_v1(sock)
+                    else:
+                        session_key = self._ecdh_initiate_v1(sock)
+
+                    self.session_tickets.record_full_handshake(time.perf_counter() - handshake_start)
+                    handshake.done()
+                    self.session_tickets.issue(peer_id, session_key, INITIATOR)
+
+                    _handshake_log.debug("Connection established successfully", peer=peer_id)
                     self._log_activity('CONN', 'Connection established successfully')
                     self._send_notification('NEW_PEER', 'Connection established successfully')
                     return EncryptedSocket(sock, session_key)
 
                 except Exception as e:
-                    print(f"[WARNING] ECDH failed, falling back to PSK: {str(e)[:50]}")
+                    handshake.failed()
+                    if sock is not None:
+                        sock.close()
+                    metrics.HANDSHAKE_FALLBACKS.inc()
+                    _handshake_log.warning("ECDH failed, falling back to PSK: %.50s", e, peer=peer_id)
                     self._log_activity('PSK', f'ECDH failed, falling back to PSK: {str(e)[:50]}')
                     self._send_notification('SYSTEM', f'ECDH failed, falling back to PSK: {str(e)[:50]}')
                     return self._connect_with_psk(peer_id, host, port)
                     
             except Exception as e:
-                if attempt == max_attempts - 1:
-                    print(f"[ERROR] Final connection attempt failed: {str(e)[:50]}")
+                if attempt == max_attempts - 1 or not backoff.sleep():
+                    _handshake_log.error("Final connection attempt failed: %.50s", e, peer=peer_id)
                     self._log_activity('ERR', f'Final connection attempt failed: {str(e)[:50]}')
                     self._send_notification('SYSTEM', f'Final connection attempt failed: {str(e)[:50]}')
                     raise
-                print(f"[WARNING] Attempt {attempt + 1} failed: {str(e)[:50]}")
+                _handshake_log.warning("Attempt %s failed: %.50s", attempt + 1, e, peer=peer_id)
                 self._log_activity('ERR', f'Attempt {attempt + 1} failed: {str(e)[:50]}')
-                time.sleep(1)
+
+    def _ecdh_initiate_v2(self, sock):
+        """Connecting side of the v2 handshake: one hello, one reply, no PEM and no IDENTIFY prompt"""
+        _handshake_log.debug("Sending v2 ECDH hello")
+        private_key, _, our_point = self.ecdh_key_pool.take()
+        sock.sendall(wire.client_hello(our_point, self.client_id))
+        try:
+            prefix = resumption.recv_exact(sock, wire.REPLY_PREFIX_SIZE)
+        except (ConnectionResetError, BrokenPipeError):
+            prefix = b""
+        point_size = wire.check_reply_prefix(prefix)
+        peer_point = resumption.recv_exact(sock, point_size)
+        session_key = wire.session_key(private_key, peer_point)
+        _handshake_log.debug("Peer accepted v2 handshake")
+        self._log_activity('CONN', 'Peer accepted v2 handshake')
+        return session_key
+
+    def _ecdh_initiate_v1(self, sock):
+        """Connecting side of the v1 handshake: PEM keys, then the listener's IDENTIFY prompt"""
+        # ECDH key pair from the precomputed pool
+        private_key, our_pubkey_data, _ = self.ecdh_key_pool.take()
+
+        # Send public key
+        _handshake_log.debug("Sending our public key")
+        sock.sendall(our_pubkey_data)
+
+        # Receive peer's public key
+        _handshake_log.debug("Waiting for peer's public key")
+        peer_pubkey_data = sock.recv(4096)
+        if not peer_pubkey_data:
+            self._log_activity('ERR', 'Empty public key received from peer')
+            self._send_notification('SYSTEM', 'Empty public key received from peer')
+            raise ValueError("Empty public key received from peer")
+
+        # The IDENTIFY prompt can arrive in the same read as the key
+        peer_pubkey_data, _, identify_prompt = peer_pubkey_data.partition(PEM_END)
+        peer_pubkey = serialization.load_pem_public_key(
+            peer_pubkey_data + PEM_END,
+            backend=default_backend()
+        )
+        _handshake_log.debug("Peer public key loaded successfully")
+        self._log_activity('CONN', 'Peer public key loaded successfully')
+        self._send_notification('SYSTEM', 'Peer public key loaded successfully')
+
+        # Perform key exchange
+        _handshake_log.debug("Performing ECDH key exchange")
+        shared_secret = private_key.exchange(ec.ECDH(), peer_pubkey)
+
+        _handshake_log.debug("Deriving session key")
+        session_key = HKDF(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=None,
+            info=b'ecdh-session-key',
+            backend=default_backend()
+        ).derive(shared_secret)
+
+        # Identity exchange
+        _handshake_log.debug("Initiating identity verification")
+        if not identify_prompt:
+            identify_prompt = sock.recv(1024)
+        if identify_prompt != b"IDENTIFY":
+            self._log_activity('ERR', 'Peer did not request identity as expected')
+            raise ValueError("Peer did not request identity as expected")
+
+        _handshake_log.debug("Sending our identity")
+        sock.sendall(self.client_id.encode())
+        return session_key
+
+    def _resume_session(self, peer_id, host, port):
+        """Reconnect with a stored resumption ticket; None if there is none or it was refused"""
+        ticket = self.session_tickets.ticket_for_peer(peer_id)
+        if ticket is None:
+            return None
+        ticket_id, secret = ticket
+
+        start = time.perf_counter()
+        handshake = metrics.HandshakeTimer("resume", "initiator")
+        sock = None
+        try:
+            _handshake_log.debug("Resuming session with peer %.6s...", peer_id, peer=peer_id)
+            sock = socket.create_connection((host, port), timeout=10)
+            hello, client_nonce = resumption.client_hello(ticket_id, secret)
+            sock.sendall(hello)
+            reply = resumption.recv_exact(sock, resumption.RESUME_REPLY_SIZE)
+            session_key = resumption.verify_reply(reply, ticket_id, secret, client_nonce)
+        except Exception as e:
+            _handshake_log.warning("Session resumption failed: %.50s", e, peer=peer_id)
+            self._log_activity('CONN', f'Session resumption failed: {str(e)[:50]}')
+            session_key = None
+
+        if session_key is None:
+            handshake.failed()
+            if sock is not None:
+                sock.close()
+            self.session_tickets.forget(ticket_id, INITIATOR)
+            self.session_tickets.record_rejection()
+            self._log_activity('CONN', f'Session with {peer_id[:6]}... not resumed, doing full handshake')
+            return None
+
+        self.session_tickets.record_resumption(ticket_id, INITIATOR, time.perf_counter() - start)
+        handshake.done()
+        _handshake_log.debug("Session resumed", peer=peer_id)
+        self._log_activity('CONN', f'Session with {peer_id[:6]}... resumed')
+        return EncryptedSocket(sock, session_key)
+
+    def ecdh_key_pool_stats(self):
+        """Return how many handshakes took a precomputed ECDH key pair and how many ready remain"""
+        return self.ecdh_key_pool.snapshot()
+
+    def resumption_stats(self):
+        """Return session resumption counters and the handshake time they saved"""
+        return self.session_tickets.snapshot()
+
+    def send_pooled_message(self, peer_id, message, host='127.0.0.1', port=6000):
+        """Send one message over a pooled connection and return the peer's response
+
+        The connection goes back to the pool afterwards instead of being
+        closed. If sending on a reused connection fails, the message is
+        retried once on a new connection.
+        """
+        if isinstance(message, str):
+            message = message.encode()
+
+        for attempt in range(2):
+            conn = self.connection_pool.acquire(peer_id, host, port)
+            try:
+                if hasattr(conn, "recv_message"):
+                    conn.send(message)
+                else:
+                    _tls_sendall(conn, message)
+            except Exception as e:
+                self.connection_pool.discard(conn)
+                if attempt:
+                    raise
+                _handshake_log.warning("Pooled connection failed, reconnecting: %.50s", e, peer=peer_id)
+                self._log_activity('CONN', f'Pooled connection to {peer_id[:6]}... failed, reconnecting')
+                continue
+
+            try:
+                if hasattr(conn, "recv_message"):
+                    response = conn.recv_message()
+                else:
+                    response = _tls_call(conn, conn.recv, 1024)
+                if not response:
+                    raise ConnectionError("Peer closed connection before responding")
+            except Exception:
+                self.connection_pool.discard(conn)
+                raise
+            self.connection_pool.release(conn)
+            return response
 
     def _connect_with_psk(self, peer_id, host, port):
         """Fallback connection using pre-shared key"""
-        print(f"[DEBUG] Attempting PSK connection")
+        _handshake_log.debug("Attempting PSK connection", peer=peer_id)
         self._log_activity('PSK', f'Attempting PSK connection with {peer_id[:6]}...')
         self._send_notification('SYSTEM', f'Attempting PSK connection with {peer_id[:6]}...')
         
+        handshake = None
         try:
-            print(f"[DEBUG] Retrieving PSK for peer")
+            _handshake_log.debug("Retrieving PSK for peer", peer=peer_id)
             peer_psk = self.receive_shared_psk(peer_id)
             if not peer_psk:
                 self._log_activity('ERR', 'No PSK available for this peer')
                 raise ValueError("No PSK available for this peer")
             
-            print(f"[DEBUG] Configuring PSK context")
-            ctx = Context(TLSv1_2_METHOD)
-            ctx.set_cipher_list(b'PSK')
-            ctx.set_psk_client_callback(lambda c, h: (self.client_id.encode(), peer_psk))
-
-            print(f"[DEBUG] Establishing socket connection")
+            _handshake_log.debug("Establishing socket connection", peer=peer_id)
+            handshake = metrics.HandshakeTimer("psk", "initiator")
             sock = socket.socket()
             sock.settimeout(10)
             sock.connect((host, port))
             
-            print(f"[DEBUG] Performing TLS-PSK handshake")
-            conn = Connection(ctx, sock)
+            _handshake_log.debug("Performing TLS-PSK handshake", peer=peer_id)
+            conn = Connection(self.psk_contexts.client(), sock)
+            # The shared client callback finds the PSK by this peer id
+            conn.set_app_data(peer_id)
             conn.set_connect_state()
-            conn.do_handshake()
+            # The socket has a timeout, so OpenSSL sees it as non-blocking
+            _tls_call(conn, conn.do_handshake)
+            handshake.done()
             
-            print(f"[DEBUG] PSK connection established")
+            _handshake_log.debug("PSK connection established", peer=peer_id)
             self._log_activity('PSK', 'PSK connection established')
             self._send_notification('PSK_UPDATE', 'PSK connection established')
             return conn
             
         except Exception as e:
-            print(f"[ERROR] PSK connection failed: {str(e)[:50]}")
+            if handshake is not None:
+                handshake.failed()
+            _handshake_log.error("PSK connection failed: %.50s", e, peer=peer_id)
             self._log_activity('ERR', f'PSK connection failed: {str(e)[:50]}')
             self._send_notification('SYSTEM', f'PSK connection failed: {str(e)[:50]}')
             raise
 
-    def listen_for_peers(self, port=6000):
-        """Start listener in a daemon thread (non-blocking)."""
-        print(f"[DEBUG] Starting peer listener on port {port}")
+    def listen_for_peers(self, port=6000, backlog=128, workers=32, max_pending=128,
+                         overload_policy="queue", queue_timeout=5.0, idle_timeout=300.0):
+        """Start listener in a daemon thread (non-blocking).
+
+        Connections are served by a fixed pool of ``workers`` threads; up to
+        ``max_pending`` more wait for a free worker. When both are full,
+        overload_policy "queue" waits up to queue_timeout for room and
+        "reject" closes the new connection immediately. Idle sessions do not
+        hold a worker between messages and are closed after idle_timeout
+        seconds. Returns the listener; its stats() reports queued, active,
+        parked and rejected connections.
+        """
+        _listener_log.debug("Starting peer listener on port %s", port)
         self._log_activity('CONN', f'Starting peer listener on port {port}')
         self._send_notification('SYSTEM', f'Starting peer listener on port {port}')
-        
-        def listener_thread():
-            with socket.socket() as s:
-                try:
-                    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-                    s.bind(('0.0.0.0', port))
-                    s.listen()
-                    self._update_peer_status(True)
-                    print(f"[INFO] Listener ready on port {port}")
-                    self._log_activity('CONN', f'Listener ready on port {port}')
-                    self._send_notification('SYSTEM', f'Listener ready on port {port}')
-                    
-                    while True:
-                        try:
-                            conn, addr = s.accept()
-                            print(f"[DEBUG] New connection from {addr[0]}")
-                            self._log_activity('CONN', f'New connection from {addr[0]}')
-                            self._send_notification('NEW_PEER', f'New connection from {addr[0]}')
-                            threading.Thread(
-                                target=self._handle_incoming_connection,
-                                args=(conn,),
-                                daemon=True
-                            ).start()
-                        except Exception as e:
-                            print(f"[ERROR] Listener accept error: {str(e)[:50]}")
-                            self._log_activity('ERR', f'Listener accept error: {str(e)[:50]}')
-                            break
-                except Exception as e:
-                    print(f"[ERROR] Listener setup failed: {str(e)[:50]}")
-                    self._log_activity('ERR', f'Listener setup failed: {str(e)[:50]}')
-                    raise
-
-        threading.Thread(target=listener_thread, daemon=True).start()
-        print(f"[DEBUG] Listener thread started")
-        self._log_activity('CONN', 'Listener thread started')
-        self._send_notification('SYSTEM', 'Listener thread started')
 
-    def _handle_incoming_connection(self, conn):
-        """Handle both ECDH and PSK connections"""
+        listener = ThreadedPeerListener(
+            self, port=port, backlog=backlog, workers=workers, max_pending=max_pending,
+            overload_policy=overload_policy, queue_timeout=queue_timeout, idle_timeout=idle_timeout
+        )
         try:
-            first_msg = conn.recv(4096, socket.MSG_PEEK)
-            if not first_msg:
-                print("[DEBUG] Empty initial message - closing connection")
+            listener.start()
+        except Exception as e:
+            _listener_log.error("Listener setup failed: %.50s", e)
+            self._log_activity('ERR', f'Listener setup failed: {str(e)[:50]}')
+            raise
+        self._listeners.append(listener)
+
+        _listener_log.info("Listener ready on port %s", port)
+        self._log_activity('CONN', f'Listener ready on port {port}')
+        self._send_notification('SYSTEM', f'Listener ready on port {port}')
+        return listener
+
+    def listener_stats(self):
+        """Return the live connection gauges of every running listener"""
+        return [listener.stats() for listener in self._listeners]
+
+    async def serve(self, port=6000, host='0.0.0.0', executor=None):
+        """Serve peers from the running asyncio event loop until cancelled"""
+        await AsyncPeerListener(self, executor=executor).serve(port, host)
+
+    def listen_for_peers_async(self, port=6000, host='0.0.0.0', executor=None):
+        """Start the asyncio listener on its own event loop thread (non-blocking)
+
+        Same wire protocol as listen_for_peers, but connections are coroutines
+        rather than threads. Returns the listener; call its stop() to shut down.
+        """
+        _listener_log.debug("Starting async peer listener on port %s", port)
+        self._log_activity('CONN', f'Starting async peer listener on port {port}')
+        listener = AsyncPeerListener(self, executor=executor)
+        listener.start_in_thread(port, host)
+        self._listeners.append(listener)
+        return listener
+
+    def _handle_incoming_connection(self, conn, park=None):
+        """Handle both ECDH and PSK connections
+
+        With ``park`` (see IdleConnectionParker) the session is handed back
+        between messages instead of holding the calling worker thread.
+        """
+        try:
+            header = _peek_header(conn)
+            if len(header) < wire.HEADER_SIZE:
+                _handshake_log.debug("Empty initial message - closing connection")
                 self._log_activity('ERR', 'Empty initial message - closing connection')
                 conn.close()
                 return
-                
-            if b"-----BEGIN PUBLIC KEY-----" in first_msg:
-                print(f"[DEBUG] Detected ECDH connection")
-                self._log_activity('CONN', 'Detected ECDH connection')
-                self._handle_ecdh_connection(conn)
-            else:
-                print(f"[DEBUG] Detected PSK connection")
-                self._log_activity('CONN', 'Detected PSK connection')
-                self._handle_psk_connection(conn)
-                
+
+            label, handler = self._CONNECTION_HANDLERS[wire.connection_type(header)]
+            _handshake_log.debug("Detected %s", label)
+            self._log_activity('CONN', f'Detected {label}', sample='connection')
+            getattr(self, handler)(conn, park)
+
         except Exception as e:
-            print(f"[ERROR] Connection handling failed: {str(e)[:50]}")
+            _handshake_log.error("Connection handling failed: %.50s", e)
             self._log_activity('ERR', f'Connection handling failed: {str(e)[:50]}')
             try:
                 conn.close()
             except:
                 pass
 
-    def _handle_ecdh_connection(self, conn):
+    # Connection type from the fixed-size header -> (log label, handler)
+    _CONNECTION_HANDLERS = {
+        wire.ECDH_V2: ("ECDH v2 connection", "_handle_ecdh_v2_connection"),
+        wire.ECDH_V1: ("ECDH connection", "_handle_ecdh_connection"),
+        wire.RESUME: ("session resumption", "_handle_resume_connection"),
+        wire.PSK: ("PSK connection", "_handle_psk_connection"),
+    }
+
+    def _handle_ecdh_v2_connection(self, conn, park=None):
+        """Process a v2 ECDH hello; the identity arrives in the hello, so there is no IDENTIFY prompt"""
+        handshake = metrics.HandshakeTimer("ecdh", "responder")
+        try:
+            conn.settimeout(10)
+            prefix = resumption.recv_exact(conn, wire.HELLO_PREFIX_SIZE)
+            body = resumption.recv_exact(conn, wire.hello_body_size(prefix))
+            client_id = resumption.recv_exact(conn, body[-1])
+            reply, peer_id, session_key = self._ecdh_v2_respond(prefix, body, client_id)
+            conn.sendall(reply)
+            if session_key is None:
+                handshake.failed()
+                conn.close()
+                return
+
+            handshake.done()
+            _handshake_log.debug("Peer authenticated", peer=peer_id)
+            self._log_activity('AUTH', f'Peer {peer_id[:6]}... authenticated')
+            self._send_notification('NEW_PEER', f'Peer {peer_id[:6]}... authenticated')
+            self.session_tickets.issue(peer_id, session_key, RESPONDER)
+            conn.settimeout(None)
+            self._handle_secure_connection(conn, session_key, peer_id, park)
+
+        except Exception as e:
+            handshake.failed()
+            _handshake_log.error("ECDH handling failed: %.50s", e)
+            self._log_activity('ERR', f'ECDH handling failed: {str(e)[:50]}')
+            try:
+                conn.close()
+            except:
+                pass
+            raise
+
+    def _ecdh_v2_respond(self, prefix, body, client_id):
+        """Listener side of the v2 exchange; returns (reply, peer_id, session_key), the last two None if refused
+
+        Authorization is checked before any key material is used, so refused
+        peers cost no ECDH work.
+        """
+        curve_id, peer_point, peer_id = wire.parse_hello(prefix, body, client_id)
+        if not peer_id or not self.identity_manager.is_peer_authorized(peer_id):
+            _handshake_log.warning("Unauthorized peer", peer=peer_id)
+            self._log_activity('AUTH', f'Unauthorized peer: {peer_id[:6]}...')
+            return wire.reply(), None, None
+
+        key_pool = getattr(self, 'ecdh_key_pool', None)
+        ecdh_private, _, our_point = key_pool.take() if key_pool is not None else generate_ephemeral_key()
+        session_key = wire.session_key(ecdh_private, peer_point, curve_id)
+        self.session_keys[peer_id] = session_key
+        return wire.reply(our_point), peer_id, session_key
+
+    def _handle_ecdh_connection(self, conn, park=None):
         """Process ECDH key exchange"""
+        handshake = metrics.HandshakeTimer("ecdh", "responder")
         try:
-            print(f"[DEBUG] Handling ECDH connection")
-            self._log_activity('CONN', 'Handling ECDH connection')
+            _handshake_log.debug("Handling ECDH connection")
+            self._log_activity('CONN', 'Handling ECDH connection', sample='connection')
             
             peer_pubkey_data = conn.recv(4096)
             if not peer_pubkey_data:
                 self._log_activity('ERR', 'Empty public key received')
                 raise ValueError("Empty public key received")
                 
-            print(f"[DEBUG] Loading peer's public key")
-            peer_pubkey = serialization.load_pem_public_key(peer_pubkey_data)
-            
-            print(f"[DEBUG] Generating ECDH key pair")
-            ecdh_private = ec.generate_private_key(ec.SECP384R1())
-            our_pubkey = ecdh_private.public_key()
-            
-            print(f"[DEBUG] Sending our public key")
-            conn.sendall(our_pubkey.public_bytes(
-                encoding=serialization.Encoding.PEM,
-                format=serialization.PublicFormat.SubjectPublicKeyInfo
-            ))
+            our_pubkey_data, session_key = self._ecdh_respond(peer_pubkey_data)
             
-            print(f"[DEBUG] Performing key exchange")
-            shared_secret = ecdh_private.exchange(ec.ECDH(), peer_pubkey)
+            _handshake_log.debug("Sending our public key")
+            conn.sendall(our_pubkey_data)
             
-            print(f"[DEBUG] Deriving session key")
-            session_key = HKDF(
-                algorithm=hashes.SHA256(),
-                length=32,
-                salt=None,
-                info=b'ecdh-session-key',
-                backend=default_backend()
-            ).derive(shared_secret)
-            
-            print(f"[DEBUG] Authenticating peer")
+            _handshake_log.debug("Authenticating peer")
             peer_id = self._authenticate_ecdh_peer(conn, session_key)
             if not peer_id:
                 self._log_activity('ERR', 'Peer authentication failed')
                 raise ValueError("Peer authentication failed")
                 
-            print(f"[DEBUG] Peer authenticated")
+            handshake.done()
+            _handshake_log.debug("Peer authenticated", peer=peer_id)
             self._log_activity('AUTH', f'Peer {peer_id[:6]}... authenticated')
             self._send_notification('NEW_PEER', f'Peer {peer_id[:6]}... authenticated')
             self.session_keys[peer_id] = session_key
-            self._handle_secure_connection(conn, session_key)
+            self.session_tickets.issue(peer_id, session_key, RESPONDER)
+            conn.settimeout(None)
+            self._handle_secure_connection(conn, session_key, peer_id, park)
             
         except Exception as e:
-            print(f"[ERROR] ECDH handling failed: {str(e)[:50]}")
+            handshake.failed()
+            _handshake_log.error("ECDH handling failed: %.50s", e)
             self._log_activity('ERR', f'ECDH handling failed: {str(e)[:50]}')
             try:
                 conn.close()
@@ -608,10 +878,75 @@ class SecureChannelSDK:
                 pass
             raise
 
+    def _handle_resume_connection(self, conn, park=None):
+        """Resume a session from a ticket issued by an earlier ECDH handshake"""
+        handshake = metrics.HandshakeTimer("resume", "responder")
+        try:
+            conn.settimeout(10)
+            hello = resumption.recv_exact(conn, resumption.RESUME_HELLO_SIZE)
+            conn.settimeout(None)
+            reply, peer_id, session_key = self._accept_resume_hello(hello)
+            conn.sendall(reply)
+            if session_key is None:
+                handshake.failed()
+                conn.close()
+                return
+            handshake.done()
+            self._handle_secure_connection(conn, session_key, peer_id, park)
+        except Exception as e:
+            handshake.failed()
+            _handshake_log.error("Session resumption failed: %.50s", e)
+            self._log_activity('ERR', f'Session resumption failed: {str(e)[:50]}')
+            try:
+                conn.close()
+            except:
+                pass
+            raise
+
+    def _accept_resume_hello(self, hello):
+        """Check a resume hello; returns (reply, peer_id, session_key), the last two None if refused"""
+        reply, peer_id, session_key = resumption.accept_hello(hello, self.session_tickets.lookup)
+        if session_key is not None and not self.identity_manager.is_peer_authorized(peer_id):
+            _handshake_log.warning("Unauthorized peer", peer=peer_id)
+            self._log_activity('AUTH', f'Unauthorized peer: {peer_id[:6]}...')
+            reply, peer_id, session_key = resumption.RESUME_REJECT, None, None
+        if session_key is None:
+            self.session_tickets.record_rejection()
+            self._log_activity('AUTH', 'Session resumption refused')
+            return reply, None, None
+
+        ticket_id = hello[len(RESUME_MAGIC):len(RESUME_MAGIC) + resumption.TICKET_SIZE]
+        self.session_tickets.record_resumption(ticket_id, RESPONDER)
+        _handshake_log.debug("Peer session resumed", peer=peer_id)
+        self._log_activity('AUTH', f'Peer {peer_id[:6]}... resumed session')
+        self.session_keys[peer_id] = session_key
+        return reply, peer_id, session_key
+
+    def _ecdh_respond(self, peer_pubkey_data):
+        """Listener side of the ECDH exchange; returns (our PEM public key, session key)"""
+        _handshake_log.debug("Loading peer's public key")
+        peer_pubkey = serialization.load_pem_public_key(peer_pubkey_data)
+        
+        key_pool = getattr(self, 'ecdh_key_pool', None)
+        ecdh_private, our_pubkey_data, _ = key_pool.take() if key_pool is not None else generate_ephemeral_key()
+        
+        _handshake_log.debug("Performing key exchange")
+        shared_secret = ecdh_private.exchange(ec.ECDH(), peer_pubkey)
+        
+        _handshake_log.debug("Deriving session key")
+        session_key = HKDF(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=None,
+            info=b'ecdh-session-key',
+            backend=default_backend()
+        ).derive(shared_secret)
+        return our_pubkey_data, session_key
+
     def _authenticate_ecdh_peer(self, conn, session_key):
         """Securely authenticate ECDH peer by requesting and validating identity."""
         try:
-            print(f"[DEBUG] Requesting peer identity")
+            _handshake_log.debug("Requesting peer identity")
             conn.sendall(b"IDENTIFY")
             conn.settimeout(2)
 
@@ -620,48 +955,47 @@ class SecureChannelSDK:
                 self._log_activity('ERR', 'Empty peer ID received')
                 raise ValueError("Empty peer ID received")
                 
-            print(f"[DEBUG] Received peer ID")
+            _handshake_log.debug("Received peer ID", peer=peer_id)
 
             if not self.identity_manager.is_peer_authorized(peer_id):
-                print(f"[WARNING] Unauthorized peer")
+                _handshake_log.warning("Unauthorized peer", peer=peer_id)
                 self._log_activity('AUTH', f'Unauthorized peer: {peer_id[:6]}...')
                 return None
 
-            print(f"[DEBUG] Peer authorized")
+            _handshake_log.debug("Peer authorized", peer=peer_id)
             self._log_activity('AUTH', f'Peer {peer_id[:6]}... authorized')
             return peer_id
             
         except Exception as e:
-            print(f"[ERROR] Authentication failed: {str(e)[:50]}")
+            _handshake_log.error("Authentication failed: %.50s", e)
             self._log_activity('ERR', f'Authentication failed: {str(e)[:50]}')
             return None
 
-    def _handle_psk_connection(self, conn):
+    def _handle_psk_connection(self, conn, park=None):
         """Process PSK connection"""
+        handshake = metrics.HandshakeTimer("psk", "responder")
         try:
-            print(f"[DEBUG] Handling PSK connection")
-            self._log_activity('PSK', 'Handling PSK connection')
-            
-            ctx = Context(TLSv1_2_METHOD)
-            ctx.set_cipher_list(b'PSK')
-            ctx.set_psk_server_callback(self._verify_peer)
+            _handshake_log.debug("Handling PSK connection")
+            self._log_activity('PSK', 'Handling PSK connection', sample='connection')
             
-            print(f"[DEBUG] Setting up TLS connection")
-            ssl_conn = Connection(ctx, conn)
+            _handshake_log.debug("Setting up TLS connection")
+            ssl_conn = Connection(self.psk_contexts.server(), conn)
             ssl_conn.set_accept_state()
             try:
                 ssl_conn.do_handshake()
             except Exception as e:
-                print(f"[ERROR] PSK handshake failed: {str(e)[:50]}")
+                _handshake_log.error("PSK handshake failed: %.50s", e)
                 self._log_activity('ERR', f'PSK handshake failed: {str(e)[:50]}')
                 raise
             
-            print(f"[DEBUG] PSK handshake complete")
-            self._log_activity('PSK', 'PSK handshake complete')
-            self._handle_peer_connection(ssl_conn)
+            handshake.done()
+            _handshake_log.debug("PSK handshake complete")
+            self._log_activity('PSK', 'PSK handshake complete', sample='connection')
+            self._handle_peer_connection(ssl_conn, park)
             
         except Exception as e:
-            print(f"[ERROR] PSK handling failed: {str(e)[:50]}")
+            handshake.failed()
+            _handshake_log.error("PSK handling failed: %.50s", e)
             self._log_activity('ERR', f'PSK handling failed: {str(e)[:50]}')
             try:
                 conn.close()
@@ -669,117 +1003,177 @@ class SecureChannelSDK:
                 pass
             raise
 
-    def _handle_secure_connection(self, conn, session_key):
+    def _handle_secure_connection(self, conn, session_key, peer_id=None, park=None):
         """Handle secure communication with peer"""
-        print(f"[DEBUG] Starting secure communication")
-        self._log_activity('CONN', 'Starting secure communication')
-        encrypted_conn = EncryptedSocket(conn, session_key)
+        _message_log.debug("Starting secure communication", peer=peer_id)
+        self._log_activity('CONN', 'Starting secure communication', sample='connection', peer=peer_id)
+        metrics.ACTIVE_SESSIONS.inc()
+        self._serve_secure_messages(EncryptedSocket(conn, session_key, initiator=False), peer_id, park)
+
+    def _serve_secure_messages(self, encrypted_conn, peer_id=None, park=None):
+        """Answer messages until the peer closes, or until it goes idle when park is given"""
+        parked = False
         try:
             while True:
-                data = encrypted_conn.recv(1024)
+                data = encrypted_conn.recv_message()
                 if not data:
-                    print(f"[DEBUG] Connection closed by peer")
-                    self._log_activity('CONN', 'Connection closed by peer')
+                    _message_log.debug("Connection closed by peer", peer=peer_id)
+                    self._log_activity('CONN', 'Connection closed by peer', sample='connection', peer=peer_id)
                     break
-                print(f"[MESSAGE RECEIVED] Content: {data.decode()}")
-                self._log_activity('CONN', f'Message received: {data.decode()[:100]}...')
-                response = f"ACK from {self.client_id[:6]}..."
-                encrypted_conn.send(response.encode())
-                print(f"[MESSAGE SENT] Content: {response}")
-                self._log_activity('CONN', f'Message sent: {response}')
+                if is_stream_start(data):
+                    self._receive_peer_stream(encrypted_conn, data, peer_id)
+                else:
+                    encrypted_conn.send(self._peer_message_response(data, peer_id))
+                if park is not None and not encrypted_conn.has_buffered_data():
+                    parked = True
+                    park(encrypted_conn, lambda: self._serve_secure_messages(encrypted_conn, peer_id, park),
+                         lambda: self._close_secure_session(encrypted_conn, peer_id))
+                    return
         except Exception as e:
-            print(f"[ERROR] Secure communication error: {str(e)[:50]}")
+            _message_log.error("Secure communication error: %.50s", e, peer=peer_id)
             self._log_activity('ERR', f'Secure communication error: {str(e)[:50]}')
         finally:
-            encrypted_conn.close()
-            print(f"[DEBUG] Secure connection closed")
-            self._log_activity('CONN', 'Secure connection closed')
+            if not parked:
+                self._close_secure_session(encrypted_conn, peer_id)
+
+    def _close_secure_session(self, encrypted_conn, peer_id=None):
+        """Close a listener session, also when the parker ends it while idle"""
+        encrypted_conn.close()
+        metrics.ACTIVE_SESSIONS.dec()
+        _message_log.debug("Secure connection closed", peer=peer_id)
+        self._log_activity('CONN', 'Secure connection closed', sample='connection', peer=peer_id)
 
-    def _handle_peer_connection(self, ssl_conn):
+    def _handle_peer_connection(self, ssl_conn, park=None):
         """Handle established PSK connection"""
-        print(f"[DEBUG] Handling peer connection")
-        self._log_activity('CONN', 'Handling peer connection')
+        _message_log.debug("Handling peer connection")
+        self._log_activity('CONN', 'Handling peer connection', sample='connection')
+        metrics.ACTIVE_SESSIONS.inc()
+        self._serve_peer_messages(ssl_conn, park)
+
+    def _serve_peer_messages(self, ssl_conn, park=None):
+        """Answer PSK messages until the peer closes, or until it goes idle when park is given"""
+        parked = False
+        # Set by _verify_peer during the handshake
+        peer_id = ssl_conn.get_app_data()
         try:
             while True:
                 data = ssl_conn.recv(1024)
                 if not data:
-                    print(f"[DEBUG] Peer closed connection")
-                    self._log_activity('CONN', 'Peer closed connection')
+                    _message_log.debug("Peer closed connection", peer=peer_id)
+                    self._log_activity('CONN', 'Peer closed connection', sample='connection', peer=peer_id)
                     break
-                print(f"[MESSAGE RECEIVED] Content: {data.decode()}")
-                self._log_activity('CONN', f'Message received: {data.decode()[:100]}...')
-                response = f"ACK from {self.client_id[:6]}..."
-                ssl_conn.send(response.encode())
-                print(f"[MESSAGE SENT] Content: {response}")
-                self._log_activity('CONN', f'Message sent: {response}')
+                metrics.message_received(len(data))
+                if is_stream_start(data):
+                    self._receive_peer_stream(ssl_conn, data, peer_id)
+                else:
+                    response = self._peer_message_response(data, peer_id)
+                    ssl_conn.send(response)
+                    metrics.message_sent(len(response))
+                if park is not None and not ssl_conn.pending():
+                    parked = True
+                    park(ssl_conn, lambda: self._serve_peer_messages(ssl_conn, park),
+                         lambda: self._close_peer_session(ssl_conn, peer_id))
+                    return
         except Exception as e:
-            print(f"[ERROR] Peer communication error: {str(e)[:50]}")
+            _message_log.error("Peer communication error: %.50s", e, peer=peer_id)
             self._log_activity('ERR', f'Peer communication error: {str(e)[:50]}')
         finally:
-            ssl_conn.close()
-            print(f"[DEBUG] Peer connection closed")
-            self._log_activity('CONN', 'Peer connection closed')
+            if not parked:
+                self._close_peer_session(ssl_conn, peer_id)
+
+    def _close_peer_session(self, ssl_conn, peer_id=None):
+        """Close a PSK listener session, also when the parker ends it while idle"""
+        ssl_conn.close()
+        metrics.ACTIVE_SESSIONS.dec()
+        _message_log.debug("Peer connection closed", peer=peer_id)
+        self._log_activity('CONN', 'Peer connection closed', sample='connection', peer=peer_id)
+
+    def _peer_message_response(self, data, peer_id=None):
+        """Log a message received by the listener and build its acknowledgement
+
+        Only the message size is logged, never its contents, and both the log
+        line and the activity row are sampled.
+        """
+        _message_log.sampled('message', log.DEBUG, "Message received (%d bytes), acknowledged", len(data), peer=peer_id)
+        self._log_activity('CONN', f'Message received ({len(data)} bytes), acknowledged', sample='message', peer=peer_id)
+        return f"ACK from {self.client_id[:6]}...".encode()
+
+    def set_stream_handler(self, handler):
+        """Route incoming streams to handler(peer_id), which returns a path, file object or callable sink"""
+        self._stream_handler = handler
+
+    def _receive_peer_stream(self, conn, first, peer_id=None):
+        """Receive a send_stream() transfer on a listener connection and acknowledge it"""
+        summary = recv_stream(conn, self._stream_sink(peer_id), first=first)
+        conn.send(self._stream_response(summary, peer_id))
+        return summary
+
+    def _stream_sink(self, peer_id=None):
+        """Return the sink for an incoming stream from peer_id"""
+        peer_label = peer_id[:6] if peer_id else 'unknown'
+        _message_log.debug("Receiving stream from peer %s...", peer_label, peer=peer_id)
+        self._log_activity('CONN', f'Receiving stream from peer {peer_label}...')
+        return self._stream_handler(peer_id) if self._stream_handler else (lambda chunk: None)
+
+    def _stream_response(self, summary, peer_id=None):
+        """Log a completed incoming stream and build its acknowledgement"""
+        peer_label = peer_id[:6] if peer_id else 'unknown'
+        _message_log.debug("Stream received (%s bytes)", summary['bytes'], peer=peer_id)
+        self._log_activity('CONN', f'Stream received from peer {peer_label}...', summary)
+        return f"ACK from {self.client_id[:6]}... stream {summary['bytes']} bytes".encode()
 
     def _update_peer_status(self, ready=True):
         """Update our ready status in the database"""
-        print(f"[DEBUG] Updating peer status (ready={ready})")
+        _log.debug("Updating peer status (ready=%s)", ready)
         self._log_activity('SYSTEM', f'Updating peer status (ready={ready})')
         try:
-            with sqlite3.connect(self.identity_manager.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    INSERT OR REPLACE INTO peer_status 
-                    (client_id, is_ready, last_update)
-                    VALUES (?, ?, ?)
-                """, (self.client_id, ready, datetime.now().isoformat()))
-                conn.commit()
-            print(f"[DEBUG] Peer status updated successfully")
+            # Also wakes connect_to_peer calls in this process waiting for us
+            self.peer_readiness.announce(self.client_id, ready)
+            _log.debug("Peer status updated successfully")
             self._log_activity('SYSTEM', 'Peer status updated successfully')
             self._send_notification('SYSTEM', f'Peer status updated to {ready}')
         except sqlite3.Error as e:
-            print(f"[ERROR] Failed to update peer status: {str(e)[:50]}")
+            _log.error("Failed to update peer status: %.50s", e)
             self._log_activity('ERR', f'Failed to update peer status: {str(e)[:50]}')
 
     def _verify_peer(self, conn, identity):
         """Verify peer identity and return PSK for PSK connections"""
         try:
             peer_id = identity.decode()
-            print(f"[DEBUG] Verifying peer {peer_id[:6]}...")
+            _handshake_log.debug("Verifying peer %.6s...", peer_id, peer=peer_id)
             self._log_activity('AUTH', f'Verifying peer {peer_id[:6]}...')
             
             if not self.identity_manager.is_peer_authorized(peer_id):
-                print(f"[WARNING] Peer not authorized")
+                _handshake_log.warning("Peer not authorized", peer=peer_id)
                 self._log_activity('AUTH', f'Peer {peer_id[:6]}... not authorized')
                 return None
             
-            print(f"[DEBUG] Peer authorized")
+            _handshake_log.debug("Peer authorized", peer=peer_id)
             self._log_activity('AUTH', f'Peer {peer_id[:6]}... authorized')
             self._send_notification('NEW_PEER', f'Peer {peer_id[:6]}... authorized')
+            conn.set_app_data(peer_id)
             
-            print(f"[DEBUG] Retrieving PSK for peer")
-            try:
-                psk = self.receive_shared_psk(peer_id)
-                if not psk:
-                    self._log_activity('ERR', 'No PSK available for this peer')
-                    raise ValueError("No PSK available for this peer")
-                    
-                print(f"[DEBUG] Peer verified successfully")
-                self._log_activity('AUTH', 'Peer verified successfully')
-                return psk
-            except Exception as e:
-                print(f"[ERROR] Failed to retrieve PSK: {str(e)[:50]}")
-                self._log_activity('ERR', f'Failed to retrieve PSK: {str(e)[:50]}')
+            _handshake_log.debug("Retrieving PSK for peer", peer=peer_id)
+            # Runs inside the TLS handshake, so never wait here for a PSK to show up
+            psk = self.psk_cache.get(self.client_id, peer_id)
+            if not psk:
+                _handshake_log.error("No PSK available for this peer", peer=peer_id)
+                self._log_activity('ERR', 'No PSK available for this peer')
                 return None
+
+            _handshake_log.debug("Peer verified successfully", peer=peer_id)
+            self._log_activity('AUTH', 'Peer verified successfully')
+            return psk
                 
         except Exception as e:
-            print(f"[ERROR] Peer verification failed: {str(e)[:50]}")
+            _handshake_log.error("Peer verification failed: %.50s", e)
             self._log_activity('ERR', f'Peer verification failed: {str(e)[:50]}')
             return None
 
     
     def _derive_symmetric_key(self, shared_secret):
         """Derive symmetric key using HKDF"""
-        print(f"[DEBUG] Deriving symmetric key")
+        _kdc_log.debug("Deriving symmetric key")
         self._log_activity('CRYPTO', 'Deriving symmetric key')
         hkdf = HKDF(
             algorithm=hashes.SHA256(),
@@ -793,31 +1187,31 @@ class SecureChannelSDK:
 
     def _encrypt_with_key(self, key, data):
         """Encrypt data with symmetric key"""
-        print(f"[DEBUG] Encrypting data (length={len(data)})")
+        _kdc_log.debug("Encrypting data (length=%d)", len(data))
         self._log_activity('CRYPTO', f'Encrypting data (length={len(data)})')
         iv = os.urandom(16)
         cipher = Cipher(algorithms.AES(key), modes.CFB(iv), backend=default_backend())
         encryptor = cipher.encryptor()
         encrypted = iv + encryptor.update(data) + encryptor.finalize()
-        print(f"[DEBUG] Encryption complete")
+        _kdc_log.debug("Encryption complete")
         self._log_activity('CRYPTO', 'Encryption complete')
         return encrypted
 
     def _decrypt_with_key(self, key, data):
         """Decrypt data with symmetric key"""
-        print(f"[DEBUG] Decrypting data (length={len(data)})")
+        _kdc_log.debug("Decrypting data (length=%d)", len(data))
         self._log_activity('CRYPTO', f'Decrypting data (length={len(data)})')
         iv, encrypted = data[:16], data[16:]
         cipher = Cipher(algorithms.AES(key), modes.CFB(iv), backend=default_backend())
         decryptor = cipher.decryptor()
         decrypted = decryptor.update(encrypted) + decryptor.finalize()
-        print(f"[DEBUG] Decryption complete")
+        _kdc_log.debug("Decryption complete")
         self._log_activity('CRYPTO', 'Decryption complete')
         return decrypted
 
     def _generate_psk(self, client_param, kdc_param):
         """Generate PSK from parameters"""
-        print(f"[DEBUG] Generating PSK")
+        _kdc_log.debug("Generating PSK")
         self._log_activity('PSK', 'Generating PSK')
         h = hashes.Hash(hashes.SHA256(), backend=default_backend())
         h.update(client_param + kdc_param)
@@ -827,94 +1221,73 @@ class SecureChannelSDK:
     
     def generate_and_distribute_shared_psk(self, peer_id):
         """Generate and store PSK for peer connections"""
-        print(f"\n[DEBUG] Generating PSK for peer {peer_id[:6]}...")
+        _psk_log.debug("Generating PSK for peer %.6s...", peer_id, peer=peer_id)
         self._log_activity('PSK', f'Generating PSK for peer {peer_id[:6]}...')
         self._send_notification('PSK_UPDATE', f'Generating PSK for peer {peer_id[:6]}...')
         
         try:
-            with db_lock:
-                self._init_database_tables()
-                
-                # Clean up any existing PSKs for this pair
-                with sqlite3.connect(self.identity_manager.db_path) as conn:
-                    cursor = conn.cursor()
-                    cursor.execute("""
-                        DELETE FROM psk_exchange
-                        WHERE (from_id = ? AND to_id = ?)
-                        OR (from_id = ? AND to_id = ?)
-                    """, (self.client_id, peer_id, peer_id, self.client_id))
-                    conn.commit()
-                
-                # Generate and store new PSK
-                shared_psk = os.urandom(32)
-                
-                with sqlite3.connect(self.identity_manager.db_path) as conn:
-                    cursor = conn.cursor()
-                    
-                    # Store in both directions
-                    cursor.execute("""
-                        INSERT INTO psk_exchange 
-                        (from_id, to_id, shared_psk)
-                        VALUES (?, ?, ?)
-                    """, (self.client_id, peer_id, shared_psk))
-                    
-                    cursor.execute("""
-                        INSERT INTO psk_exchange 
-                        (from_id, to_id, shared_psk)
-                        VALUES (?, ?, ?)
-                    """, (peer_id, self.client_id, shared_psk))
-                    
-                    conn.commit()
-                
-            print(f"[DEBUG] PSK stored successfully for peer {peer_id[:6]}...")
+            shared_psk = os.urandom(32)
+            self.psk_cache.store(self.client_id, peer_id, shared_psk)
+
+            _psk_log.debug("PSK stored successfully for peer %.6s...", peer_id, peer=peer_id)
             self._log_activity('PSK', f'PSK stored successfully for peer {peer_id[:6]}...')
             self._send_notification('PSK_UPDATE', f'PSK stored for peer {peer_id[:6]}...')
             return shared_psk
             
         except Exception as e:
-            print(f"[ERROR] Failed to generate/distribute PSK: {str(e)[:50]}")
+            _psk_log.error("Failed to generate/distribute PSK: %.50s", e, peer=peer_id)
             self._log_activity('ERR', f'Failed to generate/distribute PSK: {str(e)[:50]}')
             self._send_notification('SYSTEM', f'Failed to generate/distribute PSK: {str(e)[:50]}')
             raise
 
-    def receive_shared_psk(self, peer_id):
-        """Retrieve PSK for a peer connection"""
-        print(f"\n[DEBUG] Retrieving PSK for peer {peer_id[:6]}...")
+    def generate_and_distribute_shared_psks(self, peer_ids, chunk_size=None):
+        """Generate and store PSKs for many peers; returns {peer_id: psk}
+
+        All keys are generated up front and written with executemany in a
+        single transaction, or one transaction per chunk_size peers.
+        """
+        peer_ids = list(dict.fromkeys(peer_ids))
+        _psk_log.debug("Generating PSKs for %d peers", len(peer_ids))
+        self._log_activity('PSK', f'Generating PSKs for {len(peer_ids)} peers')
+
+        try:
+            shared_psks = {peer_id: os.urandom(32) for peer_id in peer_ids if peer_id != self.client_id}
+            self.psk_cache.store_many(self.client_id, shared_psks, chunk_size=chunk_size)
+
+            _psk_log.debug("Stored %d PSKs", len(shared_psks))
+            self._log_activity('PSK', f'Stored {len(shared_psks)} PSKs')
+            self._send_notification('PSK_UPDATE', f'PSKs stored for {len(shared_psks)} peers')
+            return shared_psks
+
+        except Exception as e:
+            _psk_log.error("Failed to generate/distribute PSKs: %.50s", e)
+            self._log_activity('ERR', f'Failed to generate/distribute PSKs: {str(e)[:50]}')
+            self._send_notification('SYSTEM', f'Failed to generate/distribute PSKs: {str(e)[:50]}')
+            raise
+
+    def receive_shared_psk(self, peer_id, timeout=10):
+        """Retrieve PSK for a peer connection, waiting up to timeout seconds for it
+
+        Returns at once when the PSK is cached. Otherwise the wait is woken by
+        generate_and_distribute_shared_psk in this process, and PSKs stored by
+        other processes are picked up with backoff.
+        """
+        _psk_log.debug("Retrieving PSK for peer %.6s...", peer_id, peer=peer_id)
         self._log_activity('PSK', f'Retrieving PSK for peer {peer_id[:6]}...')
 
-        for attempt in range(20):  # Wait up to 10 seconds
-            try:
-                with db_lock:
-                    with sqlite3.connect(self.identity_manager.db_path) as conn:
-                        conn.row_factory = sqlite3.Row
-                        cursor = conn.cursor()
-                        
-                        # Check both directions
-                        cursor.execute("""
-                            SELECT shared_psk FROM psk_exchange
-                            WHERE (from_id = ? AND to_id = ?)
-                            OR (from_id = ? AND to_id = ?)
-                        """, (peer_id, self.client_id, self.client_id, peer_id))
-                        
-                        result = cursor.fetchone()
-                        if result:
-                            print(f"[DEBUG] Retrieved PSK")
-                            self._log_activity('PSK', 'Retrieved PSK successfully')
-                            return result['shared_psk']
-                        
-                print(f"[DEBUG] PSK not found yet (attempt {attempt + 1})")
-                time.sleep(0.5)
-                
-            except sqlite3.Error as e:
-                print(f"[ERROR] Database error: {str(e)[:50]}")
-                self._log_activity('ERR', f'Database error: {str(e)[:50]}')
-                time.sleep(0.5)
-            except Exception as e:
-                print(f"[ERROR] PSK retrieval failed: {str(e)[:50]}")
-                self._log_activity('ERR', f'PSK retrieval failed: {str(e)[:50]}')
-                time.sleep(0.5)
+        backoff = Backoff(initial=0.02, maximum=0.5, deadline=time.monotonic() + timeout)
+        try:
+            psk = self.psk_cache.wait(self.client_id, peer_id, backoff)
+        except sqlite3.Error as e:
+            _psk_log.error("Database error: %.50s", e, peer=peer_id)
+            self._log_activity('ERR', f'Database error: {str(e)[:50]}')
+            raise
+        if psk:
+            _psk_log.debug("Retrieved PSK", peer=peer_id)
+            self._log_activity('PSK', 'Retrieved PSK successfully')
+            return psk
 
-        print(f"[ERROR] Timed out waiting for PSK from {peer_id[:6]}...")
+        _psk_log.error("Timed out waiting for PSK from %.6s...", peer_id, peer=peer_id)
         self._log_activity('ERR', f'Timed out waiting for PSK from {peer_id[:6]}...')
         self._send_notification('SYSTEM', f'Timed out waiting for PSK from {peer_id[:6]}...')
         raise TimeoutError(f"Timed out waiting for PSK from {peer_id[:6]}...")
@@ -959,108 +1332,232 @@ class SecureChannelSDK:
     #             self._log_activity('ERR', f'Could not generate dashboard URL: {str(e)}')
 
 
-    def _log_activity(self, log_type, message, metadata=None):
-        """Log activity to the database"""
-        if not hasattr(self, 'identity_manager'):
-            print(f"[LOG SKIPPED] {log_type}: {message}")
+    def _log_activity(self, log_type, message, metadata=None, sample=None, peer=None):
+        """Queue an activity log row for the background log sink
+
+        Rows for per-message or per-connection events name a ``sample`` kind
+        and are kept as the legosec.log sampler allows; rows for a debug peer
+        are always kept.
+        """
+        if not hasattr(self, '_log_sink'):
+            _log.debug("Log skipped %s: %s", log_type, message)
             return
-            
+        if sample is not None and not log.sample(f"activity.{sample}", peer):
+            return
+
         # Convert metadata to string if it's not None
         metadata_str = '{}' if metadata is None else json.dumps(metadata)
-            
-        try:
-            with sqlite3.connect(self.identity_manager.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    INSERT INTO client_logs 
-                    (client_id, log_type, message, metadata) 
-                    VALUES (?, ?, ?, ?)
-                """, (self.client_id, log_type, message, metadata_str))
-                conn.commit()
-        except Exception as e:
-            print(f"[ERROR] Failed to log activity: {str(e)[:50]}")
-      
+        self._log_sink.submit((self.client_id, log_type, message, metadata_str))
+
+    def flush_logs(self, timeout=5.0):
+        """Block until queued activity logs and notifications are written to the database"""
+        logs_flushed = self._log_sink.flush(timeout)
+        notifications_flushed = self._notification_sink.flush(timeout)
+        return logs_flushed and notifications_flushed
 
     def _send_notification(self, notification_type, message, action_url=None):
-        """Send notification and store it in the database"""
-        with sqlite3.connect(self.identity_manager.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO notifications 
-                (client_id, message, notification_type, action_url) 
-                VALUES (?, ?, ?, ?)
-            """, (self.client_id, message, notification_type, action_url or ''))
-            conn.commit()
-      
+        """Queue a notification; duplicate bursts are stored as one row"""
+        try:
+            self._notification_sink.submit((self.client_id, message, notification_type, action_url or ''))
+        except Exception as e:
+            _log.error("Failed to queue notification: %.50s", e)
 
     def _close_all_connections(self):
         """Close all active connections for testing"""
-        if hasattr(self, '_background_thread'):
+        if hasattr(self, '_background_thread') and self._background_thread is not None:
             self._background_thread.join(timeout=1)
+        if hasattr(self, '_log_sink'):
+            self._log_sink.flush()
+            self._notification_sink.flush()
+
+    def close(self):
+        """Stop async listeners, flush pending activity logs and stop background writers"""
+        for listener in getattr(self, '_listeners', []):
+            listener.stop()
+        if hasattr(self, 'connection_pool'):
+            self.connection_pool.close()
+        if hasattr(self, 'ecdh_key_pool'):
+            self.ecdh_key_pool.close()
+        self._close_all_connections()
+        if hasattr(self, '_log_sink'):
+            self._log_sink.close()
+            self._notification_sink.close()
+
+
+def _peek_header(conn, timeout=10):
+    """Peek the fixed-size connection header; shorter only if the peer closed or timed out
+
+    The header is left in the socket for the handler. With SO_RCVLOWAT the
+    socket only turns readable once the whole header arrived or the peer
+    closed, so a header split across segments costs no extra wakeups.
+    """
+    deadline = time.monotonic() + timeout
+    low_water = _set_receive_low_water(conn, wire.HEADER_SIZE)
+    try:
+        with selectors.DefaultSelector() as selector:
+            selector.register(conn, selectors.EVENT_READ)
+            header = b""
+            while selector.select(max(0.0, deadline - time.monotonic())):
+                header = conn.recv(wire.HEADER_SIZE, socket.MSG_PEEK)
+                if not header or len(header) >= wire.HEADER_SIZE or time.monotonic() >= deadline:
+                    break
+                if not low_water:
+                    # The socket stays readable on a partial header; give the rest a moment to arrive
+                    time.sleep(0.001)
+            return header
+    finally:
+        if low_water:
+            _set_receive_low_water(conn, 1)
+
+
+def _set_receive_low_water(conn, size):
+    """Set SO_RCVLOWAT on a TCP socket; False where poll() would not honour it"""
+    if getattr(conn, "family", None) not in (socket.AF_INET, socket.AF_INET6):
+        return False
+    try:
+        conn.setsockopt(socket.SOL_SOCKET, socket.SO_RCVLOWAT, size)
+    except (AttributeError, OSError):
+        return False
+    return True
 
 
 class EncryptedSocket:
-    """Wrapper for socket with ECDH-derived encryption"""
-    def __init__(self, socket, session_key):
-        print(f"[DEBUG] Creating EncryptedSocket")
+    """Wrapper for socket with ECDH-derived encryption
+
+    Messages travel as length-prefixed AES-GCM records (see RecordLayer), so
+    every send() is delivered as exactly one message by recv_message().
+    """
+    READ_BUFFER_SIZE = 64 * 1024
+
+    def __init__(self, socket, session_key, initiator=True):
         self.socket = socket
         self.session_key = session_key
+        self._records = RecordLayer(session_key, initiator=initiator)
+        self._buffer = bytearray(self.READ_BUFFER_SIZE)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+        self._pending = None
+        self._pending_offset = 0
         
     def send(self, data):
-        """Encrypt and send data"""
+        """Encrypt and send one message"""
         try:
             if isinstance(data, str):
                 data = data.encode()
-            print(f"[DEBUG] Encrypting {len(data)} bytes")
-            
-            iv = os.urandom(16)
-            cipher = Cipher(
-                algorithms.AES(self.session_key),
-                modes.CFB(iv),
-                backend=default_backend()
-            )
-            encryptor = cipher.encryptor()
-            encrypted = iv + encryptor.update(data) + encryptor.finalize()
-            
-            print(f"[DEBUG] Sending encrypted data")
-            self.socket.sendall(encrypted)
-            
+            self._send_buffers(self._records.seal(data))
+            metrics.message_sent(len(data))
         except Exception as e:
-            print(f"[ERROR] Failed to send encrypted data: {str(e)[:50]}")
+            _message_log.error("Failed to send encrypted data: %.50s", e)
             raise
-        
-    def recv(self, bufsize):
-        """Receive and decrypt data"""
+
+    def _send_buffers(self, buffers):
+        """Send header, nonce and ciphertext without joining them first"""
+        if not hasattr(self.socket, "sendmsg"):
+            self.socket.sendall(b"".join(buffers))
+            return
+        buffers = [memoryview(buffer) for buffer in buffers]
+        while buffers:
+            sent = self.socket.sendmsg(buffers)
+            # Drop fully sent buffers and trim a partially sent one
+            while buffers and sent >= len(buffers[0]):
+                sent -= len(buffers[0])
+                buffers.pop(0)
+            if buffers and sent:
+                buffers[0] = buffers[0][sent:]
+
+    def recv_message(self):
+        """Receive and decrypt exactly one message; None when the peer closed"""
         try:
-            data = self.socket.recv(bufsize)
-            if not data:
-                print(f"[DEBUG] Received empty data (connection closed)")
+            header = self._read_exact(RecordLayer.HEADER_SIZE, eof_ok=True)
+            if header is None:
+                _message_log.debug("Received empty data (connection closed)")
                 return None
-                
-            print(f"[DEBUG] Received encrypted data")
-            iv, encrypted = data[:16], data[16:]
-            
-            cipher = Cipher(
-                algorithms.AES(self.session_key),
-                modes.CFB(iv),
-                backend=default_backend()
-            )
-            decryptor = cipher.decryptor()
-            decrypted = decryptor.update(encrypted) + decryptor.finalize()
-            
-            print(f"[DEBUG] Decrypted data")
-            return decrypted
+            # Copy the 4-byte header; reading the body may reuse the buffer
+            header = bytes(header)
+            body = self._read_exact(RecordLayer.body_length(header))
+            message = self._records.open(header, body)
+            metrics.message_received(len(message))
+            return message
             
         except Exception as e:
-            print(f"[ERROR] Failed to receive/decrypt data: {str(e)[:50]}")
+            _message_log.error("Failed to receive/decrypt data: %.50s", e)
             raise
         
+    def recv(self, bufsize):
+        """Receive up to bufsize bytes of decrypted data"""
+        if self._pending is None:
+            message = self.recv_message()
+            if message is None:
+                return None
+            self._pending, self._pending_offset = message, 0
+
+        chunk = self._pending[self._pending_offset:self._pending_offset + bufsize]
+        self._pending_offset += len(chunk)
+        if self._pending_offset >= len(self._pending):
+            self._pending = None
+        return chunk
+
+    def fileno(self):
+        return self.socket.fileno()
+
+    def has_buffered_data(self):
+        """True if received bytes or a partly read message are waiting"""
+        return self._pending is not None or self._end > self._start
+
+    def send_stream(self, source, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+        """Send a file, file object, bytes or iterable in encrypted chunks (see streams.send_stream)"""
+        return send_stream(self, source, chunk_size=chunk_size, progress=progress)
+
+    def recv_stream(self, sink, progress=None):
+        """Receive a stream into a path, file object or callable (see streams.recv_stream)"""
+        return recv_stream(self, sink, progress=progress)
+
+    def _read_exact(self, size, eof_ok=False):
+        """Return exactly size bytes from the socket, reading through a reusable buffer"""
+        available = self._end - self._start
+        if available >= size:
+            data = self._view[self._start:self._start + size]
+            self._start += size
+            return data
+
+        if size > len(self._buffer):
+            # Oversized record: read straight into its own buffer
+            data = bytearray(size)
+            view = memoryview(data)
+            view[:available] = self._view[self._start:self._end]
+            self._start = self._end = 0
+            received = available
+            while received < size:
+                count = self.socket.recv_into(view[received:])
+                if not count:
+                    raise ConnectionError("Connection closed mid-record")
+                received += count
+            return view
+
+        if self._start + size > len(self._buffer):
+            # Compact the unread tail to the front of the buffer
+            self._view[:available] = self._view[self._start:self._end]
+            self._start, self._end = 0, available
+
+        while self._end - self._start < size:
+            count = self.socket.recv_into(self._view[self._end:])
+            if not count:
+                if eof_ok and self._end == self._start:
+                    return None
+                raise ConnectionError("Connection closed mid-record")
+            self._end += count
+
+        data = self._view[self._start:self._start + size]
+        self._start += size
+        return data
+        
     def close(self):
         """Close the socket connection"""
-        print(f"[DEBUG] Closing encrypted socket")
+        _message_log.debug("Closing encrypted socket")
         try:
             self.socket.shutdown(socket.SHUT_RDWR)
         except Exception:
             pass
         self.socket.close()
-        print(f"[DEBUG] Socket closed")
\ No newline at end of file
+        _message_log.debug("Socket closed")
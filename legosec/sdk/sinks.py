@@ -0,0 +1,259 @@
+import atexit
+import sqlite3
+import threading
+import time
+from collections import deque
+from legosec.storage.database import get_database
+from legosec import log
+
+_log = log.get_logger("storage")
+
+
+class _BackgroundWriter:
+    """Bounded in-memory queue drained into SQLite by a single writer thread"""
+
+    OVERFLOW_POLICIES = ("block", "drop_oldest", "sample")
+
+    def __init__(self, db_path, flush_interval=0.5, batch_size=256, max_queue=10000,
+                 overflow_policy="drop_oldest", sample_every=10, block_timeout=1.0,
+                 name="legosec-writer"):
+        if overflow_policy not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+        if batch_size < 1 or max_queue < 1:
+            raise ValueError("batch_size and max_queue must be positive")
+
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_queue = max_queue
+        self.overflow_policy = overflow_policy
+        self.sample_every = max(1, int(sample_every))
+        self.block_timeout = block_timeout
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._flush_requested = False
+        self._closed = False
+        self._overflow_seen = 0
+
+        self.stats = {"submitted": 0, "written": 0, "dropped": 0, "failed": 0, "batches": 0}
+
+        self.name = name
+        # Started by the first submit, so a sink that is never used costs no thread
+        self._thread = None
+
+    def submit(self, row):
+        """Queue a row for writing; never raises into the caller"""
+        with self._cond:
+            if self._closed:
+                self.stats["dropped"] += 1
+                return False
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+            if self._coalesce(row):
+                self.stats["submitted"] += 1
+                return True
+
+            if len(self._queue) >= self.max_queue and not self._make_room():
+                self.stats["dropped"] += 1
+                return False
+
+            self._enqueue(row)
+            self.stats["submitted"] += 1
+            if len(self._queue) >= self.batch_size:
+                self._cond.notify_all()
+            return True
+
+    def _make_room(self):
+        """Apply the overflow policy; return True if the new row may be queued"""
+        if self.overflow_policy == "block":
+            deadline = None if self.block_timeout is None else time.monotonic() + self.block_timeout
+            self._cond.notify_all()
+            while len(self._queue) >= self.max_queue and not self._closed:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return not self._closed
+
+        if self.overflow_policy == "sample":
+            # Under sustained overflow keep one row in every `sample_every`
+            self._overflow_seen += 1
+            if self._overflow_seen % self.sample_every:
+                return False
+
+        self._take(1)
+        self.stats["dropped"] += 1
+        return True
+
+    def _coalesce(self, row):
+        """Merge the row into one already queued; return True if merged"""
+        return False
+
+    def _enqueue(self, row):
+        self._queue.append(row)
+
+    def _take(self, count):
+        return [self._queue.popleft() for _ in range(count)]
+
+    def flush(self, timeout=5.0):
+        """Block until every row queued so far has been written"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify_all()
+            while (self._queue or self._in_flight) and self._thread is not None and self._thread.is_alive():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return not self._queue and not self._in_flight
+
+    def close(self, timeout=5.0):
+        """Flush outstanding rows and stop the writer thread"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is None:
+            return
+        self._thread.join(timeout)
+        try:
+            atexit.unregister(self.close)
+        except Exception:
+            pass
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval
+                while (len(self._queue) < self.batch_size and not self._flush_requested
+                       and not self._closed):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+                if not self._queue:
+                    if self._closed:
+                        break
+                    self._flush_requested = False
+                    self._cond.notify_all()
+                    continue
+
+                batch = self._take(min(self.batch_size, len(self._queue)))
+                self._in_flight = len(batch)
+                self._cond.notify_all()
+
+            self._write(batch)
+
+            with self._cond:
+                self._in_flight = 0
+                self._cond.notify_all()
+
+    def _write(self, batch):
+        for attempt in range(3):
+            try:
+                # One transaction per batch on the writer thread's shared connection
+                with get_database(self.db_path).transaction() as conn:
+                    self._write_batch(conn, batch)
+                self.stats["written"] += len(batch)
+                self.stats["batches"] += 1
+                return
+            except sqlite3.OperationalError as e:
+                if "locked" in str(e) and attempt < 2:
+                    time.sleep(0.05 * (attempt + 1))
+                    continue
+                self._fail(batch, e)
+                return
+            except Exception as e:
+                self._fail(batch, e)
+                return
+
+    def _fail(self, batch, error):
+        self.stats["failed"] += len(batch)
+        _log.error("%s failed to write %d rows: %.50s", self.name, len(batch), error)
+
+    def _write_batch(self, conn, batch):
+        raise NotImplementedError
+
+
+class ActivityLogSink(_BackgroundWriter):
+    """Batched writer for ``client_logs`` rows"""
+
+    def __init__(self, db_path, **kwargs):
+        kwargs.setdefault("name", "legosec-log-sink")
+        super().__init__(db_path, **kwargs)
+
+    def _write_batch(self, conn, batch):
+        conn.executemany("""
+            INSERT INTO client_logs
+            (client_id, log_type, message, metadata)
+            VALUES (?, ?, ?, ?)
+        """, batch)
+
+
+class NotificationSink(_BackgroundWriter):
+    """Batched writer for ``notifications`` that coalesces duplicate bursts
+
+    While a notification is still queued, further notifications with the same
+    (type, message, action_url) only bump its repeat count, so a burst becomes
+    a single row. Rows are written with their count when the table has a
+    ``count`` column, otherwise the count is appended to the message.
+    """
+
+    def __init__(self, db_path, **kwargs):
+        kwargs.setdefault("name", "legosec-notification-sink")
+        kwargs.setdefault("max_queue", 1000)
+        if kwargs.get("overflow_policy") == "block":
+            raise ValueError("Notification sink must never block callers")
+        self._pending = {}
+        self._has_count_column = None
+        super().__init__(db_path, **kwargs)
+        self.stats.setdefault("coalesced", 0)
+
+    def _coalesce(self, row):
+        queued = self._pending.get(tuple(row))
+        if queued is None:
+            return False
+        queued[4] += 1
+        self.stats["coalesced"] += 1
+        return True
+
+    def _enqueue(self, row):
+        # (client_id, message, notification_type, action_url, count)
+        queued = [*row, 1]
+        self._pending[tuple(row)] = queued
+        self._queue.append(queued)
+
+    def _take(self, count):
+        batch = super()._take(count)
+        for queued in batch:
+            self._pending.pop(tuple(queued[:4]), None)
+        return batch
+
+    def _write_batch(self, conn, batch):
+        if self._has_count_column is None:
+            columns = conn.execute("PRAGMA table_info(notifications)").fetchall()
+            self._has_count_column = any(column[1] == "count" for column in columns)
+
+        if self._has_count_column:
+            conn.executemany("""
+                INSERT INTO notifications
+                (client_id, message, notification_type, action_url, count)
+                VALUES (?, ?, ?, ?, ?)
+            """, [tuple(queued) for queued in batch])
+        else:
+            conn.executemany("""
+                INSERT INTO notifications
+                (client_id, message, notification_type, action_url)
+                VALUES (?, ?, ?, ?)
+            """, [
+                (client_id, message if count == 1 else f"{message} (x{count})", notification_type, action_url)
+                for client_id, message, notification_type, action_url, count in batch
+            ])
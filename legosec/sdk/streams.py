@@ -0,0 +1,309 @@
+import hashlib
+import mmap
+import os
+import select
+import struct
+import time
+from pathlib import Path
+from OpenSSL.SSL import WantReadError, WantWriteError
+
+# Every stream frame is a type byte followed by its payload. On an
+# EncryptedSocket each frame is one AEAD record; on a TLS-PSK Connection
+# frames are prefixed with a 4-byte length.
+STREAM_START = 1
+STREAM_DATA = 2
+STREAM_END = 3
+
+STREAM_MAGIC = b"LSSTREAM\x01"
+UNKNOWN_SIZE = 0xFFFFFFFFFFFFFFFF
+DEFAULT_CHUNK_SIZE = 256 * 1024
+
+MAX_FRAME_SIZE = DEFAULT_CHUNK_SIZE * 64
+
+_LENGTH = struct.Struct("!I")
+FRAME_LENGTH = _LENGTH
+_TOTAL = struct.Struct("!Q")
+_START_FRAME_SIZE = 1 + len(STREAM_MAGIC) + _TOTAL.size
+TLS_TIMEOUT = 10
+
+
+class _RecordTransport:
+    """Stream frames carried one per EncryptedSocket record"""
+
+    def __init__(self, conn, first_message=None):
+        self.conn = conn
+        self._first = first_message
+
+    def send_frame(self, frame):
+        self.conn.send(frame)
+
+    def recv_frame(self):
+        if self._first is not None:
+            frame, self._first = self._first, None
+            return memoryview(frame)
+        message = self.conn.recv_message()
+        if message is None:
+            raise ConnectionError("Connection closed during stream")
+        return memoryview(message)
+
+
+class _TLSTransport:
+    """Stream frames carried length-prefixed over a TLS-PSK Connection"""
+
+    def __init__(self, conn, initial=b""):
+        self.conn = conn
+        self._buffer = bytearray(initial)
+
+    def send_frame(self, frame):
+        view = memoryview(frame)
+        if len(view) <= 4096:
+            # Small frames go out as one TLS record so the listener sees them whole
+            _tls_sendall(self.conn, _LENGTH.pack(len(view)) + bytes(view))
+        else:
+            _tls_sendall(self.conn, _LENGTH.pack(len(view)))
+            _tls_sendall(self.conn, view)
+
+    def recv_frame(self):
+        (length,) = _LENGTH.unpack(self._read_exact(_LENGTH.size))
+        if length < 1 or length > MAX_FRAME_SIZE:
+            raise ValueError(f"Invalid stream frame length: {length}")
+        return memoryview(self._read_exact(length))
+
+    def _read_exact(self, size):
+        data = bytearray(size)
+        view = memoryview(data)
+        filled = min(size, len(self._buffer))
+        view[:filled] = self._buffer[:filled]
+        del self._buffer[:filled]
+        while filled < size:
+            count = _tls_call(self.conn, self.conn.recv_into, view[filled:])
+            if not count:
+                raise ConnectionError("Connection closed during stream")
+            filled += count
+        return data
+
+
+def _tls_call(conn, operation, *args):
+    """Run a pyOpenSSL I/O call, waiting out WantRead/WantWrite on sockets with timeouts"""
+    while True:
+        try:
+            return operation(*args)
+        except WantReadError:
+            ready = select.select([conn], [], [], TLS_TIMEOUT)[0]
+        except WantWriteError:
+            ready = select.select([], [conn], [], TLS_TIMEOUT)[1]
+        if not ready:
+            raise TimeoutError("TLS connection timed out")
+
+
+def _tls_sendall(conn, data):
+    view = memoryview(data)
+    while view:
+        sent = _tls_call(conn, conn.send, view)
+        view = view[sent:]
+
+
+def _transport(conn, first=None):
+    if hasattr(conn, "recv_message"):
+        return _RecordTransport(conn, first)
+    return _TLSTransport(conn, first or b"")
+
+
+def is_stream_start(data):
+    """Return True if a received message or TLS read begins a stream"""
+    data = bytes(data[:_LENGTH.size + 1 + len(STREAM_MAGIC)])
+    marker = bytes([STREAM_START]) + STREAM_MAGIC
+    return data.startswith(marker) or data.startswith(_LENGTH.pack(_START_FRAME_SIZE) + marker)
+
+
+class _Source:
+    """Copies the next chunk of a stream source into a caller-provided buffer"""
+
+    def __init__(self, source):
+        self.total = UNKNOWN_SIZE
+        self._file = None
+        self._mapped = None
+        self._view = None
+        self._position = 0
+        self._iterator = None
+        self._leftover = memoryview(b"")
+        self._reader = None
+
+        if isinstance(source, (str, Path)):
+            source = self._file = open(source, "rb")
+
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            self._view = memoryview(source).cast("B")
+            self.total = len(self._view)
+        elif hasattr(source, "fileno") and hasattr(source, "read") and self._map(source):
+            pass
+        elif hasattr(source, "readinto"):
+            self._reader = source.readinto
+        elif hasattr(source, "read"):
+            self._reader = self._read_adapter(source.read)
+        else:
+            self._iterator = iter(source)
+
+    def _map(self, source):
+        """Memory-map regular files; returns False for pipes, sockets and empty files"""
+        try:
+            fd = source.fileno()
+            offset = source.tell()
+            size = os.fstat(fd).st_size - offset
+        except (OSError, ValueError):
+            return False
+        if size <= 0:
+            return False
+        self._mapped = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mapped)
+        self._position = offset
+        self.total = size
+        return True
+
+    @staticmethod
+    def _read_adapter(read):
+        def readinto(buffer):
+            data = read(len(buffer))
+            buffer[:len(data)] = data
+            return len(data)
+        return readinto
+
+    def readinto(self, buffer):
+        if self._view is not None:
+            count = min(len(buffer), len(self._view) - self._position)
+            buffer[:count] = self._view[self._position:self._position + count]
+            self._position += count
+            return count
+        if self._reader is not None:
+            return self._reader(buffer) or 0
+
+        while not self._leftover:
+            try:
+                self._leftover = memoryview(next(self._iterator)).cast("B")
+            except StopIteration:
+                return 0
+        count = min(len(buffer), len(self._leftover))
+        buffer[:count] = self._leftover[:count]
+        self._leftover = self._leftover[count:]
+        return count
+
+    def close(self):
+        self._leftover = None
+        if self._view is not None:
+            self._view.release()
+        if self._mapped is not None:
+            self._mapped.close()
+        if self._file is not None:
+            self._file.close()
+
+
+def send_stream(conn, source, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """Send a file, file object, bytes or iterable of chunks over a secure channel
+
+    Data is read and encrypted chunk by chunk, so memory use stays bounded by
+    chunk_size. ``progress(bytes_sent, total_bytes, elapsed_seconds)`` is called
+    after every chunk; total_bytes is None when the size is not known up front.
+    Returns a summary with the byte count, chunk count, duration and throughput.
+    """
+    transport = _transport(conn)
+    digest = hashlib.sha256()
+    frame = bytearray(1 + chunk_size)
+    frame[0] = STREAM_DATA
+    frame_view = memoryview(frame)
+    payload_view = frame_view[1:]
+    sent = chunks = 0
+    start = time.perf_counter()
+
+    reader = _Source(source)
+    try:
+        total = reader.total
+        transport.send_frame(bytes([STREAM_START]) + STREAM_MAGIC + _TOTAL.pack(total))
+        while True:
+            # Each chunk is copied once, straight into the outgoing frame
+            length = reader.readinto(payload_view)
+            if not length:
+                break
+            digest.update(payload_view[:length])
+            transport.send_frame(frame_view[:1 + length])
+            sent += length
+            chunks += 1
+            if progress is not None:
+                progress(sent, None if total == UNKNOWN_SIZE else total, time.perf_counter() - start)
+    finally:
+        reader.close()
+
+    transport.send_frame(bytes([STREAM_END]) + _TOTAL.pack(sent) + digest.digest())
+    return _summary(sent, chunks, start, digest)
+
+
+class StreamReceiver:
+    """Consumes stream frames one at a time; shared by blocking and asyncio readers"""
+
+    def __init__(self, sink, progress=None):
+        self.write = sink if callable(sink) else sink.write
+        self.progress = progress
+        self.digest = hashlib.sha256()
+        self.total = None
+        self.received = 0
+        self.chunks = 0
+        self.started = False
+        self.start = time.perf_counter()
+
+    def feed(self, frame):
+        """Process one frame; returns the transfer summary after the end frame, else None"""
+        if not self.started:
+            if frame[0] != STREAM_START or bytes(frame[1:1 + len(STREAM_MAGIC)]) != STREAM_MAGIC:
+                raise ValueError("Not a stream start frame")
+            (total,) = _TOTAL.unpack(frame[1 + len(STREAM_MAGIC):_START_FRAME_SIZE])
+            self.total = None if total == UNKNOWN_SIZE else total
+            self.started = True
+            return None
+
+        if frame[0] == STREAM_DATA:
+            chunk = frame[1:]
+            self.digest.update(chunk)
+            self.write(chunk)
+            self.received += len(chunk)
+            self.chunks += 1
+            if self.progress is not None:
+                self.progress(self.received, self.total, time.perf_counter() - self.start)
+            return None
+
+        if frame[0] == STREAM_END:
+            (expected,) = _TOTAL.unpack(frame[1:1 + _TOTAL.size])
+            if expected != self.received or bytes(frame[1 + _TOTAL.size:]) != self.digest.digest():
+                raise ValueError("Stream integrity check failed")
+            return _summary(self.received, self.chunks, self.start, self.digest)
+
+        raise ValueError(f"Unexpected stream frame type: {frame[0]}")
+
+
+def recv_stream(conn, sink, progress=None, first=None):
+    """Receive a stream sent with send_stream() into a path, file object or callable
+
+    Each chunk is authenticated by the channel before it is written, and the
+    byte count and SHA-256 of the whole stream are checked against the end
+    frame. ``first`` is the already-read message or bytes that started the
+    stream, when the caller had to inspect it to detect the stream.
+    """
+    if isinstance(sink, (str, Path)):
+        with open(sink, "wb") as f:
+            return recv_stream(conn, f, progress, first)
+
+    transport = _transport(conn, first)
+    receiver = StreamReceiver(sink, progress)
+    while True:
+        summary = receiver.feed(transport.recv_frame())
+        if summary is not None:
+            return summary
+
+
+def _summary(byte_count, chunks, start, digest):
+    elapsed = time.perf_counter() - start
+    return {
+        "bytes": byte_count,
+        "chunks": chunks,
+        "seconds": elapsed,
+        "throughput": byte_count / elapsed if elapsed > 0 else 0.0,
+        "sha256": digest.hexdigest(),
+    }
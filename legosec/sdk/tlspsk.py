@@ -0,0 +1,68 @@
+import threading
+from OpenSSL.SSL import (
+    Context, TLSv1_2_METHOD, OP_NO_COMPRESSION, OP_NO_TICKET, OP_CIPHER_SERVER_PREFERENCE, SESS_CACHE_OFF
+)
+
+DEFAULT_CIPHERS = b'PSK'
+# No session resumption: a resumed session skips the PSK server callback, and with
+# it the per-peer authorization check done there
+DEFAULT_OPTIONS = OP_NO_COMPRESSION | OP_NO_TICKET | OP_CIPHER_SERVER_PREFERENCE
+
+
+class PSKContexts:
+    """Long-lived TLS-PSK client and server contexts shared by every connection
+
+    Building a Context and setting its cipher list per connection is a
+    noticeable share of a PSK handshake, so each side is built once, on first
+    use, and reused. The callbacks are installed once too and look the PSK
+    up per connection: the client side by the peer id stored with
+    ``Connection.set_app_data`` before the handshake, the server side through
+    ``verify_peer(conn, identity)``.
+    """
+
+    def __init__(self, client_id, lookup_psk, verify_peer, ciphers=DEFAULT_CIPHERS, options=DEFAULT_OPTIONS):
+        self.client_id = client_id.encode() if isinstance(client_id, str) else client_id
+        self.lookup_psk = lookup_psk
+        self.verify_peer = verify_peer
+        self.ciphers = ciphers
+        self.options = options
+        self._client = None
+        self._server = None
+        self._lock = threading.Lock()
+        self.stats = {"built": 0, "client_lookups": 0}
+
+    def _build(self):
+        ctx = Context(TLSv1_2_METHOD)
+        ctx.set_cipher_list(self.ciphers)
+        ctx.set_options(self.options)
+        ctx.set_session_cache_mode(SESS_CACHE_OFF)
+        self.stats["built"] += 1
+        return ctx
+
+    def client(self):
+        """Context for outbound PSK connections; set the peer id as app data"""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    ctx = self._build()
+                    ctx.set_psk_client_callback(self._client_callback)
+                    self._client = ctx
+        return self._client
+
+    def server(self):
+        """Context for accepted PSK connections"""
+        if self._server is None:
+            with self._lock:
+                if self._server is None:
+                    ctx = self._build()
+                    ctx.set_psk_server_callback(self.verify_peer)
+                    self._server = ctx
+        return self._server
+
+    def _client_callback(self, conn, hint):
+        self.stats["client_lookups"] += 1
+        peer_id = conn.get_app_data()
+        psk = self.lookup_psk(peer_id) if peer_id else None
+        if not psk:
+            raise ValueError("No PSK available for this peer")
+        return self.client_id, psk
@@ -0,0 +1,121 @@
+import struct
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.backends import default_backend
+from legosec.sdk.resumption import RESUME_MAGIC
+
+# Every v2 connection opens with a fixed 4-byte header: magic | version | type.
+# The listener dispatches on exactly these bytes, which also tell v2 apart from
+# v1 peers (PEM public key, TLS-PSK ClientHello) and resume hellos.
+#
+# ECDH hello: header | curve id | compressed EC point | id length | client id
+# ECDH reply: header | status | compressed EC point (only when accepted)
+MAGIC = b"LS"
+VERSION = 2
+HEADER = struct.Struct("!2sBB")
+HEADER_SIZE = HEADER.size
+
+TYPE_ECDH = 1
+# Types 2-255 are reserved for future modes; unknown types are refused
+
+STATUS_ACCEPT = 1
+STATUS_REJECT = 0
+
+# curve id -> (curve, compressed point size)
+CURVES = {
+    1: (ec.SECP384R1, 49),
+}
+CURVE_P384 = 1
+
+HELLO_PREFIX_SIZE = HEADER_SIZE + 1
+REPLY_PREFIX_SIZE = HEADER_SIZE + 1
+MAX_CLIENT_ID_SIZE = 255
+
+ECDH_V2 = "ecdh_v2"
+ECDH_V1 = "ecdh_v1"
+RESUME = "resume"
+PSK = "psk"
+
+# First HEADER_SIZE bytes -> connection type; anything else is a TLS-PSK ClientHello
+DISPATCH = {
+    HEADER.pack(MAGIC, VERSION, TYPE_ECDH): ECDH_V2,
+    RESUME_MAGIC[:HEADER_SIZE]: RESUME,
+    b"-----"[:HEADER_SIZE]: ECDH_V1,
+}
+
+
+class ProtocolMismatch(ConnectionError):
+    """The peer closed or answered in a way that shows it does not speak v2"""
+
+
+def connection_type(header):
+    """Return the connection type for the first HEADER_SIZE bytes of a connection"""
+    return DISPATCH.get(bytes(header), PSK)
+
+
+def encode_point(public_key):
+    return public_key.public_bytes(
+        encoding=serialization.Encoding.X962,
+        format=serialization.PublicFormat.CompressedPoint
+    )
+
+
+def session_key(private_key, peer_point, curve_id=CURVE_P384):
+    """Derive the v2 session key from our private key and the peer's compressed point"""
+    curve, point_size = CURVES[curve_id]
+    if len(peer_point) != point_size:
+        raise ValueError("Invalid EC point size")
+    peer_pubkey = ec.EllipticCurvePublicKey.from_encoded_point(curve(), bytes(peer_point))
+    return HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=None,
+        info=b'legosec-v2-ecdh-session-key',
+        backend=default_backend()
+    ).derive(private_key.exchange(ec.ECDH(), peer_pubkey))
+
+
+def client_hello(point, client_id, curve_id=CURVE_P384):
+    """Build the v2 ECDH hello carrying our compressed point and identity"""
+    client_id = client_id.encode() if isinstance(client_id, str) else client_id
+    if len(client_id) > MAX_CLIENT_ID_SIZE:
+        raise ValueError("Client id too long")
+    return HEADER.pack(MAGIC, VERSION, TYPE_ECDH) + bytes([curve_id]) + point + bytes([len(client_id)]) + client_id
+
+
+def hello_body_size(prefix):
+    """Bytes after the hello prefix up to and including the id length byte"""
+    magic, version, conn_type = HEADER.unpack(prefix[:HEADER_SIZE])
+    if magic != MAGIC or version != VERSION or conn_type != TYPE_ECDH:
+        raise ValueError("Not a v2 ECDH hello")
+    curve = CURVES.get(prefix[HEADER_SIZE])
+    if curve is None:
+        raise ValueError(f"Unsupported curve id: {prefix[HEADER_SIZE]}")
+    return curve[1] + 1
+
+
+def parse_hello(prefix, body, client_id):
+    """Return (curve id, peer point, client id) from the three parts of a hello"""
+    return prefix[HEADER_SIZE], bytes(body[:-1]), bytes(client_id).decode()
+
+
+def reply(point=None):
+    """Listener reply: accepted with our point, or rejected when point is None"""
+    header = HEADER.pack(MAGIC, VERSION, TYPE_ECDH)
+    if point is None:
+        return header + bytes([STATUS_REJECT])
+    return header + bytes([STATUS_ACCEPT]) + point
+
+
+def check_reply_prefix(prefix, curve_id=CURVE_P384):
+    """Validate the reply prefix; returns the point size that follows an acceptance
+
+    Raises ProtocolMismatch if the peer closed or did not answer in v2, and
+    PermissionError if it refused us.
+    """
+    if len(prefix) < REPLY_PREFIX_SIZE or connection_type(prefix[:HEADER_SIZE]) != ECDH_V2:
+        raise ProtocolMismatch("Peer does not speak wire protocol v2")
+    if prefix[HEADER_SIZE] != STATUS_ACCEPT:
+        raise PermissionError("Peer refused the handshake")
+    return CURVES[curve_id][1]
@@ -0,0 +1,315 @@
+import os
+import json
+import sqlite3
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from legosec import log, metrics
+
+_log = log.get_logger("storage")
+
+_execute_seconds = metrics.DB_SECONDS.labels(op="execute")
+_fetch_seconds = metrics.DB_SECONDS.labels(op="fetch")
+_transaction_seconds = metrics.DB_SECONDS.labels(op="transaction")
+
+
+def _migrate_peer_authorizations(conn):
+    """Move the JSON authorized_peers lists into indexed (client_id, peer_id) rows"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS peer_authorizations (
+            client_id TEXT NOT NULL,
+            peer_id TEXT NOT NULL,
+            authorized_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (client_id, peer_id)
+        )
+    """)
+    rows = conn.execute("""
+        SELECT client_id, authorized_peers FROM clients
+        WHERE authorized_peers IS NOT NULL AND authorized_peers NOT IN ('', '[]')
+    """).fetchall()
+    for client_id, authorized_peers in rows:
+        try:
+            peers = json.loads(authorized_peers)
+        except json.JSONDecodeError:
+            _log.warning("Skipping invalid peer list for %.6s...", client_id)
+            continue
+        if isinstance(peers, list):
+            conn.executemany(
+                "INSERT OR IGNORE INTO peer_authorizations (client_id, peer_id) VALUES (?, ?)",
+                [(client_id, str(peer_id)) for peer_id in peers]
+            )
+
+
+# Ordered schema migrations; entry N brings the database to user_version N + 1.
+# An entry is either a list of statements or a callable taking the connection.
+MIGRATIONS = [
+    [
+        """
+        CREATE TABLE IF NOT EXISTS clients (
+            client_id TEXT PRIMARY KEY,
+            client_name TEXT NOT NULL,
+            secret_id BLOB NOT NULL,
+            authorized_peers TEXT,
+            expires_at TIMESTAMP NOT NULL,
+            public_key BLOB,
+            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS peer_status (
+            client_id TEXT PRIMARY KEY,
+            is_ready BOOLEAN,
+            last_update TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS psk_exchange (
+            from_id TEXT,
+            to_id TEXT,
+            shared_psk BLOB,
+            PRIMARY KEY (from_id, to_id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS ecdh_sessions (
+            session_id TEXT PRIMARY KEY,
+            peer_id TEXT NOT NULL,
+            public_key BLOB,
+            created_at TIMESTAMP
+        )
+        """,
+    ],
+    _migrate_peer_authorizations,
+    [
+        # Per-client change counters so caches can spot writes from other processes
+        """
+        CREATE TABLE IF NOT EXISTS peer_authorization_versions (
+            client_id TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS peer_authorizations_insert
+        AFTER INSERT ON peer_authorizations
+        BEGIN
+            INSERT INTO peer_authorization_versions (client_id, version) VALUES (NEW.client_id, 1)
+            ON CONFLICT(client_id) DO UPDATE SET version = version + 1;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS peer_authorizations_delete
+        AFTER DELETE ON peer_authorizations
+        BEGIN
+            INSERT INTO peer_authorization_versions (client_id, version) VALUES (OLD.client_id, 1)
+            ON CONFLICT(client_id) DO UPDATE SET version = version + 1;
+        END
+        """,
+    ],
+    [
+        # Session resumption tickets; keyed per owning client because several
+        # clients on one host share this database
+        """
+        CREATE TABLE ecdh_sessions_v4 (
+            owner_id TEXT NOT NULL DEFAULT '',
+            session_id TEXT NOT NULL,
+            peer_id TEXT NOT NULL,
+            public_key BLOB,
+            created_at TIMESTAMP,
+            role TEXT,
+            resumption_secret BLOB,
+            expires_at TIMESTAMP,
+            resumed_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (owner_id, session_id)
+        )
+        """,
+        """
+        INSERT INTO ecdh_sessions_v4 (session_id, peer_id, public_key, created_at)
+        SELECT session_id, peer_id, public_key, created_at FROM ecdh_sessions
+        """,
+        "DROP TABLE ecdh_sessions",
+        "ALTER TABLE ecdh_sessions_v4 RENAME TO ecdh_sessions",
+        "CREATE INDEX IF NOT EXISTS ecdh_sessions_peer ON ecdh_sessions (owner_id, peer_id, role)",
+    ],
+    [
+        # The peer list in the JSON form of the legacy clients.authorized_peers
+        # column, built when read so writes never re-serialize it
+        """
+        CREATE VIEW IF NOT EXISTS client_authorized_peers AS
+        SELECT client_id, json_group_array(peer_id) AS authorized_peers
+        FROM (SELECT client_id, peer_id FROM peer_authorizations ORDER BY client_id, rowid)
+        GROUP BY client_id
+        """,
+    ],
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+class _ThreadConnection:
+    """A thread's connection, held in thread-local storage so it is dropped when the thread exits"""
+    __slots__ = ("conn", "__weakref__")
+
+    def __init__(self, conn):
+        self.conn = conn
+
+
+class Database:
+    """Shared SQLite storage with one persistent WAL-mode connection per thread
+
+    A thread's connection is closed when the thread exits, or for all
+    threads at once by close().
+    """
+
+    def __init__(self, db_path, busy_timeout=5000, synchronous="NORMAL", cached_statements=256):
+        self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        self.synchronous = synchronous
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._connections = set()
+        self._connections_lock = threading.Lock()
+        self._schema_ready = False
+        # Set by get_database(ensure_schema=False): the first connection creates the schema instead
+        self.ensure_schema_on_connect = False
+        # Reentrant, since ensuring the schema from connection() opens that same connection
+        self._schema_lock = threading.RLock()
+
+    def connection(self):
+        """Return this thread's connection, opening and tuning it on first use"""
+        holder = getattr(self._local, "holder", None)
+        if holder is None:
+            # Autocommit mode; multi-statement writes go through transaction()
+            conn = sqlite3.connect(
+                self.db_path,
+                timeout=self.busy_timeout / 1000,
+                isolation_level=None,
+                check_same_thread=False,
+                cached_statements=self.cached_statements
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA synchronous={self.synchronous}")
+            conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout)}")
+            holder = self._local.holder = _ThreadConnection(conn)
+            with self._connections_lock:
+                self._connections.add(conn)
+            weakref.finalize(holder, self._release, conn)
+            if self.ensure_schema_on_connect and not self._schema_ready:
+                self.ensure_schema()
+        return holder.conn
+
+    def _release(self, conn):
+        """Close a connection whose thread has exited"""
+        with self._connections_lock:
+            self._connections.discard(conn)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def ensure_schema(self):
+        """Create or migrate the schema once per process"""
+        if self._schema_ready:
+            return
+        with self._schema_lock:
+            if self._schema_ready:
+                return
+            conn = self.connection()
+            if self._schema_ready:
+                return
+            with self.transaction():
+                version = conn.execute("PRAGMA user_version").fetchone()[0]
+                for index in range(version, SCHEMA_VERSION):
+                    migration = MIGRATIONS[index]
+                    if callable(migration):
+                        migration(conn)
+                    else:
+                        for statement in migration:
+                            conn.execute(statement)
+                if version < SCHEMA_VERSION:
+                    conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+                    _log.debug("Database schema migrated from v%s to v%s", version, SCHEMA_VERSION)
+            self._schema_ready = True
+
+    @contextmanager
+    def transaction(self):
+        """Run the enclosed statements in one write transaction
+
+        Its latency, waiting for the write lock included, is recorded under
+        legosec_db_operation_seconds{op="transaction"}.
+        """
+        conn = self.connection()
+        if conn.in_transaction:
+            yield conn
+            return
+        start = time.perf_counter()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            _transaction_seconds.observe(time.perf_counter() - start)
+
+    def execute(self, sql, params=()):
+        start = time.perf_counter()
+        try:
+            return self.connection().execute(sql, params)
+        finally:
+            _execute_seconds.observe(time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_params):
+        with self.transaction() as conn:
+            return conn.executemany(sql, seq_of_params)
+
+    def fetchone(self, sql, params=()):
+        start = time.perf_counter()
+        try:
+            return self.connection().execute(sql, params).fetchone()
+        finally:
+            _fetch_seconds.observe(time.perf_counter() - start)
+
+    def fetchall(self, sql, params=()):
+        start = time.perf_counter()
+        try:
+            return self.connection().execute(sql, params).fetchall()
+        finally:
+            _fetch_seconds.observe(time.perf_counter() - start)
+
+    def close(self):
+        """Close every connection opened through this instance"""
+        with self._connections_lock:
+            connections, self._connections = self._connections, set()
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._local = threading.local()
+
+
+def get_database(db_path="kdc_database.db", ensure_schema=True):
+    """Return the process-wide Database for a path, bootstrapping its schema
+
+    With ensure_schema=False nothing touches the file yet; the schema is then
+    created or migrated when the first connection is opened.
+    """
+    key = os.path.abspath(db_path)
+    db = _registry.get(key)
+    if db is None:
+        with _registry_lock:
+            db = _registry.get(key)
+            if db is None:
+                db = Database(db_path)
+                _registry[key] = db
+    if ensure_schema:
+        db.ensure_schema()
+    else:
+        db.ensure_schema_on_connect = True
+    return db
@@ -0,0 +1,198 @@
+import unittest
+import io
+import os
+import shutil
+import socket
+import tempfile
+import time
+from cryptography.hazmat.primitives import serialization, hashes
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from OpenSSL.SSL import Context, Connection, TLSv1_2_METHOD
+from legosec.sdk.aio import AsyncPeerListener, PEM_END
+from legosec.sdk.sdk import SecureChannelSDK, EncryptedSocket
+from legosec.sdk.streams import send_stream, _tls_call, _tls_sendall
+from legosec.sdk import resumption, wire
+from legosec.sdk.keypool import generate_ephemeral_key
+from legosec.sdk.resumption import SessionTicketStore
+from legosec.sdk.tlspsk import PSKContexts
+from legosec.storage.database import get_database
+
+PSK = b"k" * 32
+
+
+class _PeerSDK:
+    """The SDK surface the listener uses, without identity files or a KDC"""
+    client_id = "listener-id"
+    _ecdh_respond = SecureChannelSDK._ecdh_respond
+    _ecdh_v2_respond = SecureChannelSDK._ecdh_v2_respond
+    _peer_message_response = SecureChannelSDK._peer_message_response
+    _stream_response = SecureChannelSDK._stream_response
+    _accept_resume_hello = SecureChannelSDK._accept_resume_hello
+
+    def __init__(self, db_path):
+        self.session_keys = {}
+        self.session_tickets = SessionTicketStore(get_database(db_path), self.client_id)
+        self.streams = []
+        self.identity_manager = self
+        self.psk_contexts = PSKContexts(self.client_id, lambda peer_id: PSK, self._verify_peer)
+
+    def is_peer_authorized(self, peer_id):
+        return peer_id == "client-a"
+
+    def _verify_peer(self, conn, identity):
+        conn.set_app_data(identity.decode())
+        return PSK if identity == b"client-a" else None
+
+    def _stream_sink(self, peer_id=None):
+        self.streams.append(io.BytesIO())
+        return self.streams[-1]
+
+    def _update_peer_status(self, ready=True):
+        self.ready = ready
+
+    def _log_activity(self, *args, **kwargs):
+        pass
+
+    def _send_notification(self, *args):
+        pass
+
+
+class TestAsyncPeerListener(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, "kdc_database.db")
+        self.sdk = _PeerSDK(self.db_path)
+        self.listener = AsyncPeerListener(self.sdk)
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            self.port = probe.getsockname()[1]
+        self.listener.start_in_thread(self.port, "127.0.0.1")
+
+    def tearDown(self):
+        self.listener.stop()
+        get_database(self.db_path).close()
+        shutil.rmtree(self.tmp_dir)
+
+    def _ecdh_connect(self, client_id="client-a"):
+        sock = socket.create_connection(("127.0.0.1", self.port), timeout=5)
+        private = ec.generate_private_key(ec.SECP384R1())
+        sock.sendall(private.public_key().public_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo
+        ))
+        data = b""
+        while not data.endswith(b"IDENTIFY"):
+            chunk = sock.recv(4096)
+            if not chunk:
+                raise ConnectionError("Listener closed during handshake")
+            data += chunk
+        peer_pubkey = serialization.load_pem_public_key(data[:data.index(PEM_END) + len(PEM_END)])
+        session_key = HKDF(algorithm=hashes.SHA256(), length=32, salt=None,
+                           info=b'ecdh-session-key').derive(private.exchange(ec.ECDH(), peer_pubkey))
+        sock.sendall(client_id.encode())
+        # The v1 handshake does not acknowledge the identity, so let it arrive on its own
+        time.sleep(0.05)
+        self.session_key = session_key
+        return EncryptedSocket(sock, session_key)
+
+    def _ecdh_v2_connect(self, client_id="client-a"):
+        sock = socket.create_connection(("127.0.0.1", self.port), timeout=5)
+        private, _, point = generate_ephemeral_key()
+        sock.sendall(wire.client_hello(point, client_id))
+        point_size = wire.check_reply_prefix(resumption.recv_exact(sock, wire.REPLY_PREFIX_SIZE))
+        self.session_key = wire.session_key(private, resumption.recv_exact(sock, point_size))
+        return EncryptedSocket(sock, self.session_key)
+
+    def _psk_connect(self):
+        ctx = Context(TLSv1_2_METHOD)
+        ctx.set_cipher_list(b'PSK')
+        ctx.set_psk_client_callback(lambda conn, hint: (b"client-a", PSK))
+        sock = socket.create_connection(("127.0.0.1", self.port), timeout=5)
+        conn = Connection(ctx, sock)
+        conn.set_connect_state()
+        _tls_call(conn, conn.do_handshake)
+        return conn
+
+    def test_ecdh_messages(self):
+        """Test that ECDH peers get the same ACKs as from the threaded listener"""
+        self.assertTrue(self.sdk.ready)
+        conn = self._ecdh_connect()
+        for text in (b"Hello", b"again"):
+            conn.send(text)
+            self.assertEqual(conn.recv_message(), b"ACK from listen...")
+        conn.close()
+        self.assertIn("client-a", self.sdk.session_keys)
+
+    def test_ecdh_v2_messages(self):
+        """Test that v2 peers get a session in one round trip and the same ACKs"""
+        conn = self._ecdh_v2_connect()
+        conn.send(b"Hello")
+        self.assertEqual(conn.recv_message(), b"ACK from listen...")
+        conn.close()
+        self.assertEqual(self.sdk.session_keys["client-a"], self.session_key)
+
+    def test_ecdh_v2_unauthorized_peer(self):
+        """Test that an unauthorized v2 peer gets an explicit refusal"""
+        with self.assertRaises(PermissionError):
+            self._ecdh_v2_connect("intruder")
+
+    def test_ecdh_unauthorized_peer(self):
+        """Test that an unauthorized ECDH peer is disconnected"""
+        conn = self._ecdh_connect("intruder")
+        self.assertIsNone(conn.recv_message())
+        conn.close()
+
+    def test_ecdh_stream(self):
+        """Test that streams are received over ECDH connections"""
+        payload = os.urandom(300 * 1024)
+        conn = self._ecdh_connect()
+        summary = conn.send_stream(payload, chunk_size=64 * 1024)
+        self.assertEqual(conn.recv_message(), f"ACK from listen... stream {len(payload)} bytes".encode())
+        conn.close()
+        self.assertEqual(self.sdk.streams[0].getvalue(), payload)
+        self.assertEqual(summary["bytes"], len(payload))
+
+    def test_session_resumption(self):
+        """Test that a ticket from a full handshake resumes with fresh keys"""
+        conn = self._ecdh_connect()
+        conn.send(b"Hello")
+        self.assertEqual(conn.recv_message(), b"ACK from listen...")
+        conn.close()
+
+        ticket_id, secret = resumption.derive_resumption_ticket(self.session_key)
+        sock = socket.create_connection(("127.0.0.1", self.port), timeout=5)
+        hello, client_nonce = resumption.client_hello(ticket_id, secret)
+        sock.sendall(hello)
+        reply = resumption.recv_exact(sock, resumption.RESUME_REPLY_SIZE)
+        session_key = resumption.verify_reply(reply, ticket_id, secret, client_nonce)
+        self.assertIsNotNone(session_key)
+        self.assertNotEqual(session_key, self.session_key)
+        resumed = EncryptedSocket(sock, session_key)
+        resumed.send(b"Hello again")
+        self.assertEqual(resumed.recv_message(), b"ACK from listen...")
+        resumed.close()
+        self.assertEqual(self.sdk.session_tickets.snapshot()["resumed"], 1)
+
+    def test_stop_shuts_down_own_executor(self):
+        """Test that stop() releases the handshake threads the listener created"""
+        self.listener.stop()
+        with self.assertRaises(RuntimeError):
+            self.listener.executor.submit(int)
+        self.assertFalse(self.sdk.ready)
+
+    def test_psk_messages_and_stream(self):
+        """Test that TLS-PSK peers can exchange messages and streams"""
+        conn = self._psk_connect()
+        _tls_sendall(conn, b"Hello over PSK")
+        self.assertEqual(_tls_call(conn, conn.recv, 1024), b"ACK from listen...")
+        payload = os.urandom(200 * 1024)
+        send_stream(conn, payload, chunk_size=32 * 1024)
+        self.assertEqual(_tls_call(conn, conn.recv, 1024),
+                         f"ACK from listen... stream {len(payload)} bytes".encode())
+        conn.close()
+        self.assertEqual(self.sdk.streams[0].getvalue(), payload)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,62 @@
+import unittest
+from legosec.benchmarks import load, suite
+
+
+def _run(results):
+    return {"environment": {}, "created": "", "quick": True, "results": results}
+
+
+class TestBenchmarkSuite(unittest.TestCase):
+    def test_compare_flags_regressions_by_direction(self):
+        """Test that throughput drops and latency rises beyond the threshold are regressions"""
+        baseline = _run({
+            "records.64": {"msgs_per_sec": 1000.0},
+            "handshake.ecdh": {"p50": 0.002, "p99": 0.004},
+            "handshake.tls_psk": {"skipped": "no PSK support"},
+        })
+        current = _run({
+            "records.64": {"msgs_per_sec": 800.0},
+            "handshake.ecdh": {"p50": 0.0015, "p99": 0.0042},
+            "handshake.tls_psk": {"p50": 0.001, "p99": 0.002},
+            "kdf.hkdf": {"ops_per_sec": 5.0},
+        })
+        rows = {(name, metric): (change, regressed)
+                for name, metric, _, _, change, regressed in suite.compare(baseline, current, threshold=0.1)}
+
+        self.assertEqual(set(rows), {("records.64", "msgs_per_sec"), ("handshake.ecdh", "p50"), ("handshake.ecdh", "p99")})
+        self.assertAlmostEqual(rows["records.64", "msgs_per_sec"][0], -0.2)
+        self.assertTrue(rows["records.64", "msgs_per_sec"][1])
+        self.assertAlmostEqual(rows["handshake.ecdh", "p50"][0], 0.25)
+        self.assertFalse(rows["handshake.ecdh", "p50"][1])
+        self.assertFalse(rows["handshake.ecdh", "p99"][1])
+
+    def test_run_selects_by_name(self):
+        """Test that --only picks single benchmarks out of a group"""
+        results = suite.run(only=["kdf.hkdf"], quick=True)["results"]
+        self.assertEqual(list(results), ["kdf.hkdf"])
+        self.assertGreater(results["kdf.hkdf"]["ops_per_sec"], 0)
+
+
+class TestLoadHarness(unittest.TestCase):
+    def test_find_leaks(self):
+        """Test that growth after warmup beyond the tolerance is flagged, and warmup growth is not"""
+        rows = [{"elapsed": t, "threads": 40, "fds": 50 + 10 * t, "rss_mb": 60.0 if t < 2 else 100.0}
+                for t in range(1, 11)]
+        leaks = load.find_leaks(rows, warmup=2, tolerances={"threads": 4, "fds": 16, "rss_mb": 64.0})
+        self.assertEqual(leaks, {"fds": (80, 140)})
+
+        idle = ({"threads": 40, "fds": 10, "rss_mb": 50.0}, {"threads": 48, "fds": 90, "rss_mb": 90.0})
+        leaks = load.find_leaks(rows[:2], warmup=2, idle=idle)
+        self.assertEqual(leaks, {"idle_threads": (40, 48)})
+
+    def test_churn_run(self):
+        """Test a short in-process churn run against a real listener"""
+        report = load.run(clients=2, workload="churn", duration=1.0, interval=0.5, workers=4)
+        self.assertEqual(len(report["rows"]), 2)
+        self.assertGreater(sum(row["messages_per_sec"] for row in report["rows"]), 0)
+        self.assertEqual(sum(row["errors"] for row in report["rows"]), 0)
+        self.assertGreater(sum(row["listener_handshakes"].get("ecdh", 0) for row in report["rows"]), 0)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,124 @@
+import unittest
+import os
+import json
+import sqlite3
+import shutil
+import tempfile
+from legosec.identity.identity import IdentityManager
+from legosec.storage.database import Database
+
+
+class TestPeerAuthorization(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, "kdc_database.db")
+        self.manager = IdentityManager("client_a", "ClientA", identity_dir=self.tmp_dir, db_path=self.db_path)
+
+    def tearDown(self):
+        self.manager.db.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_authorize_and_check(self):
+        """Test single peer authorization and lookup"""
+        self.assertFalse(self.manager.is_peer_authorized("client_b"))
+        self.manager.authorize_peer("client_b")
+        self.assertTrue(self.manager.is_peer_authorized("client_b"))
+        self.assertEqual(self.manager.get_authorized_peers(), ["client_b"])
+
+    def test_bulk_authorize_and_revoke(self):
+        """Test bulk authorization and revocation counts"""
+        peers = [f"client_{i:04d}" for i in range(1000)]
+        self.assertEqual(self.manager.authorize_peers(peers), 1000)
+        self.assertEqual(self.manager.authorize_peers(peers[:10]), 0)
+        self.assertEqual(self.manager.revoke_peers(peers[:500]), 500)
+        self.assertFalse(self.manager.is_peer_authorized("client_0001"))
+        self.assertTrue(self.manager.is_peer_authorized("client_0999"))
+        self.assertEqual(len(self.manager.get_authorized_peers()), 500)
+
+    def test_update_replaces_peer_set(self):
+        """Test that update_authorized_peers replaces the whole set"""
+        self.manager.authorize_peers(["client_b", "client_c"])
+        self.manager.update_authorized_peers(["client_d"])
+        self.assertEqual(self.manager.get_authorized_peers(), ["client_d"])
+        with self.assertRaises(ValueError):
+            self.manager.update_authorized_peers("client_e")
+
+    def test_legacy_peer_view(self):
+        """Test that client_authorized_peers gives the authorization rows as the legacy JSON list"""
+        view = lambda: json.loads(self.manager.db.fetchone(
+            "SELECT authorized_peers FROM client_authorized_peers WHERE client_id = ?", ("client_a",))[0])
+        self.manager.authorize_peers(["client_b", "client_c"])
+        self.assertEqual(view(), ["client_b", "client_c"])
+        self.manager.revoke_peer("client_b")
+        self.assertEqual(view(), ["client_c"])
+        self.manager.update_authorized_peers(["client_d"])
+        self.assertEqual(view(), ["client_d"])
+
+    def test_authorizations_are_per_client(self):
+        """Test that peers authorized by one client are not visible to another"""
+        other = IdentityManager("client_z", "ClientZ", identity_dir=self.tmp_dir, db_path=self.db_path)
+        self.manager.authorize_peer("client_b")
+        self.assertFalse(other.is_peer_authorized("client_b"))
+
+    def test_json_peer_list_migration(self):
+        """Test that legacy JSON peer lists are migrated into rows"""
+        legacy_path = os.path.join(self.tmp_dir, "legacy.db")
+        legacy = Database(legacy_path)
+        legacy.execute("""
+            CREATE TABLE clients (
+                client_id TEXT PRIMARY KEY, client_name TEXT NOT NULL, secret_id BLOB NOT NULL,
+                authorized_peers TEXT, expires_at TIMESTAMP NOT NULL
+            )
+        """)
+        legacy.execute(
+            "INSERT INTO clients VALUES (?, ?, ?, ?, ?)",
+            ("client_a", "ClientA", b"secret", json.dumps(["client_b", "client_c"]), "2099-01-01T00:00:00")
+        )
+        legacy.close()
+
+        manager = IdentityManager("client_a", "ClientA", identity_dir=self.tmp_dir, db_path=legacy_path)
+        self.assertEqual(manager.get_authorized_peers(), ["client_b", "client_c"])
+        manager.db.close()
+
+
+class TestAuthorizationCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, "kdc_database.db")
+        self.manager = IdentityManager("client_a", "ClientA", identity_dir=self.tmp_dir, db_path=self.db_path)
+        self.cache = self.manager.authz_cache
+
+    def tearDown(self):
+        self.cache.close()
+        self.manager.db.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_lookups_hit_after_first_load(self):
+        """Test that only the first lookup per client reaches the database"""
+        self.manager.authorize_peer("client_b")
+        for _ in range(10):
+            self.assertTrue(self.manager.is_peer_authorized("client_b"))
+        stats = self.manager.authorization_cache_stats()
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hits"], 9)
+
+    def test_local_writes_invalidate(self):
+        """Test that authorize and revoke are visible immediately"""
+        self.assertFalse(self.manager.is_peer_authorized("client_b"))
+        self.manager.authorize_peer("client_b")
+        self.assertTrue(self.manager.is_peer_authorized("client_b"))
+        self.manager.revoke_peer("client_b")
+        self.assertFalse(self.manager.is_peer_authorized("client_b"))
+
+    def test_external_writes_are_detected(self):
+        """Test that writes from another connection invalidate the cache"""
+        self.cache.revalidate_interval = 0
+        self.assertFalse(self.manager.is_peer_authorized("client_b"))
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("INSERT INTO peer_authorizations (client_id, peer_id) VALUES ('client_a', 'client_b')")
+        self.assertTrue(self.manager.is_peer_authorized("client_b"))
+        self.assertEqual(self.cache.stats()["revalidations"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
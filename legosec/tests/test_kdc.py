@@ -0,0 +1,149 @@
+import unittest
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from legosec.sdk.kdc import KDCClient, KDCKeyCache, KDCKeyMismatch, fingerprint
+
+
+def _pem(key):
+    return key.public_key().public_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+
+
+class _FakeKDC:
+    """Sends its public key, then echoes back whatever parameter it receives"""
+
+    def __init__(self, key):
+        self.pem = _pem(key)
+        self.server = socket.create_server(("127.0.0.1", 0))
+        self.endpoint = self.server.getsockname()
+        self.connections = 0
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            with conn:
+                self.connections += 1
+                conn.sendall(self.pem)
+                conn.sendall(conn.recv(4096))
+
+    def close(self):
+        self.server.close()
+
+
+def _exchange(sock, key):
+    sock.sendall(b"param")
+    return sock.recv(4096), key
+
+
+def _dead_endpoint():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()
+
+
+class TestKDCClient(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        cls.other_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.key_path = os.path.join(self.tmp_dir, "kdc_public_key.pem")
+        self.kdc = _FakeKDC(self.key)
+
+    def tearDown(self):
+        self.kdc.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_key_is_cached_on_disk(self):
+        """Test that the KDC key is parsed once, written to disk and loaded from there later"""
+        client = KDCClient([self.kdc.endpoint], KDCKeyCache(self.key_path))
+        for _ in range(3):
+            reply, key = client.exchange(_exchange)
+            self.assertEqual(reply, b"param")
+        self.assertEqual(client.key_cache.stats["parsed"], 1)
+        self.assertEqual(client.key_cache.stats["hits"], 2)
+        with open(self.key_path, "rb") as f:
+            self.assertEqual(f.read(), self.kdc.pem)
+
+        restarted = KDCKeyCache(self.key_path)
+        self.assertEqual(restarted.key().public_numbers(), key.public_numbers())
+
+    def test_pinned_fingerprint(self):
+        """Test that a key other than the pinned one is refused"""
+        pinned = fingerprint(_pem(self.other_key))
+        client = KDCClient([self.kdc.endpoint], KDCKeyCache(self.key_path, pinned=pinned))
+        with self.assertRaises(ConnectionError) as ctx:
+            client.exchange(_exchange)
+        self.assertIsInstance(ctx.exception.__cause__, KDCKeyMismatch)
+        self.assertFalse(os.path.exists(self.key_path))
+
+        client = KDCClient([self.kdc.endpoint], KDCKeyCache(self.key_path, pinned=fingerprint(self.kdc.pem)))
+        self.assertEqual(client.exchange(_exchange)[0], b"param")
+
+    def test_changed_key_is_refused(self):
+        """Test that without a pin a KDC key other than the cached one is refused, not taken as a rotation"""
+        with open(self.key_path, "wb") as f:
+            f.write(_pem(self.other_key))
+        cache = KDCKeyCache(self.key_path)
+        with self.assertRaises(ConnectionError) as ctx:
+            KDCClient([self.kdc.endpoint], cache).exchange(_exchange)
+        self.assertIsInstance(ctx.exception.__cause__, KDCKeyMismatch)
+        self.assertEqual(cache.stats["rotations"], 0)
+        with open(self.key_path, "rb") as f:
+            self.assertEqual(f.read(), _pem(self.other_key))
+
+    def test_rotate(self):
+        """Test that rotate() replaces the cached key so the new KDC key is accepted"""
+        with open(self.key_path, "wb") as f:
+            f.write(_pem(self.other_key))
+        cache = KDCKeyCache(self.key_path)
+        cache.rotate(self.kdc.pem)
+        self.assertEqual(cache.stats["rotations"], 1)
+        self.assertEqual(KDCClient([self.kdc.endpoint], cache).exchange(_exchange)[0], b"param")
+        with open(self.key_path, "rb") as f:
+            self.assertEqual(f.read(), self.kdc.pem)
+
+        pinned = KDCKeyCache(self.key_path, pinned=fingerprint(self.kdc.pem))
+        with self.assertRaises(KDCKeyMismatch):
+            pinned.rotate(_pem(self.other_key))
+
+    def test_failover_skips_down_endpoint(self):
+        """Test that a dead endpoint fails over at once and is skipped afterwards"""
+        dead = _dead_endpoint()
+        client = KDCClient([dead, self.kdc.endpoint], KDCKeyCache(self.key_path), connect_timeout=0.5)
+        start = time.monotonic()
+        self.assertEqual(client.exchange(_exchange)[0], b"param")
+        self.assertLess(time.monotonic() - start, 2.0)
+        self.assertEqual(client.stats["failovers"], 1)
+        self.assertEqual(client.candidates()[0], self.kdc.endpoint)
+        health = client.health()
+        self.assertTrue(health[f"{dead[0]}:{dead[1]}"]["down"])
+
+        client.exchange(_exchange)
+        self.assertEqual(client.stats["failovers"], 1)
+
+    def test_all_endpoints_down(self):
+        """Test that an exchange with no reachable KDC raises ConnectionError"""
+        client = KDCClient([_dead_endpoint(), _dead_endpoint()], KDCKeyCache(self.key_path), connect_timeout=0.5)
+        with self.assertRaises(ConnectionError):
+            client.exchange(_exchange)
+        # Every endpoint is down, so they are still all tried next time
+        self.assertEqual(len(client.candidates()), 2)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
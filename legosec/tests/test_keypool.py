@@ -0,0 +1,74 @@
+import unittest
+import time
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from legosec.sdk.keypool import EphemeralKeyPool
+
+
+class TestEphemeralKeyPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = EphemeralKeyPool(depth=4, low_water=1)
+        self.assertTrue(self.pool.wait_ready(timeout=10))
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_take_returns_matching_pem(self):
+        """Test that both serialized public keys belong to the private key"""
+        private_key, public_pem, public_point = self.pool.take()
+        loaded = serialization.load_pem_public_key(public_pem)
+        self.assertIsInstance(private_key, ec.EllipticCurvePrivateKey)
+        self.assertEqual(loaded.public_numbers(), private_key.public_key().public_numbers())
+        decoded = ec.EllipticCurvePublicKey.from_encoded_point(ec.SECP384R1(), public_point)
+        self.assertEqual(decoded.public_numbers(), loaded.public_numbers())
+
+    def test_keys_are_never_reused(self):
+        """Test that every take hands out a different key pair, also past the pool depth"""
+        pems = {self.pool.take()[1] for _ in range(12)}
+        self.assertEqual(len(pems), 12)
+        stats = self.pool.snapshot()
+        self.assertEqual(stats["hits"] + stats["misses"], 12)
+
+    def test_refills_below_low_water(self):
+        """Test that the worker tops the pool back up after it drops to the low-water mark"""
+        for _ in range(3):
+            self.pool.take()
+        self.assertTrue(self.pool.wait_ready(timeout=10))
+        stats = self.pool.snapshot()
+        self.assertEqual(stats["ready"], 4)
+        self.assertGreaterEqual(stats["refills"], 2)
+
+    def test_empty_pool_generates_inline(self):
+        """Test that a zero-depth pool still serves keys, counted as misses"""
+        pool = EphemeralKeyPool(depth=0, low_water=0)
+        self.assertIsNotNone(pool.take()[0])
+        self.assertEqual(pool.snapshot()["misses"], 1)
+        pool.close()
+
+    def test_invalid_limits(self):
+        """Test that a low-water mark at or above the depth is refused"""
+        with self.assertRaises(ValueError):
+            EphemeralKeyPool(depth=2, low_water=3)
+        # The worker would never find the pool above the mark and spin refilling nothing
+        with self.assertRaises(ValueError):
+            EphemeralKeyPool(depth=2, low_water=2)
+
+    def test_worker_starts_lazily(self):
+        """Test that no keys are generated before the first take"""
+        pool = EphemeralKeyPool(depth=2, low_water=0)
+        time.sleep(0.05)
+        self.assertIsNone(pool._thread)
+        self.assertEqual(pool.snapshot()["generated"], 0)
+        pool.take()
+        self.assertIsNotNone(pool._thread)
+        pool.close()
+
+    def test_full_pool_worker_is_idle(self):
+        """Test that a full pool does not keep running refill rounds"""
+        refills = self.pool.snapshot()["refills"]
+        time.sleep(0.1)
+        self.assertEqual(self.pool.snapshot()["refills"], refills)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,253 @@
+import unittest
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from cryptography.hazmat.primitives import serialization, hashes
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from legosec import metrics
+from legosec.sdk.listener import ConnectionWorkerPool, ThreadedPeerListener
+from legosec.sdk.resumption import SessionTicketStore
+from legosec.sdk.sdk import SecureChannelSDK, EncryptedSocket
+from legosec.storage.database import get_database
+
+
+class _Conn:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class TestConnectionWorkerPool(unittest.TestCase):
+    def setUp(self):
+        self.release = threading.Event()
+        self.handled = []
+
+    def tearDown(self):
+        self.release.set()
+        self.pool.shutdown()
+
+    def _handler(self, conn):
+        self.release.wait(5)
+        self.handled.append(conn)
+
+    def _wait_for(self, predicate, timeout=2.0):
+        deadline = time.monotonic() + timeout
+        while not predicate() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(predicate())
+
+    def test_reject_when_saturated(self):
+        """Test that the reject policy closes connections beyond workers + pending"""
+        self.pool = ConnectionWorkerPool(self._handler, workers=2, max_pending=1, overload_policy="reject")
+        conns = [_Conn() for _ in range(5)]
+        accepted = [self.pool.submit(conn) for conn in conns[:3]]
+        self._wait_for(lambda: self.pool.snapshot()["active"] == 2)
+        accepted += [self.pool.submit(conn) for conn in conns[3:]]
+        self.assertEqual(accepted, [True, True, True, False, False])
+        self.assertTrue(conns[4].closed)
+        stats = self.pool.snapshot()
+        self.assertEqual((stats["active"], stats["queued"], stats["rejected"]), (2, 1, 2))
+
+        self.release.set()
+        self._wait_for(lambda: self.pool.snapshot()["completed"] == 3)
+        self.assertEqual(len(self.handled), 3)
+
+    def test_queue_waits_for_room(self):
+        """Test that the queue policy blocks the producer until a slot frees up"""
+        self.pool = ConnectionWorkerPool(self._handler, workers=1, max_pending=0,
+                                         overload_policy="queue", queue_timeout=2.0)
+        self.assertTrue(self.pool.submit(_Conn()))
+        self._wait_for(lambda: self.pool.snapshot()["active"] == 1)
+        threading.Timer(0.1, self.release.set).start()
+        self.assertTrue(self.pool.submit(_Conn()))
+        self._wait_for(lambda: self.pool.snapshot()["completed"] == 2)
+
+    def test_queue_timeout_rejects(self):
+        """Test that the queue policy gives up after queue_timeout"""
+        self.pool = ConnectionWorkerPool(self._handler, workers=1, max_pending=0,
+                                         overload_policy="queue", queue_timeout=0.05)
+        self.pool.submit(_Conn())
+        self._wait_for(lambda: self.pool.snapshot()["active"] == 1)
+        conn = _Conn()
+        self.assertFalse(self.pool.submit(conn))
+        self.assertTrue(conn.closed)
+
+    def test_unknown_policy(self):
+        """Test that an unknown overload policy is refused"""
+        self.pool = ConnectionWorkerPool(self._handler, workers=1)
+        with self.assertRaises(ValueError):
+            ConnectionWorkerPool(self._handler, overload_policy="spill")
+
+
+class _ListenerSDK:
+    def __init__(self):
+        self.handled = []
+        self.ready = []
+
+    def _handle_incoming_connection(self, conn, park=None):
+        self.handled.append(conn.recv(16))
+        conn.close()
+
+    def _log_activity(self, *args, **kwargs):
+        pass
+
+    def _send_notification(self, *args):
+        pass
+
+    def _update_peer_status(self, ready=True):
+        self.ready.append(ready)
+
+
+class TestThreadedPeerListener(unittest.TestCase):
+    def test_accepts_and_stops(self):
+        """Test that accepted connections reach the handler and stop() shuts down"""
+        sdk = _ListenerSDK()
+        listener = ThreadedPeerListener(sdk, port=0, host="127.0.0.1", workers=2).start()
+        try:
+            for index in range(4):
+                with socket.create_connection(("127.0.0.1", listener.port)) as sock:
+                    sock.sendall(b"hello %d" % index)
+            deadline = time.monotonic() + 2
+            while len(sdk.handled) < 4 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(sorted(sdk.handled), [b"hello %d" % i for i in range(4)])
+            self.assertEqual(listener.stats()["accepted"], 4)
+        finally:
+            listener.stop()
+        with self.assertRaises(OSError):
+            socket.create_connection(("127.0.0.1", listener.port), timeout=1)
+        self.assertEqual(sdk.ready, [True, False])
+
+
+class _SessionSDK:
+    """The SDK surface the threaded ECDH path uses, without identity files or a KDC"""
+    client_id = "listener-id"
+    _CONNECTION_HANDLERS = SecureChannelSDK._CONNECTION_HANDLERS
+    _handle_incoming_connection = SecureChannelSDK._handle_incoming_connection
+    _handle_ecdh_connection = SecureChannelSDK._handle_ecdh_connection
+    _ecdh_respond = SecureChannelSDK._ecdh_respond
+    _authenticate_ecdh_peer = SecureChannelSDK._authenticate_ecdh_peer
+    _handle_secure_connection = SecureChannelSDK._handle_secure_connection
+    _serve_secure_messages = SecureChannelSDK._serve_secure_messages
+    _close_secure_session = SecureChannelSDK._close_secure_session
+    _peer_message_response = SecureChannelSDK._peer_message_response
+
+    def __init__(self, db_path):
+        self.session_keys = {}
+        self.session_tickets = SessionTicketStore(get_database(db_path), self.client_id)
+        self.identity_manager = self
+
+    def is_peer_authorized(self, peer_id):
+        return peer_id.startswith("client-")
+
+    def _log_activity(self, *args, **kwargs):
+        pass
+
+    def _send_notification(self, *args):
+        pass
+
+    def _update_peer_status(self, ready=True):
+        pass
+
+
+class TestIdleSessions(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, "kdc_database.db")
+        self.sdk = _SessionSDK(self.db_path)
+        self.listener = ThreadedPeerListener(self.sdk, port=0, host="127.0.0.1", workers=2,
+                                             max_pending=0, queue_timeout=1.0).start()
+
+    def tearDown(self):
+        self.listener.stop()
+        get_database(self.db_path).close()
+        shutil.rmtree(self.tmp_dir)
+
+    def _ecdh_connect(self, peer_id):
+        sock = socket.create_connection(("127.0.0.1", self.listener.port), timeout=5)
+        private = ec.generate_private_key(ec.SECP384R1())
+        sock.sendall(private.public_key().public_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo
+        ))
+        data = b""
+        while not data.endswith(b"IDENTIFY"):
+            chunk = sock.recv(4096)
+            if not chunk:
+                raise ConnectionError("Listener closed during handshake")
+            data += chunk
+        peer_pubkey = serialization.load_pem_public_key(data[:data.index(b"-----END PUBLIC KEY-----\n") + 25])
+        session_key = HKDF(algorithm=hashes.SHA256(), length=32, salt=None,
+                           info=b'ecdh-session-key').derive(private.exchange(ec.ECDH(), peer_pubkey))
+        sock.sendall(peer_id.encode())
+        # The v1 handshake does not acknowledge the identity, so let it arrive on its own
+        time.sleep(0.05)
+        return EncryptedSocket(sock, session_key)
+
+    def test_open_sessions_outnumber_workers(self):
+        """Test that idle open sessions do not hold the listener's workers"""
+        conns = []
+        try:
+            # A new session holds its worker until the first message is answered
+            for index in range(6):
+                conns.append(self._ecdh_connect(f"client-{index}"))
+                conns[-1].send(b"ping")
+                self.assertEqual(conns[-1].recv_message(), b"ACK from listen...")
+            for conn in conns:
+                conn.send(b"ping")
+                self.assertEqual(conn.recv_message(), b"ACK from listen...")
+
+            # The last ACK can arrive before its worker has parked the session
+            deadline = time.monotonic() + 2
+            while ((self.listener.stats()["active"], self.listener.stats()["parked"]) != (0, 6)
+                   and time.monotonic() < deadline):
+                time.sleep(0.01)
+            stats = self.listener.stats()
+            self.assertEqual(stats["rejected"], 0)
+            self.assertEqual(stats["active"], 0)
+            self.assertEqual(stats["parked"], 6)
+            self.assertGreaterEqual(stats["resumed"], 6)
+        finally:
+            for conn in conns:
+                conn.close()
+
+    def _active_sessions(self):
+        return sum(s["value"] for s in metrics.snapshot()["legosec_active_sessions"]["samples"])
+
+    def test_idle_timeout_closes_parked_sessions(self):
+        """Test that sessions parked longer than idle_timeout are closed and no longer counted active"""
+        active = self._active_sessions()
+        self.listener.parker.idle_timeout = 0.1
+        conn = self._ecdh_connect("client-a")
+        conn.send(b"ping")
+        self.assertEqual(conn.recv_message(), b"ACK from listen...")
+        time.sleep(1.0)
+        self.assertIsNone(conn.recv_message())
+        self.assertEqual(self.listener.stats()["idle_closed"], 1)
+        self.assertEqual(self._active_sessions(), active)
+        conn.close()
+
+    def test_stop_closes_parked_sessions(self):
+        """Test that stopping the listener ends parked sessions through their teardown"""
+        active = self._active_sessions()
+        conn = self._ecdh_connect("client-a")
+        conn.send(b"ping")
+        self.assertEqual(conn.recv_message(), b"ACK from listen...")
+        deadline = time.monotonic() + 2
+        while self.listener.stats()["parked"] != 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self._active_sessions(), active + 1)
+        self.listener.stop()
+        self.assertIsNone(conn.recv_message())
+        self.assertEqual(self._active_sessions(), active)
+        conn.close()
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
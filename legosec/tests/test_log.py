@@ -0,0 +1,156 @@
+import logging
+import subprocess
+import sys
+import unittest
+from legosec import log
+from legosec.sdk.sdk import SecureChannelSDK
+
+
+class _Records(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class _Expensive:
+    """Argument that counts how often it is formatted"""
+
+    def __init__(self):
+        self.formatted = 0
+
+    def __str__(self):
+        self.formatted += 1
+        return "expensive"
+
+
+class _Sink:
+    def __init__(self):
+        self.rows = []
+
+    def submit(self, row):
+        self.rows.append(row)
+
+
+class _LogSDK:
+    client_id = "listener-id"
+    _log_activity = SecureChannelSDK._log_activity
+    _peer_message_response = SecureChannelSDK._peer_message_response
+
+    def __init__(self):
+        self._log_sink = _Sink()
+
+
+class TestLog(unittest.TestCase):
+    def setUp(self):
+        self.root = logging.getLogger(log.ROOT)
+        self.levels = {name: logging.getLogger(f"{log.ROOT}.{name}").level for name in ("handshake", "messages")}
+        self.root_level = self.root.level
+        self.records = _Records()
+        self.root.addHandler(self.records)
+        log.configure(level="INFO", debug_peers=[], sample_burst=2, sample_interval=60, sample_every=5)
+        log.sampler.reset()
+
+    def tearDown(self):
+        self.root.removeHandler(self.records)
+        self.root.setLevel(self.root_level)
+        for name, level in self.levels.items():
+            logging.getLogger(f"{log.ROOT}.{name}").setLevel(level)
+        log.configure(debug_peers=[], sample_burst=20, sample_interval=1.0, sample_every=100)
+        log.sampler.reset()
+
+    def test_disabled_level_does_not_format(self):
+        """Test that a DEBUG record below the level never formats its arguments"""
+        argument = _Expensive()
+        log.get_logger("handshake").debug("Value %s", argument)
+        self.assertEqual(argument.formatted, 0)
+        self.assertEqual(self.records.records, [])
+
+        log.get_logger("handshake").warning("Value %s", argument)
+        self.assertEqual(self.records.records[0].getMessage(), "Value expensive")
+
+    def test_debug_for_one_subsystem(self):
+        """Test that DEBUG for one subsystem leaves the others at the package level"""
+        log.configure(debug_subsystems=["handshake"])
+        log.get_logger("handshake").debug("handshake step")
+        log.get_logger("messages").debug("message step")
+        self.assertEqual([r.getMessage() for r in self.records.records], ["handshake step"])
+
+    def test_debug_for_one_peer(self):
+        """Test that DEBUG for a peer prefix lets only that peer's records through"""
+        log.configure(debug_peers=["client_ab"])
+        logger = log.get_logger("messages")
+        self.assertTrue(logger.enabled(log.DEBUG, peer="client_abcdef"))
+        self.assertFalse(logger.enabled(log.DEBUG, peer="client_zz"))
+        logger.debug("from %s", "ab", peer="client_abcdef")
+        logger.debug("from %s", "zz", peer="client_zz")
+        logger.debug("no peer")
+        self.assertEqual([r.getMessage() for r in self.records.records], ["from ab"])
+        self.assertEqual(self.records.records[0].levelno, log.DEBUG)
+
+    def test_sampler_burst_then_one_in_every(self):
+        """Test that the sampler passes the burst, then one event in every"""
+        sampler = log.Sampler(burst=3, interval=60, every=4)
+        passed = [sampler.allow("event") for _ in range(15)]
+        self.assertEqual([i for i, allowed in enumerate(passed) if allowed], [0, 1, 2, 6, 10, 14])
+        self.assertEqual(sampler.stats, {"passed": 6, "suppressed": 9})
+        self.assertTrue(sampler.allow("other"))
+
+    def test_sampled_log_lines(self):
+        """Test that sampled per-message records are rate limited"""
+        log.configure(debug_subsystems=["messages"])
+        logger = log.get_logger("messages")
+        for index in range(12):
+            logger.sampled("message", log.DEBUG, "message %d", index)
+        self.assertEqual([r.getMessage() for r in self.records.records], ["message 0", "message 1", "message 6", "message 11"])
+
+    def test_activity_rows_follow_sampling(self):
+        """Test that sampled activity rows are dropped, except for debug peers and unsampled rows"""
+        sdk = _LogSDK()
+        for _ in range(12):
+            sdk._log_activity('CONN', 'Message received', sample='message')
+        sdk._log_activity('AUTH', 'Peer authorized')
+        self.assertEqual(len(sdk._log_sink.rows), 5)
+
+        log.configure(debug_peers=["client-a"])
+        for _ in range(12):
+            sdk._log_activity('CONN', 'Message received', sample='message', peer='client-a')
+        self.assertEqual(len(sdk._log_sink.rows), 17)
+
+    def test_message_contents_are_not_logged(self):
+        """Test that the listener logs the size of a message but not its contents"""
+        log.configure(debug_subsystems=["messages"])
+        sdk = _LogSDK()
+        response = sdk._peer_message_response(b"top secret", "client-a")
+        self.assertEqual(response, b"ACK from listen...")
+        logged = [r.getMessage() for r in self.records.records] + [row[2] for row in sdk._log_sink.rows]
+        self.assertTrue(logged)
+        self.assertFalse(any("top secret" in line for line in logged))
+        self.assertIn("10 bytes", logged[0])
+
+
+class TestHandlers(unittest.TestCase):
+    def test_stdout_only_after_configure(self):
+        """Test that importing adds only a NullHandler and configure installs the stdout handler once"""
+        script = (
+            "import logging, legosec\n"
+            "root = logging.getLogger('legosec')\n"
+            "print([type(h).__name__ for h in root.handlers], root.propagate)\n"
+            "legosec.log.get_logger('handshake').warning('before')\n"
+            "legosec.configure_logging(level='INFO')\n"
+            "legosec.configure_logging(level='INFO')\n"
+            "print([type(h).__name__ for h in root.handlers], root.propagate)\n"
+            "legosec.log.get_logger('handshake').info('after')\n"
+        )
+        output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, timeout=60, check=True)
+        self.assertEqual(output.stdout.splitlines(), [
+            "['NullHandler'] True",
+            "['NullHandler', '_StdoutHandler'] False",
+            "[INFO] after",
+        ])
+
+
+if __name__ == "__main__":
+    unittest.main()
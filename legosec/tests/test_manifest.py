@@ -0,0 +1,85 @@
+import unittest
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+from unittest import mock
+from legosec.identity.manifest import IdentityManifest
+from legosec.identity.identity import IdentityManager
+
+
+class TestIdentityManifest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, "kdc_database.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write_identity(self, client_id, client_name, expires_in):
+        path = os.path.join(self.tmp_dir, f".{client_id}_identity.json")
+        with open(path, "w") as f:
+            json.dump({"client_id": client_id, "client_name": client_name, "encrypted_secret": "00",
+                       "expires_at": (datetime.now() + timedelta(seconds=expires_in)).isoformat()}, f)
+        return path
+
+    def test_lookup_without_scan(self):
+        """Test that once built, lookups by name or first valid parse no identity file"""
+        self._write_identity("client_expired", "alice", -60)
+        self._write_identity("client_alice", "alice", 3600)
+        self._write_identity("client_bob", "bob", 3600)
+        self.assertEqual(IdentityManifest(self.tmp_dir).find_valid("alice"), "client_alice")
+
+        manifest = IdentityManifest(self.tmp_dir)
+        with mock.patch("legosec.identity.manifest.json.load", wraps=json.load) as load:
+            self.assertEqual(manifest.find_valid("bob"), "client_bob")
+            self.assertIn(manifest.find_valid(), {"client_alice", "client_bob"})
+            self.assertIsNone(manifest.find_valid("carol"))
+        # Only the manifest itself was read
+        self.assertEqual(load.call_count, 1)
+        self.assertEqual(manifest.stats["rebuilds"], 0)
+
+    def test_store_identity_updates_manifest(self):
+        """Test that a stored identity is recorded without a rebuild scan"""
+        manifest = IdentityManifest(self.tmp_dir)
+        self.assertIsNone(manifest.find_valid())
+        identity = IdentityManager("client_new", "carol", identity_dir=self.tmp_dir, db_path=self.db_path)
+        identity.manifest = manifest
+        rebuilds = manifest.stats["rebuilds"]
+        self.assertTrue(identity.store_identity(b"secret", datetime.now() + timedelta(days=1)))
+        self.assertEqual(manifest.find_valid("carol"), "client_new")
+        self.assertEqual((manifest.stats["rebuilds"], manifest.stats["parsed"]), (rebuilds, 0))
+
+        identity.remove_identity_file()
+        self.assertIsNone(manifest.find_valid("carol"))
+        self.assertEqual((manifest.stats["rebuilds"], manifest.stats["parsed"]), (rebuilds, 0))
+
+    def test_outside_changes_trigger_rebuild(self):
+        """Test that identity files added or removed behind the manifest's back are picked up"""
+        manifest = IdentityManifest(self.tmp_dir)
+        self.assertIsNone(manifest.find_valid())
+        time.sleep(0.01)
+        path = self._write_identity("client_dave", "dave", 3600)
+        self.assertEqual(manifest.find_valid("dave"), "client_dave")
+        os.remove(path)
+        self.assertIsNone(manifest.get("client_dave"))
+        # Unrelated files moving the directory mtime cost a listing, not a parse
+        open(os.path.join(self.tmp_dir, "unrelated.txt"), "w").close()
+        self.assertIsNone(manifest.find_valid())
+        self.assertEqual(manifest.stats["parsed"], 1)
+
+    def test_corrupt_manifest_is_rebuilt(self):
+        """Test that an unreadable manifest falls back to a scan"""
+        self._write_identity("client_erin", "erin", 3600)
+        IdentityManifest(self.tmp_dir).find_valid()
+        manifest = IdentityManifest(self.tmp_dir)
+        with open(manifest.path, "w") as f:
+            f.write("{not json")
+        self.assertEqual(manifest.find_valid("erin"), "client_erin")
+        self.assertEqual(manifest.stats["rebuilds"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,249 @@
+import os
+import shutil
+import socket
+import tempfile
+import time
+import unittest
+import urllib.error
+import urllib.request
+from legosec import metrics
+from legosec.identity.cache import get_authorization_cache
+from legosec.sdk.keypool import EphemeralKeyPool
+from legosec.sdk.listener import ThreadedPeerListener
+from legosec.sdk.resumption import SessionTicketStore
+from legosec.sdk.sdk import SecureChannelSDK, EncryptedSocket
+from legosec.storage.database import get_database
+
+
+def _value(snapshot, name, **labels):
+    """Sum of the samples of a counter or gauge whose labels include the given ones"""
+    samples = snapshot.get(name, {"samples": []})["samples"]
+    return sum(s["value"] for s in samples if labels.items() <= s["labels"].items())
+
+
+def _count(snapshot, name, **labels):
+    samples = snapshot.get(name, {"samples": []})["samples"]
+    return sum(s["count"] for s in samples if labels.items() <= s["labels"].items())
+
+
+class TestRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = metrics.Registry()
+
+    def test_counter_and_gauge(self):
+        """Test that counters and gauges are reported per label set"""
+        counter = self.registry.counter("requests_total", "Requests", ("result",))
+        counter.labels(result="ok").inc()
+        counter.labels(result="ok").inc(2)
+        counter.labels(result="failed").inc()
+        gauge = self.registry.gauge("open", "Open things")
+        gauge.inc()
+        gauge.inc()
+        gauge.dec()
+
+        snapshot = self.registry.snapshot()
+        self.assertEqual(snapshot["requests_total"]["type"], "counter")
+        self.assertEqual(_value(snapshot, "requests_total", result="ok"), 3)
+        self.assertEqual(_value(snapshot, "requests_total", result="failed"), 1)
+        self.assertEqual(_value(snapshot, "open"), 1)
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Test that histogram buckets count every observation at or below their bound"""
+        histogram = self.registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 5.0):
+            histogram.observe(value)
+
+        sample = self.registry.snapshot()["latency_seconds"]["samples"][0]
+        self.assertEqual(sample["count"], 4)
+        self.assertAlmostEqual(sample["sum"], 5.65)
+        self.assertEqual(sample["buckets"], {0.1: 2, 1.0: 3, float("inf"): 4})
+
+    def test_reregistering(self):
+        """Test that a name returns the same metric, and conflicting types or labels are refused"""
+        counter = self.registry.counter("things_total", "Things", ("kind",))
+        self.assertIs(self.registry.counter("things_total", "Things", ("kind",)), counter)
+        with self.assertRaises(ValueError):
+            self.registry.gauge("things_total", "Things", ("kind",))
+        with self.assertRaises(ValueError):
+            self.registry.counter("things_total", "Things")
+
+    def test_prometheus_text(self):
+        """Test the Prometheus text exposition of counters, histograms and collectors"""
+        self.registry.counter("events_total", "Events", ("kind",)).labels(kind='a "quoted"\nkind').inc()
+        self.registry.histogram("wait_seconds", "Waits", buckets=(1.0,)).observe(0.5)
+        self.registry.register_collector(lambda: [("cached_total", "counter", "Cached", {"result": "hit"}, 7)])
+
+        lines = self.registry.prometheus_text().splitlines()
+        self.assertIn("# TYPE events_total counter", lines)
+        self.assertIn('events_total{kind="a \\"quoted\\"\\nkind"} 1', lines)
+        self.assertIn("# TYPE wait_seconds histogram", lines)
+        self.assertIn('wait_seconds_bucket{le="1.0"} 1', lines)
+        self.assertIn('wait_seconds_bucket{le="+Inf"} 1', lines)
+        self.assertIn("wait_seconds_sum 0.5", lines)
+        self.assertIn("wait_seconds_count 1", lines)
+        self.assertIn('cached_total{result="hit"} 7', lines)
+
+    def test_http_server(self):
+        """Test that the metrics server answers /metrics and nothing else"""
+        self.registry.counter("served_total", "Served").inc()
+        server = metrics.start_http_server(port=0, registry=self.registry)
+        try:
+            host, port = server.server_address
+            with urllib.request.urlopen(f"http://{host}:{port}/metrics", timeout=5) as response:
+                self.assertTrue(response.headers["Content-Type"].startswith("text/plain"))
+                self.assertIn("served_total 1", response.read().decode())
+            with self.assertRaises(urllib.error.HTTPError):
+                urllib.request.urlopen(f"http://{host}:{port}/other", timeout=5)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+class TestHandshakeTimer(unittest.TestCase):
+    def test_first_outcome_counts(self):
+        """Test that only the first of done() and failed() is recorded"""
+        before = metrics.snapshot()
+        handshake = metrics.HandshakeTimer("test-mode", "initiator")
+        handshake.done()
+        handshake.failed()
+        metrics.HandshakeTimer("test-mode", "initiator").failed()
+
+        after = metrics.snapshot()
+        name = "legosec_handshakes_total"
+        labels = {"mode": "test-mode", "side": "initiator"}
+        self.assertEqual(_value(after, name, result="ok", **labels) - _value(before, name, result="ok", **labels), 1)
+        self.assertEqual(
+            _value(after, name, result="failed", **labels) - _value(before, name, result="failed", **labels), 1
+        )
+        self.assertEqual(
+            _count(after, "legosec_handshake_seconds", **labels) - _count(before, "legosec_handshake_seconds", **labels),
+            1
+        )
+
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, "kdc_database.db")
+
+    def tearDown(self):
+        get_database(self.db_path).close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_database_operations(self):
+        """Test that statements, queries and transactions are timed by operation"""
+        db = get_database(self.db_path)
+        before = metrics.snapshot()
+        db.execute("INSERT INTO peer_status (client_id, is_ready) VALUES ('a', 1)")
+        db.fetchone("SELECT is_ready FROM peer_status WHERE client_id = 'a'")
+        db.fetchall("SELECT * FROM peer_status")
+        with db.transaction() as conn:
+            conn.execute("DELETE FROM peer_status")
+
+        after = metrics.snapshot()
+        name = "legosec_db_operation_seconds"
+        for op, expected in (("execute", 1), ("fetch", 2), ("transaction", 1)):
+            # Background writers elsewhere in the process may add to the totals
+            self.assertGreaterEqual(_count(after, name, op=op) - _count(before, name, op=op), expected, op)
+
+    def test_authorization_cache_collector(self):
+        """Test that authorization cache hits and misses show up in the snapshot"""
+        db = get_database(self.db_path)
+        db.execute("INSERT INTO peer_authorizations (client_id, peer_id) VALUES ('a', 'b')")
+        cache = get_authorization_cache(self.db_path)
+        before = metrics.snapshot()
+        self.assertTrue(cache.contains("a", "b"))
+        self.assertTrue(cache.contains("a", "b"))
+
+        after = metrics.snapshot()
+        name = "legosec_authorization_cache_lookups_total"
+        self.assertEqual(_value(after, name, result="miss") - _value(before, name, result="miss"), 1)
+        self.assertEqual(_value(after, name, result="hit") - _value(before, name, result="hit"), 1)
+        cache.close()
+
+
+class _HandshakeSDK:
+    """The SDK surface both ECDH sides use, without identity files or a KDC"""
+    _CONNECTION_HANDLERS = SecureChannelSDK._CONNECTION_HANDLERS
+    _handle_incoming_connection = SecureChannelSDK._handle_incoming_connection
+    _handle_ecdh_v2_connection = SecureChannelSDK._handle_ecdh_v2_connection
+    _ecdh_v2_respond = SecureChannelSDK._ecdh_v2_respond
+    _ecdh_initiate_v2 = SecureChannelSDK._ecdh_initiate_v2
+    _handle_secure_connection = SecureChannelSDK._handle_secure_connection
+    _serve_secure_messages = SecureChannelSDK._serve_secure_messages
+    _close_secure_session = SecureChannelSDK._close_secure_session
+    _peer_message_response = SecureChannelSDK._peer_message_response
+
+    def __init__(self, client_id, db_path):
+        self.client_id = client_id
+        self.session_keys = {}
+        self.session_tickets = SessionTicketStore(get_database(db_path), client_id)
+        self.ecdh_key_pool = EphemeralKeyPool(depth=2, low_water=0)
+        self.identity_manager = self
+
+    def is_peer_authorized(self, peer_id):
+        return peer_id == "client-a"
+
+    def _handle_psk_connection(self, conn, park=None):
+        conn.close()
+
+    def _log_activity(self, *args, **kwargs):
+        pass
+
+    def _update_peer_status(self, ready=True):
+        pass
+
+    def _send_notification(self, *args):
+        pass
+
+
+class TestListenerMetrics(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, "kdc_database.db")
+        self.listener_sdk = _HandshakeSDK("listener-id", self.db_path)
+        self.client = _HandshakeSDK("client-a", self.db_path)
+        self.listener = ThreadedPeerListener(self.listener_sdk, port=0, host="127.0.0.1", workers=2).start()
+
+    def tearDown(self):
+        self.listener.stop()
+        self.listener_sdk.ecdh_key_pool.close()
+        self.client.ecdh_key_pool.close()
+        get_database(self.db_path).close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_session_is_counted(self):
+        """Test that a listener session records its handshake, messages and the active session gauge"""
+        before = metrics.snapshot()
+        sock = socket.create_connection(("127.0.0.1", self.listener.port), timeout=5)
+        conn = EncryptedSocket(sock, self.client._ecdh_initiate_v2(sock))
+        conn.send(b"Hello")
+        self.assertEqual(conn.recv_message(), b"ACK from listen...")
+        during = metrics.snapshot()
+        conn.close()
+
+        labels = {"mode": "ecdh", "side": "responder", "result": "ok"}
+        self.assertEqual(
+            _value(during, "legosec_handshakes_total", **labels) - _value(before, "legosec_handshakes_total", **labels),
+            1
+        )
+        self.assertEqual(_value(during, "legosec_active_sessions") - _value(before, "legosec_active_sessions"), 1)
+        # Both ends of the exchange live in this process
+        received = _value(before, "legosec_messages_total", direction="received")
+        self.assertEqual(_value(during, "legosec_messages_total", direction="received") - received, 2)
+
+        # The listener counts its reply once the send returns, which may be after the client read it
+        sent = _value(before, "legosec_messages_total", direction="sent")
+        active = _value(before, "legosec_active_sessions")
+        deadline = time.monotonic() + 5
+        while True:
+            snapshot = metrics.snapshot()
+            if (_value(snapshot, "legosec_messages_total", direction="sent") - sent == 2
+                    and _value(snapshot, "legosec_active_sessions") == active):
+                break
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,105 @@
+import unittest
+import os
+import socket
+import time
+from legosec.sdk.pool import PeerConnectionPool
+from legosec.sdk.sdk import EncryptedSocket
+
+
+class TestPeerConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.key = os.urandom(32)
+        self.peers = []
+        self.pool = PeerConnectionPool(self._connect, max_idle_per_peer=2)
+
+    def tearDown(self):
+        self.pool.close()
+        for peer in self.peers:
+            peer.close()
+
+    def _connect(self, peer_id, host, port):
+        left, right = socket.socketpair()
+        self.peers.append(EncryptedSocket(right, self.key, initiator=False))
+        return EncryptedSocket(left, self.key, initiator=True)
+
+    def test_reuse(self):
+        """Test that a released connection is handed out again for the same peer"""
+        conn = self.pool.acquire("peer-a")
+        self.pool.release(conn)
+        self.assertIs(self.pool.acquire("peer-a"), conn)
+        self.assertIsNot(self.pool.acquire("peer-b"), conn)
+        stats = self.pool.snapshot()
+        self.assertEqual((stats["hits"], stats["misses"], stats["leased"]), (1, 2, 2))
+
+    def test_keys_include_address(self):
+        """Test that the same peer on another port gets its own connection"""
+        conn = self.pool.acquire("peer-a", port=6000)
+        self.pool.release(conn)
+        self.assertIsNot(self.pool.acquire("peer-a", port=6001), conn)
+
+    def test_closed_peer_is_not_reused(self):
+        """Test that the health check drops connections the peer has closed"""
+        conn = self.pool.acquire("peer-a")
+        self.pool.release(conn)
+        self.peers[0].close()
+        self.assertIsNot(self.pool.acquire("peer-a"), conn)
+        self.assertEqual(self.pool.snapshot()["unhealthy"], 1)
+
+    def test_high_descriptors_are_checked(self):
+        """Test that the health check works for sockets numbered above select()'s 1024 limit"""
+        try:
+            import resource
+            if resource.getrlimit(resource.RLIMIT_NOFILE)[0] <= 1100:
+                self.skipTest("file descriptor limit too low")
+        except ImportError:
+            self.skipTest("no resource module")
+        left, right = socket.socketpair()
+        os.dup2(left.fileno(), 1100)
+        left.close()
+        high = socket.socket(fileno=1100)
+        self.peers.append(right)
+        pool = PeerConnectionPool(lambda *args: EncryptedSocket(high, self.key))
+        try:
+            conn = pool.acquire("peer-a")
+            pool.release(conn)
+            self.assertIs(pool.acquire("peer-a"), conn)
+            pool.release(conn)
+            right.close()
+            self.assertIsNot(pool.acquire("peer-a"), conn)
+            self.assertEqual(pool.snapshot()["unhealthy"], 1)
+        finally:
+            pool.close()
+
+    def test_idle_and_lifetime_limits(self):
+        """Test that connections past max_idle_time or max_lifetime are replaced"""
+        self.pool.max_idle_time = 0.05
+        conn = self.pool.acquire("peer-a")
+        self.pool.release(conn)
+        time.sleep(0.1)
+        self.assertEqual(self.pool.prune(), 1)
+
+        self.pool.max_idle_time = 60
+        self.pool.max_lifetime = 0.05
+        conn = self.pool.acquire("peer-a")
+        time.sleep(0.1)
+        self.pool.release(conn)
+        self.assertEqual(self.pool.snapshot()["idle"], 0)
+
+    def test_max_idle_per_peer(self):
+        """Test that surplus idle connections are closed on release"""
+        conns = [self.pool.acquire("peer-a") for _ in range(3)]
+        for conn in conns:
+            self.pool.release(conn)
+        self.assertEqual(self.pool.snapshot()["idle"], 2)
+
+    def test_failed_block_discards(self):
+        """Test that a connection leased by a failing block is not pooled"""
+        with self.assertRaises(RuntimeError):
+            with self.pool.connection("peer-a"):
+                raise RuntimeError("boom")
+        stats = self.pool.snapshot()
+        self.assertEqual((stats["idle"], stats["leased"], stats["discarded"]), (0, 0, 1))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
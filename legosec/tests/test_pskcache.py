@@ -0,0 +1,75 @@
+import unittest
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from legosec.sdk.pskcache import SharedPSKCache
+from legosec.sdk.readiness import Backoff
+from legosec.storage.database import get_database
+
+
+class TestSharedPSKCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, "kdc_database.db")
+        self.db = get_database(self.db_path)
+        self.cache = SharedPSKCache(self.db)
+
+    def tearDown(self):
+        self.cache.close()
+        self.db.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_store_is_symmetric(self):
+        """Test that a stored PSK is found from both ends and written in both directions"""
+        self.cache.store("client-a", "client-b", b"k" * 32)
+        self.assertEqual(self.cache.get("client-a", "client-b"), b"k" * 32)
+        self.assertEqual(self.cache.get("client-b", "client-a"), b"k" * 32)
+        rows = self.db.fetchall("SELECT from_id, to_id FROM psk_exchange ORDER BY from_id")
+        self.assertEqual([tuple(r) for r in rows], [("client-a", "client-b"), ("client-b", "client-a")])
+
+    def test_get_does_not_wait(self):
+        """Test that a missing PSK is reported at once instead of polled for"""
+        start = time.monotonic()
+        self.assertIsNone(self.cache.get("client-a", "client-b"))
+        self.assertLess(time.monotonic() - start, 0.5)
+
+    def test_store_wakes_waiter(self):
+        """Test that a store in this process ends a wait without waiting out the backoff"""
+        threading.Timer(0.05, self.cache.store, args=("client-b", "client-a", b"p" * 32)).start()
+        start = time.monotonic()
+        backoff = Backoff(initial=5, maximum=5, deadline=time.monotonic() + 5)
+        self.assertEqual(self.cache.wait("client-a", "client-b", backoff), b"p" * 32)
+        self.assertLess(time.monotonic() - start, 1.0)
+        self.assertEqual(self.cache.stats["wakeups"], 1)
+
+    def test_other_process_store_is_seen(self):
+        """Test that a PSK written by another connection is picked up, also replacing a cached one"""
+        self.cache.store("client-a", "client-b", b"old" * 8)
+        self.assertEqual(self.cache.get("client-a", "client-b"), b"old" * 8)
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("UPDATE psk_exchange SET shared_psk = ?", (b"new" * 8,))
+        self.cache._next_check = 0.0
+        self.assertEqual(self.cache.get("client-a", "client-b"), b"new" * 8)
+
+    def test_store_many_in_chunks(self):
+        """Test that bulk provisioning upserts every peer in both directions, chunked or not"""
+        self.cache.store("client-a", "peer-1", b"stale" * 4)
+        psks = {f"peer-{i}": os.urandom(32) for i in range(25)}
+        self.cache.store_many("client-a", psks, chunk_size=10)
+        self.assertEqual(self.db.fetchone("SELECT COUNT(*) FROM psk_exchange")[0], 50)
+        self.cache.invalidate()
+        for peer_id, psk in psks.items():
+            self.assertEqual(self.cache.get(peer_id, "client-a"), psk)
+        self.assertEqual(self.cache.stats["stores"], 26)
+
+    def test_wait_times_out(self):
+        """Test that waiting for a PSK nobody stores ends at the deadline"""
+        backoff = Backoff(initial=0.01, deadline=time.monotonic() + 0.1)
+        self.assertIsNone(self.cache.wait("client-a", "client-b", backoff))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,67 @@
+import unittest
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from legosec.sdk.readiness import Backoff, PeerReadiness
+from legosec.storage.database import get_database
+
+
+class TestBackoff(unittest.TestCase):
+    def test_delays_grow_and_cap(self):
+        """Test that delays double up to the cap and keep at least half of each step"""
+        backoff = Backoff(initial=0.1, maximum=0.8)
+        delays = [backoff.next_delay() for _ in range(6)]
+        for delay, step in zip(delays, [0.1, 0.2, 0.4, 0.8, 0.8, 0.8]):
+            self.assertGreaterEqual(delay, step / 2)
+            self.assertLessEqual(delay, step)
+
+    def test_deadline(self):
+        """Test that no delay runs past the deadline and none is given after it"""
+        backoff = Backoff(initial=10, maximum=10, deadline=time.monotonic() + 0.05)
+        self.assertLessEqual(backoff.next_delay(), 0.05)
+        time.sleep(0.06)
+        self.assertIsNone(backoff.next_delay())
+        self.assertFalse(backoff.sleep())
+
+
+class TestPeerReadiness(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, "kdc_database.db")
+        self.db = get_database(self.db_path)
+        self.readiness = PeerReadiness(self.db)
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_announce_wakes_waiter(self):
+        """Test that a listener announcing in this process ends the wait without polling"""
+        threading.Timer(0.05, self.readiness.announce, args=("client-b",)).start()
+        start = time.monotonic()
+        self.assertTrue(self.readiness.wait("client-b", Backoff(initial=5, maximum=5,
+                                                                deadline=time.monotonic() + 5)))
+        self.assertLess(time.monotonic() - start, 1.0)
+        self.assertEqual(self.readiness.stats["wakeups"], 1)
+
+    def test_other_process_is_seen(self):
+        """Test that a peer_status row written by another connection is picked up"""
+        def write():
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute("INSERT OR REPLACE INTO peer_status VALUES ('client-c', 1, '2099-01-01')")
+        threading.Timer(0.05, write).start()
+        self.assertTrue(self.readiness.wait("client-c", Backoff(initial=0.01, maximum=0.05,
+                                                                deadline=time.monotonic() + 5)))
+
+    def test_not_ready_times_out(self):
+        """Test that a peer that stopped its listener is not reported ready"""
+        self.readiness.announce("client-d", True)
+        self.readiness.announce("client-d", False)
+        self.assertFalse(self.readiness.wait("client-d", Backoff(initial=0.01, deadline=time.monotonic() + 0.1)))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
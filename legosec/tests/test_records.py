@@ -0,0 +1,82 @@
+import unittest
+import os
+import socket
+import threading
+from legosec.sdk.sdk import EncryptedSocket
+from legosec.sdk.records import RecordLayer
+
+
+class TestEncryptedSocket(unittest.TestCase):
+    def setUp(self):
+        self.key = os.urandom(32)
+        left, right = socket.socketpair()
+        self.client = EncryptedSocket(left, self.key, initiator=True)
+        self.server = EncryptedSocket(right, self.key, initiator=False)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.close()
+
+    def test_back_to_back_messages_stay_separate(self):
+        """Test that small messages sent together are received one by one"""
+        for i in range(50):
+            self.client.send(f"message {i}".encode())
+        for i in range(50):
+            self.assertEqual(self.server.recv_message(), f"message {i}".encode())
+
+    def test_large_message_is_reassembled(self):
+        """Test that a message larger than the read buffer arrives intact"""
+        payload = os.urandom(3 * 1024 * 1024 + 7)
+        sender = threading.Thread(target=self.client.send, args=(payload,))
+        sender.start()
+        self.assertEqual(self.server.recv_message(), payload)
+        sender.join()
+
+    def test_partial_writes_are_reassembled(self):
+        """Test that a record split across many socket writes is decoded once complete"""
+        header, nonce, ciphertext = RecordLayer(self.key, initiator=True).seal(b"split record")
+        wire = header + nonce + ciphertext
+        for i in range(len(wire)):
+            self.client.socket.sendall(wire[i:i + 1])
+        self.assertEqual(self.server.recv_message(), b"split record")
+
+    def test_both_directions(self):
+        """Test that each direction uses its own keys and counters"""
+        self.client.send(b"ping")
+        self.assertEqual(self.server.recv_message(), b"ping")
+        self.server.send(b"pong")
+        self.assertEqual(self.client.recv_message(), b"pong")
+
+    def test_recv_returns_bounded_chunks(self):
+        """Test that recv(bufsize) walks through one message in chunks"""
+        self.client.send(b"abcdefghij")
+        self.assertEqual(self.server.recv(4), b"abcd")
+        self.assertEqual(self.server.recv(4), b"efgh")
+        self.assertEqual(self.server.recv(4), b"ij")
+
+    def test_tampered_record_is_rejected(self):
+        """Test that a modified ciphertext fails authentication"""
+        header, nonce, ciphertext = RecordLayer(self.key, initiator=True).seal(b"secret")
+        tampered = bytearray(ciphertext)
+        tampered[0] ^= 0x01
+        self.client.socket.sendall(header + nonce + bytes(tampered))
+        with self.assertRaises(ValueError):
+            self.server.recv_message()
+
+    def test_replayed_record_is_rejected(self):
+        """Test that resending a record is detected by the nonce counter"""
+        header, nonce, ciphertext = RecordLayer(self.key, initiator=True).seal(b"once")
+        self.client.socket.sendall(header + nonce + ciphertext)
+        self.client.socket.sendall(header + nonce + ciphertext)
+        self.assertEqual(self.server.recv_message(), b"once")
+        with self.assertRaises(ValueError):
+            self.server.recv_message()
+
+    def test_clean_close(self):
+        """Test that a closed peer yields None"""
+        self.client.socket.shutdown(socket.SHUT_WR)
+        self.assertIsNone(self.server.recv_message())
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,89 @@
+import unittest
+import os
+import shutil
+import tempfile
+import time
+from legosec.sdk import resumption
+from legosec.sdk.resumption import SessionTicketStore, INITIATOR, RESPONDER
+from legosec.storage.database import get_database
+
+
+class TestResumptionProtocol(unittest.TestCase):
+    def setUp(self):
+        self.ticket_id, self.secret = resumption.derive_resumption_ticket(os.urandom(32))
+        self.lookup = lambda ticket_id: ("peer-a", self.secret) if ticket_id == self.ticket_id else None
+
+    def test_round_trip(self):
+        """Test that both sides derive the same fresh key from one hello and reply"""
+        hello, client_nonce = resumption.client_hello(self.ticket_id, self.secret)
+        self.assertEqual(len(hello), resumption.RESUME_HELLO_SIZE)
+        reply, peer_id, server_key = resumption.accept_hello(hello, self.lookup)
+        self.assertEqual(peer_id, "peer-a")
+        client_key = resumption.verify_reply(reply, self.ticket_id, self.secret, client_nonce)
+        self.assertEqual(client_key, server_key)
+
+        _, again_key = resumption.accept_hello(hello, self.lookup)[1:]
+        self.assertNotEqual(again_key, server_key)
+
+    def test_wrong_secret_is_rejected(self):
+        """Test that a hello without knowledge of the secret is refused"""
+        hello, _ = resumption.client_hello(self.ticket_id, os.urandom(32))
+        self.assertEqual(resumption.accept_hello(hello, self.lookup), (resumption.RESUME_REJECT, None, None))
+        hello, _ = resumption.client_hello(os.urandom(16), self.secret)
+        self.assertEqual(resumption.accept_hello(hello, self.lookup)[0], resumption.RESUME_REJECT)
+
+    def test_forged_reply_is_rejected(self):
+        """Test that the client only accepts a reply from the ticket holder"""
+        hello, client_nonce = resumption.client_hello(self.ticket_id, self.secret)
+        reply, _, _ = resumption.accept_hello(hello, self.lookup)
+        forged = reply[:-1] + bytes([reply[-1] ^ 1])
+        self.assertIsNone(resumption.verify_reply(forged, self.ticket_id, self.secret, client_nonce))
+        self.assertIsNone(resumption.verify_reply(resumption.RESUME_REJECT, self.ticket_id, self.secret, client_nonce))
+
+
+class TestSessionTicketStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db = get_database(os.path.join(self.tmp_dir, "kdc_database.db"))
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_both_sides_share_one_ticket(self):
+        """Test that initiator and responder stores agree on the ticket id"""
+        session_key = os.urandom(32)
+        client = SessionTicketStore(self.db, "client-a")
+        listener = SessionTicketStore(self.db, "client-b")
+        ticket_id = client.issue("client-b", session_key, INITIATOR)
+        listener.issue("client-a", session_key, RESPONDER)
+        self.assertEqual(client.ticket_for_peer("client-b")[0], ticket_id)
+        self.assertEqual(listener.lookup(ticket_id)[0], "client-a")
+        self.assertIsNone(client.lookup(ticket_id))
+
+    def test_tickets_survive_restart(self):
+        """Test that tickets are reloaded from ecdh_sessions"""
+        ticket_id = SessionTicketStore(self.db, "client-a").issue("client-b", os.urandom(32), INITIATOR)
+        self.assertEqual(SessionTicketStore(self.db, "client-a").ticket_for_peer("client-b")[0], ticket_id)
+
+    def test_expired_ticket(self):
+        """Test that expired tickets are not offered"""
+        store = SessionTicketStore(self.db, "client-a", lifetime=0.05)
+        store.issue("client-b", os.urandom(32), INITIATOR)
+        time.sleep(0.1)
+        self.assertIsNone(store.ticket_for_peer("client-b"))
+        self.assertIsNone(self.db.fetchone("SELECT 1 FROM ecdh_sessions WHERE owner_id = 'client-a'"))
+
+    def test_stats(self):
+        """Test that the resumption rate and time saved are reported"""
+        store = SessionTicketStore(self.db, "client-a")
+        ticket_id = store.issue("client-b", os.urandom(32), INITIATOR)
+        store.record_full_handshake(0.010)
+        store.record_resumption(ticket_id, INITIATOR, 0.002)
+        stats = store.snapshot()
+        self.assertEqual(stats["resumption_rate"], 0.5)
+        self.assertAlmostEqual(stats["seconds_saved"], 0.008)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
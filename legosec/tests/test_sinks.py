@@ -0,0 +1,145 @@
+import unittest
+import os
+import sqlite3
+import tempfile
+from legosec.sdk.sinks import ActivityLogSink, NotificationSink
+
+
+class TestActivityLogSink(unittest.TestCase):
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("""
+                CREATE TABLE client_logs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    client_id TEXT, log_type TEXT, message TEXT, metadata TEXT
+                )
+            """)
+
+    def tearDown(self):
+        os.remove(self.db_path)
+
+    def _count(self):
+        with sqlite3.connect(self.db_path) as conn:
+            return conn.execute("SELECT COUNT(*) FROM client_logs").fetchone()[0]
+
+    def test_flush_writes_all_rows(self):
+        """Test that flush() persists every queued row"""
+        sink = ActivityLogSink(self.db_path, flush_interval=10, batch_size=50)
+        for i in range(120):
+            sink.submit(("client_a", "CONN", f"message {i}", "{}"))
+        self.assertTrue(sink.flush())
+        self.assertEqual(self._count(), 120)
+        sink.close()
+
+    def test_thread_starts_on_first_submit(self):
+        """Test that an unused sink starts no writer thread and closes cleanly"""
+        sink = ActivityLogSink(self.db_path, flush_interval=10)
+        self.assertIsNone(sink._thread)
+        self.assertTrue(sink.flush())
+        sink.submit(("client_a", "SYSTEM", "first", "{}"))
+        self.assertIsNotNone(sink._thread)
+        sink.close()
+        self.assertEqual(self._count(), 1)
+        ActivityLogSink(self.db_path).close()
+
+    def test_close_drains_queue(self):
+        """Test that close() writes rows still in the queue"""
+        sink = ActivityLogSink(self.db_path, flush_interval=10, batch_size=1000)
+        for i in range(10):
+            sink.submit(("client_a", "SYSTEM", f"message {i}", "{}"))
+        sink.close()
+        self.assertEqual(self._count(), 10)
+        self.assertFalse(sink.submit(("client_a", "SYSTEM", "late", "{}")))
+
+    def test_drop_oldest_policy(self):
+        """Test that a full queue evicts the oldest rows"""
+        sink = ActivityLogSink(self.db_path, flush_interval=10, batch_size=1000, max_queue=5)
+        with sink._cond:
+            for i in range(8):
+                sink.submit(("client_a", "CONN", f"message {i}", "{}"))
+            queued = [row[2] for row in sink._queue]
+        self.assertEqual(queued, [f"message {i}" for i in range(3, 8)])
+        self.assertEqual(sink.stats["dropped"], 3)
+        sink.close()
+
+    def test_sample_policy(self):
+        """Test that the sample policy keeps one overflowing row in N"""
+        sink = ActivityLogSink(self.db_path, flush_interval=10, batch_size=1000, max_queue=2,
+                               overflow_policy="sample", sample_every=3)
+        with sink._cond:
+            accepted = [sink.submit(("client_a", "CONN", f"message {i}", "{}")) for i in range(8)]
+        self.assertEqual(accepted, [True, True, False, False, True, False, False, True])
+        sink.close()
+
+    def test_invalid_policy(self):
+        """Test that unknown overflow policies are rejected"""
+        with self.assertRaises(ValueError):
+            ActivityLogSink(self.db_path, overflow_policy="explode")
+
+
+class TestNotificationSink(unittest.TestCase):
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("""
+                CREATE TABLE notifications (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    client_id TEXT, message TEXT, notification_type TEXT, action_url TEXT
+                )
+            """)
+
+    def tearDown(self):
+        os.remove(self.db_path)
+
+    def _rows(self):
+        with sqlite3.connect(self.db_path) as conn:
+            return conn.execute(
+                "SELECT notification_type, message FROM notifications ORDER BY id"
+            ).fetchall()
+
+    def test_duplicate_burst_is_coalesced(self):
+        """Test that repeated notifications become one row with a count"""
+        sink = NotificationSink(self.db_path, flush_interval=10)
+        for _ in range(5):
+            sink.submit(("client_a", "Listener ready", "SYSTEM", ""))
+        sink.submit(("client_a", "PSK stored", "PSK_UPDATE", ""))
+        sink.flush()
+        self.assertEqual(self._rows(), [
+            ("SYSTEM", "Listener ready (x5)"),
+            ("PSK_UPDATE", "PSK stored"),
+        ])
+        self.assertEqual(sink.stats["coalesced"], 4)
+        sink.close()
+
+    def test_count_column_is_used_when_present(self):
+        """Test that the repeat count goes to a count column if the table has one"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("ALTER TABLE notifications ADD COLUMN count INTEGER DEFAULT 1")
+        sink = NotificationSink(self.db_path, flush_interval=10)
+        for _ in range(3):
+            sink.submit(("client_a", "Listener ready", "SYSTEM", ""))
+        sink.close()
+        with sqlite3.connect(self.db_path) as conn:
+            rows = conn.execute("SELECT message, count FROM notifications").fetchall()
+        self.assertEqual(rows, [("Listener ready", 3)])
+
+    def test_write_errors_do_not_raise(self):
+        """Test that a missing table never surfaces to the caller"""
+        os.remove(self.db_path)
+        sink = NotificationSink(self.db_path, flush_interval=10)
+        self.assertTrue(sink.submit(("client_a", "hello", "SYSTEM", "")))
+        sink.flush()
+        self.assertEqual(sink.stats["failed"], 1)
+        sink.close()
+
+    def test_block_policy_is_rejected(self):
+        """Test that notifications cannot be configured to block callers"""
+        with self.assertRaises(ValueError):
+            NotificationSink(self.db_path, overflow_policy="block")
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,64 @@
+import unittest
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from unittest import mock
+from legosec.sdk.sdk import SecureChannelSDK
+
+
+class TestSDKConstruction(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, "kdc_database.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write_identity(self, client_id, expires_in):
+        path = os.path.join(self.tmp_dir, f".{client_id}_identity.json")
+        with open(path, "w") as f:
+            json.dump({"client_id": client_id, "client_name": "SecureClient", "encrypted_secret": "00",
+                       "expires_at": (datetime.now() + timedelta(seconds=expires_in)).isoformat()}, f)
+        return path
+
+    def test_lazy_construction_does_no_io(self):
+        """Test that a lazy SDK creates no database file, log rows or threads until used"""
+        threads = threading.active_count()
+        sdk = SecureChannelSDK(identity_dir=self.tmp_dir, db_path=self.db_path, lazy=True)
+        self.assertFalse(os.path.exists(self.db_path))
+        self.assertEqual(threading.active_count(), threads)
+        self.assertEqual(sdk._log_sink.stats["submitted"], 0)
+
+        # The first operation that needs the database sets up the schema
+        sdk.generate_and_distribute_shared_psk("client_peer")
+        self.assertEqual(sdk.receive_shared_psk("client_peer", timeout=1), sdk.psk_cache.get(sdk.client_id, "client_peer"))
+        sdk.close()
+
+    def test_identity_file_is_parsed_once(self):
+        """Test that a valid identity found by the directory scan is not read again"""
+        self._write_identity("client_00aa11bb", 3600)
+        with mock.patch("legosec.sdk.sdk.json.load", wraps=json.load) as load:
+            sdk = SecureChannelSDK(identity_dir=self.tmp_dir, db_path=self.db_path)
+        self.assertEqual(sdk.client_id, "client_00aa11bb")
+        self.assertEqual(load.call_count, 1)
+        sdk.close()
+
+    def test_expired_identity_is_removed(self):
+        """Test that an expired identity passed by client_id is removed eagerly but left alone when lazy"""
+        path = self._write_identity("client_00cc22dd", -60)
+        sdk = SecureChannelSDK(client_id="client_00cc22dd", identity_dir=self.tmp_dir,
+                               db_path=self.db_path, lazy=True)
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(sdk.identity_manager.check_identity_expiration(), "expired")
+        sdk.close()
+
+        sdk = SecureChannelSDK(client_id="client_00cc22dd", identity_dir=self.tmp_dir, db_path=self.db_path)
+        self.assertFalse(os.path.exists(path))
+        sdk.close()
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
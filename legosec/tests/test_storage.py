@@ -0,0 +1,84 @@
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+from legosec.storage.database import Database, get_database, SCHEMA_VERSION
+
+
+class TestDatabase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, "kdc_database.db")
+        self.db = get_database(self.db_path)
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_schema_bootstrap(self):
+        """Test that the schema is created and versioned once"""
+        self.assertEqual(self.db.fetchone("PRAGMA user_version")[0], SCHEMA_VERSION)
+        tables = {row[0] for row in self.db.fetchall("SELECT name FROM sqlite_master WHERE type='table'")}
+        self.assertTrue({"clients", "peer_status", "psk_exchange", "ecdh_sessions"} <= tables)
+        self.assertIs(get_database(self.db_path), self.db)
+
+    def test_lazy_schema_on_first_connection(self):
+        """Test that a database fetched without its schema creates it with the first connection"""
+        lazy_path = os.path.join(self.tmp_dir, "lazy.db")
+        lazy = get_database(lazy_path, ensure_schema=False)
+        self.assertFalse(os.path.exists(lazy_path))
+        self.assertIsNone(lazy.fetchone("SELECT 1 FROM peer_status"))
+        self.assertEqual(lazy.fetchone("PRAGMA user_version")[0], SCHEMA_VERSION)
+        lazy.close()
+
+    def test_wal_mode(self):
+        """Test that connections run in WAL mode"""
+        self.assertEqual(self.db.fetchone("PRAGMA journal_mode")[0], "wal")
+
+    def test_connection_per_thread(self):
+        """Test that each thread reuses its own persistent connection"""
+        self.assertIs(self.db.connection(), self.db.connection())
+        other = []
+        thread = threading.Thread(target=lambda: other.append(self.db.connection()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other[0], self.db.connection())
+
+    def test_connection_closed_when_thread_exits(self):
+        """Test that short-lived threads do not leave their connections open"""
+        self.db.connection()
+        threads = [threading.Thread(target=self.db.fetchone, args=("SELECT 1",)) for _ in range(50)]
+        for thread in threads:
+            thread.start()
+            thread.join()
+        self.assertEqual(len(self.db._connections), 1)
+        if os.path.isdir("/proc/self/fd"):
+            fds = len(os.listdir("/proc/self/fd"))
+            for _ in range(50):
+                thread = threading.Thread(target=self.db.fetchone, args=("SELECT 1",))
+                thread.start()
+                thread.join()
+            self.assertLessEqual(len(os.listdir("/proc/self/fd")), fds)
+
+    def test_transaction_rollback(self):
+        """Test that a failed transaction leaves no partial writes"""
+        with self.assertRaises(RuntimeError):
+            with self.db.transaction() as conn:
+                conn.execute("INSERT INTO peer_status (client_id, is_ready) VALUES ('a', 1)")
+                raise RuntimeError("abort")
+        self.assertIsNone(self.db.fetchone("SELECT 1 FROM peer_status WHERE client_id = 'a'"))
+
+    def test_existing_database_is_migrated(self):
+        """Test that a pre-versioned database is upgraded in place"""
+        legacy_path = os.path.join(self.tmp_dir, "legacy.db")
+        legacy = Database(legacy_path)
+        legacy.execute("CREATE TABLE clients (client_id TEXT PRIMARY KEY, client_name TEXT NOT NULL, "
+                       "secret_id BLOB NOT NULL, authorized_peers TEXT, expires_at TIMESTAMP NOT NULL)")
+        legacy.ensure_schema()
+        self.assertEqual(legacy.fetchone("PRAGMA user_version")[0], SCHEMA_VERSION)
+        legacy.close()
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
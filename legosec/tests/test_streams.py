@@ -0,0 +1,113 @@
+import unittest
+import io
+import os
+import socket
+import tempfile
+import threading
+from OpenSSL.SSL import Context, Connection, TLSv1_2_METHOD
+from legosec.sdk.sdk import EncryptedSocket
+from legosec.sdk.streams import send_stream, recv_stream, is_stream_start
+
+
+class TestEncryptedSocketStreams(unittest.TestCase):
+    def setUp(self):
+        key = os.urandom(32)
+        left, right = socket.socketpair()
+        self.sender = EncryptedSocket(left, key, initiator=True)
+        self.receiver = EncryptedSocket(right, key, initiator=False)
+
+    def tearDown(self):
+        self.sender.close()
+        self.receiver.close()
+
+    def _transfer(self, source, **kwargs):
+        sink = io.BytesIO()
+        result = {}
+        thread = threading.Thread(target=lambda: result.update(self.receiver.recv_stream(sink)))
+        thread.start()
+        summary = self.sender.send_stream(source, **kwargs)
+        thread.join()
+        self.assertEqual(summary["sha256"], result["sha256"])
+        return sink.getvalue(), summary
+
+    def test_regular_file(self):
+        """Test that a regular file is streamed through mmap intact"""
+        payload = os.urandom(1024 * 1024 + 13)
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(payload)
+            f.flush()
+            received, summary = self._transfer(f.name, chunk_size=64 * 1024)
+        self.assertEqual(received, payload)
+        self.assertEqual(summary["chunks"], 17)
+
+    def test_iterable_source_and_progress(self):
+        """Test that iterables are re-chunked and progress is reported"""
+        calls = []
+        chunks = [os.urandom(1000) for _ in range(10)]
+        received, _ = self._transfer(iter(chunks), chunk_size=4096,
+                                     progress=lambda done, total, elapsed: calls.append((done, total)))
+        self.assertEqual(received, b"".join(chunks))
+        self.assertEqual(calls[-1], (10000, None))
+
+    def test_bytes_source(self):
+        """Test that in-memory bytes report their total size"""
+        calls = []
+        received, _ = self._transfer(b"x" * 10000, chunk_size=4096,
+                                     progress=lambda done, total, elapsed: calls.append(total))
+        self.assertEqual(received, b"x" * 10000)
+        self.assertEqual(set(calls), {10000})
+
+    def test_stream_start_is_detected(self):
+        """Test that a listener can tell a stream from a plain message"""
+        self.sender.send_stream(b"")
+        first = self.receiver.recv_message()
+        self.assertTrue(is_stream_start(first))
+        self.assertFalse(is_stream_start(b"Hello from A"))
+        self.assertEqual(recv_stream(self.receiver, io.BytesIO(), first=first)["bytes"], 0)
+
+
+class TestPSKStreams(unittest.TestCase):
+    def setUp(self):
+        left, right = socket.socketpair()
+        server_ctx = Context(TLSv1_2_METHOD)
+        server_ctx.set_cipher_list(b'PSK')
+        server_ctx.set_psk_server_callback(lambda conn, identity: b"k" * 32)
+        client_ctx = Context(TLSv1_2_METHOD)
+        client_ctx.set_cipher_list(b'PSK')
+        client_ctx.set_psk_client_callback(lambda conn, hint: (b"client_a", b"k" * 32))
+
+        self.server = Connection(server_ctx, right)
+        self.server.set_accept_state()
+        self.client = Connection(client_ctx, left)
+        self.client.set_connect_state()
+        thread = threading.Thread(target=self.server.do_handshake)
+        thread.start()
+        self.client.do_handshake()
+        thread.join()
+
+    def tearDown(self):
+        self.client.close()
+        self.server.close()
+
+    def test_stream_over_tls(self):
+        """Test that streams work over a TLS-PSK connection"""
+        payload = os.urandom(700 * 1024)
+        sink = io.BytesIO()
+        thread = threading.Thread(target=recv_stream, args=(self.server, sink))
+        thread.start()
+        send_stream(self.client, payload, chunk_size=100 * 1024)
+        thread.join()
+        self.assertEqual(sink.getvalue(), payload)
+
+    def test_first_read_detects_stream(self):
+        """Test that the first TLS read of a stream carries the whole start frame"""
+        send_stream(self.client, b"abc")
+        first = self.server.recv(1024)
+        self.assertTrue(is_stream_start(first))
+        sink = io.BytesIO()
+        recv_stream(self.server, sink, first=first)
+        self.assertEqual(sink.getvalue(), b"abc")
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
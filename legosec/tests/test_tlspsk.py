@@ -0,0 +1,69 @@
+import unittest
+import socket
+import threading
+from legosec.sdk.tlspsk import PSKContexts
+from legosec.sdk.streams import _tls_call, _tls_sendall
+from OpenSSL.SSL import Connection
+
+PSKS = {"peer-a": b"a" * 32, "peer-b": b"b" * 32}
+
+
+class _App:
+    def __init__(self, peer_id=None):
+        self.peer_id = peer_id
+
+    def get_app_data(self):
+        return self.peer_id
+
+    def set_app_data(self, peer_id):
+        self.peer_id = peer_id
+
+
+class TestPSKContexts(unittest.TestCase):
+    def setUp(self):
+        self.contexts = PSKContexts("client-x", PSKS.get, self._verify_peer)
+
+    def _verify_peer(self, conn, identity):
+        conn.set_app_data(identity.decode())
+        return PSKS.get(identity.decode())
+
+    def test_contexts_are_built_once(self):
+        """Test that every connection gets the same client and server context"""
+        self.assertIs(self.contexts.client(), self.contexts.client())
+        self.assertIs(self.contexts.server(), self.contexts.server())
+        self.assertEqual(self.contexts.stats["built"], 2)
+
+    def test_client_callback_looks_up_peer(self):
+        """Test that the shared client callback picks the PSK of the connection's peer"""
+        self.assertEqual(self.contexts._client_callback(_App("peer-a"), b""), (b"client-x", PSKS["peer-a"]))
+        self.assertEqual(self.contexts._client_callback(_App("peer-b"), b""), (b"client-x", PSKS["peer-b"]))
+        with self.assertRaises(ValueError):
+            self.contexts._client_callback(_App("peer-c"), b"")
+        with self.assertRaises(ValueError):
+            self.contexts._client_callback(_App(), b"")
+
+    def test_handshakes_share_contexts(self):
+        """Test that several TLS-PSK handshakes succeed over the same pair of contexts"""
+        server_side = PSKContexts("peer-a", PSKS.get, self._verify_peer)
+        client_side = PSKContexts("peer-a", PSKS.get, self._verify_peer)
+        for _ in range(3):
+            left, right = socket.socketpair()
+            server = Connection(server_side.server(), right)
+            server.set_accept_state()
+            client = Connection(client_side.client(), left)
+            client.set_app_data("peer-a")
+            client.set_connect_state()
+            thread = threading.Thread(target=server.do_handshake)
+            thread.start()
+            client.do_handshake()
+            thread.join()
+            _tls_sendall(client, b"ping")
+            self.assertEqual(_tls_call(server, server.recv, 16), b"ping")
+            self.assertEqual(server.get_app_data(), "peer-a")
+            client.close()
+            server.close()
+        self.assertEqual(server_side.stats["built"] + client_side.stats["built"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,242 @@
+import unittest
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from legosec.sdk import wire
+from legosec.sdk.keypool import EphemeralKeyPool, generate_ephemeral_key
+from legosec.sdk.listener import ThreadedPeerListener
+from legosec.sdk.readiness import get_peer_readiness
+from legosec.sdk.resumption import SessionTicketStore, RESUME_MAGIC
+from legosec.sdk.sdk import SecureChannelSDK, EncryptedSocket, _peek_header
+from legosec.storage.database import get_database
+
+
+class TestWireFormat(unittest.TestCase):
+    def test_dispatch(self):
+        """Test that the fixed-size header alone picks the connection type"""
+        _, pem, point = generate_ephemeral_key()
+        hello = wire.client_hello(point, "client-a")
+        self.assertEqual(wire.connection_type(hello[:wire.HEADER_SIZE]), wire.ECDH_V2)
+        self.assertEqual(wire.connection_type(pem[:wire.HEADER_SIZE]), wire.ECDH_V1)
+        self.assertEqual(wire.connection_type(RESUME_MAGIC[:wire.HEADER_SIZE]), wire.RESUME)
+        self.assertEqual(wire.connection_type(b"\x16\x03\x01\x00"), wire.PSK)
+        # Future versions and types are not mistaken for v2
+        self.assertEqual(wire.connection_type(wire.HEADER.pack(wire.MAGIC, 3, wire.TYPE_ECDH)), wire.PSK)
+
+    def test_peek_split_header(self):
+        """Test that a header split across segments is waited for and left unread, and a stalled one times out"""
+        server = socket.socket()
+        server.bind(("127.0.0.1", 0))
+        server.listen(1)
+        client = socket.create_connection(server.getsockname(), timeout=5)
+        conn, _ = server.accept()
+        header = wire.HEADER.pack(wire.MAGIC, wire.VERSION, wire.TYPE_ECDH)
+        try:
+            client.sendall(header[:2])
+            self.assertLess(len(_peek_header(conn, timeout=0.1)), wire.HEADER_SIZE)
+
+            sender = threading.Timer(0.1, client.sendall, (header[2:],))
+            sender.start()
+            start = time.monotonic()
+            self.assertEqual(_peek_header(conn), header)
+            self.assertLess(time.monotonic() - start, 5)
+            sender.join()
+            self.assertEqual(conn.recv(wire.HEADER_SIZE), header)
+        finally:
+            client.close()
+            conn.close()
+            server.close()
+
+    def test_hello_is_compact(self):
+        """Test that the v2 hello is smaller than the v1 PEM key alone"""
+        _, pem, point = generate_ephemeral_key()
+        hello = wire.client_hello(point, "client-a")
+        self.assertEqual(len(point), 49)
+        self.assertLess(len(hello), len(pem) // 2)
+
+        prefix = hello[:wire.HELLO_PREFIX_SIZE]
+        body_size = wire.hello_body_size(prefix)
+        body = hello[wire.HELLO_PREFIX_SIZE:wire.HELLO_PREFIX_SIZE + body_size]
+        client_id = hello[wire.HELLO_PREFIX_SIZE + body_size:]
+        self.assertEqual(wire.parse_hello(prefix, body, client_id), (wire.CURVE_P384, point, "client-a"))
+
+    def test_both_sides_derive_the_same_key(self):
+        """Test that v2 session keys agree"""
+        client, _, client_point = generate_ephemeral_key()
+        server, _, server_point = generate_ephemeral_key()
+        self.assertEqual(wire.session_key(client, server_point), wire.session_key(server, client_point))
+
+    def test_unknown_curve_is_refused(self):
+        """Test that an unsupported curve id is rejected before reading the point"""
+        with self.assertRaises(ValueError):
+            wire.hello_body_size(wire.HEADER.pack(wire.MAGIC, wire.VERSION, wire.TYPE_ECDH) + b"\x09")
+
+    def test_reply_prefix(self):
+        """Test that refusals and non-v2 answers are told apart"""
+        self.assertEqual(wire.check_reply_prefix(wire.reply(b"p" * 49)[:wire.REPLY_PREFIX_SIZE]), 49)
+        with self.assertRaises(PermissionError):
+            wire.check_reply_prefix(wire.reply())
+        with self.assertRaises(wire.ProtocolMismatch):
+            wire.check_reply_prefix(b"")
+        with self.assertRaises(wire.ProtocolMismatch):
+            wire.check_reply_prefix(b"\x15\x03\x01\x00\x02")
+
+
+class _HandshakeSDK:
+    """The SDK surface both handshake sides use, without identity files or a KDC"""
+    _CONNECTION_HANDLERS = SecureChannelSDK._CONNECTION_HANDLERS
+    _handle_incoming_connection = SecureChannelSDK._handle_incoming_connection
+    _handle_ecdh_v2_connection = SecureChannelSDK._handle_ecdh_v2_connection
+    _ecdh_v2_respond = SecureChannelSDK._ecdh_v2_respond
+    _ecdh_initiate_v2 = SecureChannelSDK._ecdh_initiate_v2
+    _handle_secure_connection = SecureChannelSDK._handle_secure_connection
+    _serve_secure_messages = SecureChannelSDK._serve_secure_messages
+    _close_secure_session = SecureChannelSDK._close_secure_session
+    _peer_message_response = SecureChannelSDK._peer_message_response
+
+    def __init__(self, client_id, db_path):
+        self.client_id = client_id
+        self.session_keys = {}
+        self.session_tickets = SessionTicketStore(get_database(db_path), client_id)
+        self.ecdh_key_pool = EphemeralKeyPool(depth=2, low_water=0)
+        self.identity_manager = self
+
+    def is_peer_authorized(self, peer_id):
+        return peer_id == "client-a"
+
+    def _handle_psk_connection(self, conn, park=None):
+        conn.close()
+
+    def _log_activity(self, *args, **kwargs):
+        pass
+
+    def _update_peer_status(self, ready=True):
+        pass
+
+    def _send_notification(self, *args):
+        pass
+
+
+class _ConnectingSDK(_HandshakeSDK):
+    """Adds connect_to_peer, always doing a full handshake and never falling back to PSK"""
+    connect_to_peer = SecureChannelSDK.connect_to_peer
+    wait_for_peer_ready = SecureChannelSDK.wait_for_peer_ready
+    _ecdh_initiate_v1 = SecureChannelSDK._ecdh_initiate_v1
+    wire_protocol = wire.VERSION
+
+    def __init__(self, client_id, db_path):
+        super().__init__(client_id, db_path)
+        self.peer_readiness = get_peer_readiness(get_database(db_path))
+        self._peer_wire_versions = {}
+
+    def _resume_session(self, peer_id, host, port):
+        return None
+
+    def _connect_with_psk(self, peer_id, host, port):
+        raise ConnectionError("ECDH handshake failed")
+
+
+class TestHandshakeV2(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, "kdc_database.db")
+        self.listener_sdk = _HandshakeSDK("listener-id", self.db_path)
+        self.client = _ConnectingSDK("client-a", self.db_path)
+        self.listener = ThreadedPeerListener(self.listener_sdk, port=0, host="127.0.0.1", workers=2).start()
+
+    def tearDown(self):
+        self.listener.stop()
+        self.listener_sdk.ecdh_key_pool.close()
+        self.client.ecdh_key_pool.close()
+        get_database(self.db_path).close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_threaded_listener_v2(self):
+        """Test a v2 handshake and message exchange against the threaded listener"""
+        sock = socket.create_connection(("127.0.0.1", self.listener.port), timeout=5)
+        session_key = self.client._ecdh_initiate_v2(sock)
+        conn = EncryptedSocket(sock, session_key)
+        conn.send(b"Hello")
+        self.assertEqual(conn.recv_message(), b"ACK from listen...")
+        conn.close()
+        self.assertEqual(self.listener_sdk.session_keys["client-a"], session_key)
+
+    def test_concurrent_connects(self):
+        """Test that concurrent connect_to_peer calls on one SDK each keep their own ECDH key"""
+        get_peer_readiness(get_database(self.db_path)).announce("listener-id")
+        start = threading.Barrier(16)
+        errors = []
+
+        def connect():
+            try:
+                start.wait()
+                conn = self.client.connect_to_peer("listener-id", port=self.listener.port, max_attempts=1)
+                conn.send(b"Hello")
+                self.assertEqual(conn.recv_message(), b"ACK from listen...")
+                conn.close()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=connect) for _ in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_failed_handshake_closes_socket(self):
+        """Test that the sockets of a failed ECDH attempt, v1 retry included, are closed before the PSK fallback"""
+        server = socket.socket()
+        server.bind(("127.0.0.1", 0))
+        server.listen(2)
+        get_peer_readiness(get_database(self.db_path)).announce("listener-id")
+        accepted = []
+
+        def broken_listener():
+            conn, _ = server.accept()
+            conn.close()
+            conn, _ = server.accept()
+            conn.settimeout(5)
+            conn.recv(4096)
+            conn.sendall(b"not a key")
+            accepted.append(conn)
+
+        def fallback(peer_id, host, port):
+            thread.join()
+            # Anything but EOF means the client kept the v1 socket open
+            self.assertEqual(accepted[0].recv(4096), b"")
+            return "psk"
+
+        thread = threading.Thread(target=broken_listener)
+        thread.start()
+        self.client._connect_with_psk = fallback
+        self.assertEqual(self.client.connect_to_peer("listener-id", port=server.getsockname()[1], max_attempts=1), "psk")
+        accepted[0].close()
+        server.close()
+
+    def test_v1_only_listener_is_detected(self):
+        """Test that a listener that does not know v2 (treats it as PSK and closes) raises ProtocolMismatch"""
+        server = socket.socket()
+        server.bind(("127.0.0.1", 0))
+        server.listen(1)
+
+        def v1_listener():
+            conn, _ = server.accept()
+            conn.recv(4096)
+            conn.close()
+
+        thread = threading.Thread(target=v1_listener)
+        thread.start()
+        sock = socket.create_connection(server.getsockname(), timeout=5)
+        with self.assertRaises(wire.ProtocolMismatch):
+            self.client._ecdh_initiate_v2(sock)
+        sock.close()
+        thread.join()
+        server.close()
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)